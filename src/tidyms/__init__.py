@@ -22,6 +22,7 @@ from . import lcms
 from . import simulation
 from . import raw_data_utils
 from . import _mzml
+from . import _msbinary
 from . import _build_data_matrix
 from . import correspondence
 from . import fill_missing
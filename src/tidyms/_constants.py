@@ -22,7 +22,8 @@ MS_MODES: Final[List[str]] = [CENTROID, PROFILE]
 MEMORY: Final[str] = "memory"
 INFILE: Final[str] = "file"
 SIMULATED: Final[str] = "simulated"
-DATA_LOAD_MODES: Final[List[str]] = [MEMORY, INFILE, SIMULATED]
+BINARY: Final[str] = "binary"
+DATA_LOAD_MODES: Final[List[str]] = [MEMORY, INFILE, SIMULATED, BINARY]
 DEFAULT_DATA_LOAD_MODE = INFILE
 
 # feature descriptors
@@ -81,6 +82,8 @@ SAMPLE_TYPES: Final[list[str]] = [QC_TYPE, STUDY_TYPE, BLANK_TYPE, DQC_TYPE]
 # assay file and dir names
 ROI_DIR: Final[str] = "roi"
 FT_DIR: Final[str] = "feature"
+INDEX_DIR: Final[str] = "index"
+BINARY_DIR: Final[str] = "binary"
 MANAGER_FILENAME: Final[str] = "metadata.pickle"
 FT_TABLE_FILENAME: Final[str] = "feature-table.pickle"
 DATA_MATRIX_FILENAME: Final[str] = "data-matrix.pickle"
@@ -0,0 +1,272 @@
+"""
+Functions to store preprocessed MS data in a binary file that can be memory
+mapped.
+
+write_ms_binary : Stores arrays and metadata in a binary file.
+read_header : Reads the metadata stored in a binary file.
+MSBinaryReader : Reads spectra and chromatograms from a binary file.
+
+"""
+
+import json
+import numpy as np
+import struct
+from os import getpid, replace
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+# Rationale for the implementation:
+# Decoding base64 and zlib data from mzML files is the dominant cost when the
+# raw data is processed several times, e.g. to test different parameters. Raw
+# data is stored once in a binary file with the concatenated m/z and intensity
+# arrays of all spectra, an offset array with the location of each spectrum
+# and the scan table.
+# The file starts with a magic string, the size of a JSON header and the
+# header. The header contains the dtype, shape and offset of each array,
+# relative to the start of the data section. Arrays are aligned to 64 bytes
+# and are accessed using np.memmap, so reading a spectrum is a slice of the
+# mapped file.
+
+BINARY_SUFFIX = ".tidyms-msdata"
+_MAGIC = b"TIDYMSB\x00"
+_HEADER_SIZE_FORMAT = "<Q"
+_BINARY_VERSION = 1
+_ALIGNMENT = 64
+
+
+class MSBinaryReader:
+    """
+    Reads spectra and chromatograms from a binary file created with
+    write_ms_binary.
+
+    The file is memory mapped the first time that data is requested. The
+    arrays returned are read-only views of the mapped file. The reader can be
+    used as a context manager.
+
+    Parameters
+    ----------
+    path : Path
+        Path to a binary file.
+
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.header, self._data_start = read_header(self.path)
+        self._arrays = None
+        self.chromatogram_names = self.header["chromatogram_names"]
+        self.n_chromatograms = len(self.chromatogram_names)
+        self.n_spectra = self.header["arrays"]["time"]["shape"][0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        # memory maps are copied when pickled. The file is mapped again after
+        # unpickling, e.g. when the reader is sent to a worker process.
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    @property
+    def closed(self) -> bool:
+        return self._arrays is None
+
+    def close(self):
+        """
+        Removes the references to the mapped file. The file is mapped again
+        if more data is requested.
+
+        """
+        self._arrays = None
+
+    @property
+    def has_scan_table(self) -> bool:
+        return True
+
+    def get_scan_table(self) -> Dict[str, np.ndarray]:
+        """
+        Gets the table with the metadata of each spectrum.
+
+        Returns
+        -------
+        dict
+            Maps each column of the scan table to an array with one element
+            per spectrum.
+
+        """
+        arrays = self._get_arrays()
+        return {x: arrays[x] for x in self.header["scan_table_columns"]}
+
+    def get_spectrum(self, index: int) -> dict:
+        arrays = self._get_arrays()
+        start, end = arrays["spectra_offset"][index:index + 2]
+        spectrum = {
+            "mz": arrays["mz"][start:end],
+            "spint": arrays["spint"][start:end],
+            "ms_level": int(arrays["ms_level"][index]),
+        }
+        time = arrays["time"][index]
+        if not np.isnan(time):
+            spectrum["time"] = float(time)
+        polarity = arrays["polarity"][index]
+        if polarity:
+            spectrum["polarity"] = int(polarity)
+        return spectrum
+
+    def get_chromatogram(self, index: int) -> dict:
+        arrays = self._get_arrays()
+        start, end = arrays["chromatogram_offset"][index:index + 2]
+        chromatogram = {
+            "name": self.chromatogram_names[index],
+            "time": arrays["chromatogram_time"][start:end],
+            "spint": arrays["chromatogram_spint"][start:end],
+        }
+        return chromatogram
+
+    def _get_arrays(self) -> Dict[str, np.ndarray]:
+        if self._arrays is None:
+            self._arrays = dict()
+            for name, params in self.header["arrays"].items():
+                dtype = np.dtype(params["dtype"])
+                shape = tuple(params["shape"])
+                if np.prod(shape) == 0:
+                    # empty files cannot be memory mapped
+                    array = np.empty(shape, dtype=dtype)
+                else:
+                    array = np.memmap(
+                        self.path,
+                        dtype=dtype,
+                        mode="r",
+                        offset=self._data_start + params["offset"],
+                        shape=shape,
+                    )
+                self._arrays[name] = array
+        return self._arrays
+
+
+def write_ms_binary(
+    path: Union[str, Path],
+    arrays: Dict[str, np.ndarray],
+    metadata: Dict
+):
+    """
+    Stores arrays and metadata in a binary file.
+
+    Parameters
+    ----------
+    path : Path
+        path to the binary file.
+    arrays : dict
+        Maps names to arrays. Each array is stored in C order.
+    metadata : dict
+        JSON serializable metadata stored in the header.
+
+    """
+    path = Path(path)
+    header = dict(metadata)
+    header["version"] = _BINARY_VERSION
+    header["arrays"] = dict()
+    offset = 0
+    contiguous = dict()
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        contiguous[name] = array
+        header["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode()
+    data_start = _align(
+        len(_MAGIC) + struct.calcsize(_HEADER_SIZE_FORMAT) + len(header_bytes)
+    )
+
+    # the file is written to a temporary file and then renamed, to prevent
+    # reading incomplete files if several processes use the same file.
+    tmp_path = path.with_name("{}.{}.tmp".format(path.name, getpid()))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(tmp_path, "wb") as fout:
+            fout.write(_MAGIC)
+            fout.write(struct.pack(_HEADER_SIZE_FORMAT, len(header_bytes)))
+            fout.write(header_bytes)
+            for name, array in contiguous.items():
+                fout.seek(data_start + header["arrays"][name]["offset"])
+                fout.write(array.data)
+        replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def read_header(path: Union[str, Path]) -> Tuple[Dict, int]:
+    """
+    Reads the metadata stored in a binary file.
+
+    Parameters
+    ----------
+    path : Path
+
+    Returns
+    -------
+    header : dict
+    data_start : int
+        Offset of the data section of the file.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a binary file created with write_ms_binary or was
+        created with a different version.
+
+    """
+    size_length = struct.calcsize(_HEADER_SIZE_FORMAT)
+    with open(path, "rb") as fin:
+        magic = fin.read(len(_MAGIC))
+        if magic != _MAGIC:
+            msg = "{} is not a valid binary MS data file.".format(path)
+            raise ValueError(msg)
+        header_size = struct.unpack(_HEADER_SIZE_FORMAT, fin.read(size_length))[0]
+        header = json.loads(fin.read(header_size).decode())
+    if header.get("version") != _BINARY_VERSION:
+        msg = "{} was created with a different version.".format(path)
+        raise ValueError(msg)
+    data_start = _align(len(_MAGIC) + size_length + header_size)
+    return header, data_start
+
+
+def load_source_key(path: Union[str, Path]) -> Optional[Dict]:
+    """
+    Gets the key of the file used to create a binary file. Returns ``None``
+    if the binary file does not exist or is not valid.
+
+    """
+    try:
+        header, _ = read_header(path)
+    except (OSError, ValueError):
+        return None
+    return header.get("source")
+
+
+def get_binary_path(
+    filename: Union[str, Path],
+    binary_dir: Optional[Union[str, Path]] = None
+) -> Path:
+    """
+    Gets the path of the binary file created from a raw data file. If
+    `binary_dir` is ``None``, the binary file is located next to the raw data
+    file.
+
+    """
+    filename = Path(filename)
+    binary_dir = filename.parent if binary_dir is None else Path(binary_dir)
+    return binary_dir.joinpath(filename.name + BINARY_SUFFIX)
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
@@ -10,15 +10,20 @@ get_chromatogram : Extracts data from a chromatogram using offsets.
 """
 
 import base64
+import binascii
+import hashlib
+import mmap
 import numpy as np
 import re
 import zlib
-from os import SEEK_END
+from os import SEEK_END, getpid, replace, stat
 from os.path import getsize
 from pathlib import Path
-from typing import Dict, List, Tuple
+from joblib import Parallel, delayed, effective_n_jobs
+from typing import Dict, List, Optional, Tuple, Union
 from xml.etree.ElementTree import fromstring
 from xml.etree.ElementTree import Element
+from . import _numpress
 
 # Rationale for the implementation:
 # mzML files can have typical sizes that span from 50 MiB to more than 1000 MiB.
@@ -46,17 +51,26 @@ from xml.etree.ElementTree import Element
 # terms defined here:
 # https://raw.githubusercontent.com/HUPO-PSI/psi-ms-CV/master/psi-ms.obo
 UNSUPPORTED_COMPRESSION = {
-    "MS:1002312",
-    "MS:1002313",
-    "MS:1002314",
-    "MS:1002746",
-    "MS:1002747",
-    "MS:1002748",
     "MS:1003088",
     "MS:1003089",
-    "MS:1003090",
 }
 ZLIB = "MS:1000574"
+# truncation of the least significant bits does not require decoding
+TRUNCATION_ZLIB = "MS:1003090"
+# maps MS-Numpress accessions to the numpress method and zlib compression
+NUMPRESS = {
+    "MS:1002312": ("linear", False),
+    "MS:1002313": ("pic", False),
+    "MS:1002314": ("slof", False),
+    "MS:1002746": ("linear", True),
+    "MS:1002747": ("pic", True),
+    "MS:1002748": ("slof", True),
+}
+NUMPRESS_DECODERS = {
+    "linear": _numpress.decode_linear,
+    "pic": _numpress.decode_pic,
+    "slof": _numpress.decode_slof,
+}
 MZ_ARRAY = "MS:1000514"
 INT_ARRAY = "MS:1000515"
 TIME_ARRAY = "MS:1000595"
@@ -82,12 +96,106 @@ DATA_TYPES = {
     INT64: np.int64,
 }
 
+# minimum size of the reads performed by MZMLReader, in bytes
+DEFAULT_CHUNK_SIZE = 2 ** 20
+
+# sidecar files with offsets and the scan table
+INDEX_CACHE_SUFFIX = ".tidyms-index.npz"
+SCAN_TABLE_COLUMNS = ["time", "ms_level", "polarity", "tic", "bpi", "size"]
+_INDEX_CACHE_ARRAYS = ["spectra_offset", "chromatogram_offset", "index_offset"]
+_INDEX_CACHE_VERSION = 2
+# size of the data at the beginning and end of the file used to compute
+# the hash, in bytes
+_INDEX_CACHE_HASH_SIZE = 2 ** 16
+# size of the reads used to build the index of non-indexed files, in bytes
+_SCAN_CHUNK_SIZE = 2 ** 24
+# minimum size of the file ranges scanned in parallel, in bytes
+_MIN_SCAN_RANGE_SIZE = 2 ** 26
+
+# patterns used to parse spectrum metadata without building an ElementTree
+_CV_PARAM_REGEX = re.compile(rb"<cvParam\s([^>]*)>")
+_ACCESSION_REGEX = re.compile(rb'<cvParam\s[^>]*?accession="([^"]*)"')
+_MS_LEVEL_REGEX = re.compile(
+    rb'<cvParam\s([^>]*?accession="' + MS_LEVEL.encode() + rb'"[^>]*)>'
+)
+_TIME_REGEX = re.compile(
+    rb'<cvParam\s([^>]*?accession="' + TIME.encode() + rb'"[^>]*)>'
+)
+_NEGATIVE_POLARITY_ATTRIBUTE = b'accession="' + NEGATIVE_POLARITY.encode() + b'"'
+_POSITIVE_POLARITY_ATTRIBUTE = b'accession="' + POSITIVE_POLARITY.encode() + b'"'
+_ATTRIBUTE_REGEX = re.compile(r'([\w:]+)="([^"]*)"')
+_ARRAY_LENGTH_REGEX = re.compile(rb'(?:defaultArrayLength|arrayLength)="(\d+)"')
+# comments, CDATA sections, entities and single quoted attributes are parsed
+# with ElementTree
+_UNUSUAL_XML_REGEX = re.compile(rb"<!--|<!\[CDATA\[|&|='")
+
 
 class MZMLReader:
+    """
+    Reads spectra and chromatograms from a mzML file.
+
+    The file is opened in binary mode the first time that data is requested
+    and the handle is kept open until ``close`` is called. Data is read in
+    chunks of ``chunk_size`` bytes, so iterating over consecutive spectra
+    results in large sequential reads instead of one read per spectrum.
+    The reader can be used as a context manager.
+
+    If ``use_mmap`` is ``True``, the file is memory mapped instead. The
+    encoded arrays are decoded directly from the mapped file and only the
+    metadata is parsed as xml. In this mode, the arrays returned are
+    read-only.
+
+    Parameters
+    ----------
+    path : Path
+        Path to a mzML file.
+    chunk_size : int, default=1048576
+        Minimum number of bytes read from the file on each read operation.
+    use_mmap : bool, default=False
+        If ``True``, access the file using a memory map.
+    n_jobs : int or None, default=None
+        Number of jobs used to build the offsets of non-indexed files.
+    index_cache_dir : str, Path or None, default=None
+        If provided, the offsets and the scan table are stored in a sidecar
+        file inside this directory. The sidecar is reused while the size,
+        modification time and hash of the mzML file remain unchanged.
+
+    """
 
-    def __init__(self, path: Path):
+    def __init__(
+        self,
+        path: Path,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        use_mmap: bool = False,
+        n_jobs: Optional[int] = None,
+        index_cache_dir: Optional[Union[str, Path]] = None
+    ):
         self.path = path
-        sp_offset, chrom_offset, index_offset = build_offset_list(path)
+        self.chunk_size = chunk_size
+        self.use_mmap = use_mmap
+
+        self._file = None
+        self._mmap = None
+        self._chunk = b""
+        self._chunk_offset = 0
+        self._scan_table = None
+
+        index = None
+        if index_cache_dir is not None:
+            cache_path = get_index_cache_path(path, index_cache_dir)
+            file_key = _get_file_key(path)
+            index = load_index_cache(cache_path, file_key)
+
+        if index is None:
+            sp_offset, chrom_offset, index_offset = build_offset_list(
+                path, n_jobs
+            )
+        else:
+            sp_offset = index["spectra_offset"].tolist()
+            chrom_offset = index["chromatogram_offset"].tolist()
+            index_offset = int(index["index_offset"])
+            self._scan_table = {x: index[x] for x in SCAN_TABLE_COLUMNS}
+
         self.spectra_offset = sp_offset
         self.chromatogram_offset = chrom_offset
         self.index_offset = index_offset
@@ -95,26 +203,212 @@ class MZMLReader:
         self.n_chromatograms = len(self.chromatogram_offset)
         self.n_spectra = len(self.spectra_offset)
 
+        if (index_cache_dir is not None) and (index is None):
+            index = {
+                "spectra_offset": np.array(sp_offset, dtype=int),
+                "chromatogram_offset": np.array(chrom_offset, dtype=int),
+                "index_offset": np.array(index_offset),
+            }
+            index.update(self.get_scan_table())
+            save_index_cache(cache_path, file_key, index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        # file handles cannot be pickled. A new handle is opened after
+        # unpickling, e.g. when the reader is sent to a worker process.
+        state = self.__dict__.copy()
+        state["_file"] = None
+        state["_mmap"] = None
+        state["_chunk"] = b""
+        state["_chunk_offset"] = 0
+        return state
+
+    @property
+    def closed(self) -> bool:
+        return self._file is None
+
+    def close(self):
+        """
+        Closes the file handle. The file is reopened if more data is requested.
+
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._mmap = None
+        self._chunk = b""
+        self._chunk_offset = 0
+
+    @property
+    def has_scan_table(self) -> bool:
+        return self._scan_table is not None
+
+    def get_scan_table(self) -> Dict[str, np.ndarray]:
+        """
+        Gets a table with the metadata of each spectrum.
+
+        The table is built in one pass over the file. Only the intensity array
+        of each spectrum is decoded. The result is computed once and stored in
+        the reader.
+
+        Returns
+        -------
+        dict
+            Maps each column to an array with one element per spectrum:
+
+            time
+                Acquisition time, in seconds. ``NaN`` if not available.
+            ms_level
+                MS level of the spectrum.
+            polarity
+                1 for positive, -1 for negative and 0 if not available.
+            tic
+                Sum of the spectrum intensity.
+            bpi
+                Maximum of the spectrum intensity.
+            size
+                Number of points in the spectrum.
+
+        """
+        if self._scan_table is None:
+            time = np.full(self.n_spectra, np.nan)
+            ms_level = np.ones(self.n_spectra, dtype=int)
+            polarity = np.zeros(self.n_spectra, dtype=int)
+            tic = np.zeros(self.n_spectra)
+            bpi = np.zeros(self.n_spectra)
+            size = np.zeros(self.n_spectra, dtype=int)
+            for k in range(self.n_spectra):
+                sp = self._get_spectrum(k, kinds=["spint"])
+                if sp.get("time") is not None:
+                    time[k] = sp["time"]
+                ms_level[k] = sp.get("ms_level", 1)
+                polarity[k] = sp.get("polarity", 0)
+                spint = sp.get("spint")
+                if (spint is not None) and spint.size:
+                    tic[k] = np.sum(spint)
+                    bpi[k] = np.max(spint)
+                    size[k] = spint.size
+            self._scan_table = {
+                "time": time,
+                "ms_level": ms_level,
+                "polarity": polarity,
+                "tic": tic,
+                "bpi": bpi,
+                "size": size,
+            }
+        return self._scan_table
+
     def get_spectrum(self, index: int) -> dict:
-        return get_spectrum(
-            self.path,
+        return self._get_spectrum(index)
+
+    def read_spectrum(self, index: int) -> Tuple[Union[bytes, mmap.mmap], int, int]:
+        """
+        Reads the encoded data of a spectrum, without parsing it.
+
+        Parameters
+        ----------
+        index : int
+            spectrum index.
+
+        Returns
+        -------
+        buffer : bytes or mmap
+            buffer with the spectrum element.
+        start : int
+            offset where the spectrum starts in the buffer.
+        end : int
+            offset where the spectrum ends in the buffer.
+
+        """
+        start, end = _get_data_range(
             self.spectra_offset,
             self.chromatogram_offset,
             self.index_offset,
-            index
+            index,
+            "spectrum"
         )
+        if self.use_mmap:
+            return self._get_mmap(), start, end
+        xml_str = self._read_element(start, end, b"</spectrum>")
+        return xml_str, 0, len(xml_str)
+
+    def parse_spectrum(
+        self,
+        data: Tuple[Union[bytes, mmap.mmap], int, int],
+        kinds: Optional[List[str]] = None
+    ) -> dict:
+        """
+        Extracts the data from a spectrum read with `read_spectrum`.
+
+        This method does not modify the reader state, so spectra can be parsed
+        in different threads. zlib and base64 decoding release the GIL.
+
+        """
+        buffer, start, end = data
+        return _parse_buffer(
+            buffer, start, end, "spectrum", copy=not self.use_mmap,
+            kinds=kinds
+        )
+
+    def _get_spectrum(
+        self, index: int, kinds: Optional[List[str]] = None
+    ) -> dict:
+        return self.parse_spectrum(self.read_spectrum(index), kinds)
 
     def get_chromatogram(self, index: int) -> dict:
-        return get_chromatogram(
-            self.path,
+        start, end = _get_data_range(
             self.spectra_offset,
             self.chromatogram_offset,
             self.index_offset,
-            index
+            index,
+            "chromatogram"
         )
+        if self.use_mmap:
+            return _parse_buffer(
+                self._get_mmap(), start, end, "chromatogram", copy=False
+            )
+        xml_str = self._read_element(start, end, b"</chromatogram>")
+        return _parse_buffer(xml_str, 0, len(xml_str), "chromatogram")
+
+    def _get_mmap(self) -> mmap.mmap:
+        if self._mmap is None:
+            if self._file is None:
+                self._file = open(self.path, "rb")
+            self._mmap = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        return self._mmap
 
+    def _read_element(self, start: int, end: int, end_tag: bytes) -> bytes:
+        """
+        Reads the bytes in the range [start, end) and trims the data after
+        `end_tag`.
 
-def build_offset_list(filename: Path) -> Tuple[list[int], list[int], int]:
+        """
+        chunk_end = self._chunk_offset + len(self._chunk)
+        if (start < self._chunk_offset) or (end > chunk_end):
+            if self._file is None:
+                self._file = open(self.path, "rb")
+            self._file.seek(start)
+            self._chunk = self._file.read(max(end - start, self.chunk_size))
+            self._chunk_offset = start
+        start -= self._chunk_offset
+        end -= self._chunk_offset
+        end = self._chunk.find(end_tag, start, end)
+        return self._chunk[start: end + len(end_tag)]
+
+
+def build_offset_list(
+    filename: Path,
+    n_jobs: Optional[int] = None
+) -> Tuple[list[int], list[int], int]:
     """
     Finds the offset values in the file where Spectrum or Chromatogram elements
     start.
@@ -122,6 +416,8 @@ def build_offset_list(filename: Path) -> Tuple[list[int], list[int], int]:
     Parameters
     ----------
     filename : path to a mzML file
+    n_jobs : int or None, default=None
+        Number of jobs used to build the offsets of non-indexed files.
 
     Returns
     -------
@@ -141,7 +437,7 @@ def build_offset_list(filename: Path) -> Tuple[list[int], list[int], int]:
         )
     else:
         spectra_offset, chromatogram_offset = _build_offset_list_non_indexed(
-            filename
+            filename, n_jobs
         )
         index_offset = getsize(filename)
     return spectra_offset, chromatogram_offset, index_offset
@@ -181,28 +477,7 @@ def get_spectrum(
         n,
         "spectrum"
     )
-    try:
-        elements = list(fromstring(xml_str))
-    except:
-        print("error", xml_str) 
-        raise "laskjf"
-    spectrum = dict()
-    for el in elements:
-        tag = el.tag
-        if tag == "cvParam":
-            accession = el.attrib.get("accession")
-            if accession == MS_LEVEL:
-                spectrum["ms_level"] = int(el.attrib.get("value"))
-            elif accession == NEGATIVE_POLARITY:
-                spectrum["polarity"] = -1
-            elif accession == POSITIVE_POLARITY:
-                spectrum["polarity"] = 1
-        elif tag == "scanList":
-            spectrum["time"] = _get_time(el)
-        elif tag == "binaryDataArrayList":
-            sp_data = _parse_binary_data_list(el)
-            spectrum.update(sp_data)
-    return spectrum
+    return _parse_buffer(xml_str, 0, len(xml_str), "spectrum")
 
 
 def get_chromatogram(
@@ -236,6 +511,41 @@ def get_chromatogram(
         n,
         "chromatogram"
     )
+    return _parse_chromatogram(xml_str)
+
+
+def _parse_spectrum(xml_str: bytes) -> Dict:
+    """
+    Extracts m/z, intensity, polarity , time, and ms level from the xml
+    string of a spectrum element using ElementTree.
+
+    """
+    elements = list(fromstring(xml_str))
+    spectrum = dict()
+    for el in elements:
+        tag = el.tag
+        if tag == "cvParam":
+            accession = el.attrib.get("accession")
+            if accession == MS_LEVEL:
+                spectrum["ms_level"] = int(el.attrib.get("value"))
+            elif accession == NEGATIVE_POLARITY:
+                spectrum["polarity"] = -1
+            elif accession == POSITIVE_POLARITY:
+                spectrum["polarity"] = 1
+        elif tag == "scanList":
+            spectrum["time"] = _get_time(el)
+        elif tag == "binaryDataArrayList":
+            sp_data = _parse_binary_data_list(el)
+            spectrum.update(sp_data)
+    return spectrum
+
+
+def _parse_chromatogram(xml_str: bytes) -> Dict:
+    """
+    Extracts name, time and intensity from the xml string of a chromatogram
+    element.
+
+    """
     elements = fromstring(xml_str)
     name = elements.attrib.get("id")
     chromatogram = dict(name=name)
@@ -297,7 +607,7 @@ class ReverseReader:
 
         Returns
         -------
-        chunk : str
+        chunk : str or bytes
         """
         if self._is_complete:
             res = None
@@ -328,37 +638,22 @@ def _read_binary_data_array(element: Element) -> Tuple[np.ndarray, str]:
     kind : can be one of {"mz", "spint", "time"}
 
     """
-    has_zlib_compression = False
     data = None
-    kind = None
-    units = None
-    dtype = None
     for e in element:
-        tag = e.tag
-        if tag == "binary":
+        if e.tag == "binary":
             data = e.text if e.text is None else e.text.strip()
-        elif tag == "cvParam":
-            accession = e.attrib.get("accession")
-            value = e.attrib.get("name")
-            if accession in UNSUPPORTED_COMPRESSION:
-                msg = "Currently only zlib compression is supported."
-                raise NotImplementedError(msg)
-            elif accession == ZLIB:
-                has_zlib_compression = True
-            elif accession == INT_ARRAY:
-                kind = "spint"
-            elif accession == MZ_ARRAY:
-                kind = "mz"
-            elif accession == TIME_ARRAY:
-                kind = "time"
-                units = e.attrib.get("unitAccession")
-            if accession in DATA_TYPES:
-                dtype = DATA_TYPES[accession]
+    cv_params = [e.attrib for e in element if e.tag == "cvParam"]
+    kind, dtype, units, has_zlib_compression, numpress = (
+        _get_binary_data_params(cv_params)
+    )
     if data:
         data = base64.b64decode(data)
         if has_zlib_compression:
             data = zlib.decompress(data)
-        data = np.frombuffer(data, dtype=dtype).copy()
+        if numpress is None:
+            data = np.frombuffer(data, dtype=dtype).copy()
+        else:
+            data = NUMPRESS_DECODERS[numpress](data)
         if kind == "time":
             data = _time_to_seconds(data, units)
     else:
@@ -366,6 +661,55 @@ def _read_binary_data_array(element: Element) -> Tuple[np.ndarray, str]:
     return data, kind
 
 
+def _get_binary_data_params(
+    cv_params: List[Dict[str, str]]
+) -> Tuple[str, type, str, bool, Optional[str]]:
+    """
+    Extracts the data kind, data type, units and compression from the cvParam
+    elements of a binaryArray element.
+
+    Parameters
+    ----------
+    cv_params: List[Dict[str, str]]
+        Attributes of each cvParam element.
+
+    Returns
+    -------
+    kind : can be one of {"mz", "spint", "time"}
+    dtype : numpy data type
+    units : str or None
+    has_zlib_compression : bool
+    numpress : {"linear", "pic", "slof"} or None
+        MS-Numpress compression method.
+
+    """
+    has_zlib_compression = False
+    numpress = None
+    kind = None
+    units = None
+    dtype = None
+    for attrib in cv_params:
+        accession = attrib.get("accession")
+        if accession in UNSUPPORTED_COMPRESSION:
+            msg = "Compression with truncation and prediction is not supported."
+            raise NotImplementedError(msg)
+        elif accession in NUMPRESS:
+            numpress, numpress_zlib = NUMPRESS[accession]
+            has_zlib_compression = has_zlib_compression or numpress_zlib
+        elif accession in [ZLIB, TRUNCATION_ZLIB]:
+            has_zlib_compression = True
+        elif accession == INT_ARRAY:
+            kind = "spint"
+        elif accession == MZ_ARRAY:
+            kind = "mz"
+        elif accession == TIME_ARRAY:
+            kind = "time"
+            units = attrib.get("unitAccession")
+        if accession in DATA_TYPES:
+            dtype = DATA_TYPES[accession]
+    return kind, dtype, units, has_zlib_compression, numpress
+
+
 def _parse_binary_data_list(element: Element) -> Dict:
     """
     Extracts the data from a binaryDataArrayList.
@@ -386,6 +730,384 @@ def _parse_binary_data_list(element: Element) -> Dict:
     return res
 
 
+def _parse_buffer(
+    buffer,
+    start: int,
+    end: int,
+    kind: str,
+    copy: bool = True,
+    kinds: Optional[List[str]] = None
+) -> Dict:
+    """
+    Extracts the data from a spectrum or chromatogram element stored in a
+    buffer.
+
+    Spectrum metadata and the cvParams of each binaryDataArray are extracted
+    with regular expressions. ElementTree is used only if the xml has an
+    unusual layout. The encoded data is decoded directly from the buffer.
+
+    Parameters
+    ----------
+    buffer : bytes or mmap
+    start : int
+        offset where the element starts
+    end : int
+        offset where the next element starts, obtained from _get_data_range
+    kind : {"spectrum", "chromatogram"}
+    copy : bool, default=True
+        If ``False``, the arrays share memory with the decoded data and are
+        read-only.
+    kinds : List[str] or None, default=None
+        Kinds of binary data arrays to decode, e.g. ``["spint"]``. If
+        ``None``, all arrays are decoded.
+
+    Returns
+    -------
+    dict
+
+    """
+    end_tag = "</{}>".format(kind).encode()
+    parse = _parse_spectrum if kind == "spectrum" else _parse_chromatogram
+    element_end = buffer.find(end_tag, start, end)
+    list_start = buffer.find(b"<binaryDataArrayList", start, element_end)
+    if list_start == -1:
+        return parse(buffer[start:element_end + len(end_tag)])
+
+    header = buffer[start:list_start]
+    res = None
+    if kind == "spectrum":
+        res = _parse_spectrum_header(header)
+    if res is None:
+        # the binaryDataArrayList is the last element in spectrum and
+        # chromatogram elements, the rest of the element is closed manually.
+        res = parse(header + end_tag)
+    header_end = header.find(b">")
+    size = _ARRAY_LENGTH_REGEX.search(header, 0, header_end)
+    size = int(size.group(1)) if size else 0
+    res.update(_parse_binary_data_list_buffer(
+        buffer, list_start, element_end, size, copy, kinds
+    ))
+    return res
+
+
+def _parse_spectrum_header(header: bytes) -> Optional[Dict]:
+    """
+    Extracts polarity, time and ms level from the xml of a spectrum element
+    preceding the binaryDataArrayList, using regular expressions.
+
+    Parameters
+    ----------
+    header : bytes
+
+    Returns
+    -------
+    spectrum : dict or None
+        dictionary with spectrum metadata. Returns ``None`` if the xml has an
+        unusual layout and must be parsed with ElementTree.
+
+    """
+    if _UNUSUAL_XML_REGEX.search(header):
+        return None
+
+    # according to the mzML schema, spectrum cvParams are located before the
+    # scanList element. The scan start time is inside the scanList element.
+    scan_list_start = header.find(b"<scanList")
+    scan_list_end = header.find(b"</scanList>", scan_list_start)
+    if (scan_list_start == -1) or (scan_list_end == -1):
+        return None
+
+    spectrum = dict()
+    ms_level = None
+    for ms_level in _MS_LEVEL_REGEX.finditer(header, 0, scan_list_start):
+        pass
+    if ms_level is not None:
+        attrib = _get_attributes(ms_level.group(1))
+        spectrum["ms_level"] = int(attrib.get("value"))
+
+    negative = header.rfind(_NEGATIVE_POLARITY_ATTRIBUTE, 0, scan_list_start)
+    positive = header.rfind(_POSITIVE_POLARITY_ATTRIBUTE, 0, scan_list_start)
+    if (negative != -1) or (positive != -1):
+        spectrum["polarity"] = -1 if negative > positive else 1
+
+    time = _TIME_REGEX.search(header, scan_list_start, scan_list_end)
+    if time is None:
+        return None
+    attrib = _get_attributes(time.group(1))
+    value = float(attrib.get("value"))
+    units = attrib.get("unitAccession")
+    spectrum["time"] = _time_to_seconds(value, units)
+    return spectrum
+
+
+def _get_attributes(attributes: bytes) -> Dict[str, str]:
+    """
+    Creates a dictionary from the attributes of a xml element.
+
+    """
+    return dict(_ATTRIBUTE_REGEX.findall(attributes.decode()))
+
+
+def _find_cv_params(xml_str: bytes) -> List[Dict[str, str]]:
+    """
+    Extracts the accession of the cvParam elements in xml_str. If the time
+    array accession is found, all attributes are extracted.
+
+    """
+    accessions = _ACCESSION_REGEX.findall(xml_str)
+    if TIME_ARRAY.encode() in accessions:
+        cv_params = [_get_attributes(x) for x in _CV_PARAM_REGEX.findall(xml_str)]
+    else:
+        cv_params = [{"accession": x.decode()} for x in accessions]
+    return cv_params
+
+
+def _parse_binary_data_list_buffer(
+    buffer,
+    start: int,
+    end: int,
+    size: int,
+    copy: bool,
+    kinds: Optional[List[str]] = None
+) -> Dict:
+    """
+    Extracts the data from a binaryDataArrayList stored in a buffer.
+
+    Parameters
+    ----------
+    buffer : bytes or mmap
+    start : int
+        offset where the binaryDataArrayList starts
+    end : int
+        offset where the binaryDataArrayList ends
+    size : int
+        default array length, used to allocate the decompression buffer.
+    copy : bool
+        If ``False``, the arrays share memory with the decoded data.
+    kinds : List[str] or None, default=None
+        Kinds of binary data arrays to decode. If ``None``, all arrays are
+        decoded.
+
+    Returns
+    -------
+    dictionary that maps data kind to its correspondent data array.
+
+    """
+    res = dict()
+    array_tag = b"<binaryDataArray"
+    array_end_tag = b"</binaryDataArray>"
+    # skip the binaryDataArrayList tag
+    pos = buffer.find(b">", start, end)
+    with memoryview(buffer) as view:
+        while True:
+            array_start = buffer.find(array_tag, pos, end)
+            if array_start == -1:
+                break
+            array_end = buffer.find(array_end_tag, array_start, end)
+            if array_end == -1:
+                # truncated element, ElementTree reports the error
+                pos = end
+                binary_start = -1
+            else:
+                pos = array_end + len(array_end_tag)
+                binary_start = buffer.find(b"<binary>", array_start, array_end)
+            # empty arrays are usually written as <binary/>
+            if binary_start == -1:
+                header = None
+            else:
+                header = buffer[array_start:binary_start]
+            if (header is None) or _UNUSUAL_XML_REGEX.search(header):
+                element = fromstring(buffer[array_start:pos])
+                data, kind = _read_binary_data_array(element)
+            else:
+                binary_end = buffer.find(b"</binary>", binary_start, array_end)
+                data_start = binary_start + len(b"<binary>")
+                cv_params = _find_cv_params(header)
+                if (kinds is not None) and (
+                    _get_binary_data_params(cv_params)[0] not in kinds
+                ):
+                    continue
+                array_size = _ARRAY_LENGTH_REGEX.search(
+                    header, 0, header.find(b">")
+                )
+                array_size = int(array_size.group(1)) if array_size else size
+                data, kind = _decode_binary_data(
+                    cv_params, view[data_start:binary_end], array_size, copy
+                )
+            if (kinds is None) or (kind in kinds):
+                res[kind] = data
+    return res
+
+
+def _decode_binary_data(
+    cv_params: List[Dict[str, str]],
+    data: memoryview,
+    size: int,
+    copy: bool
+) -> Tuple[np.ndarray, str]:
+    """
+    Decodes the data of a binaryDataArray.
+
+    Parameters
+    ----------
+    cv_params : List[Dict[str, str]]
+        Attributes of the cvParam elements of the binaryDataArray.
+    data : memoryview
+        base64 encoded data.
+    size : int
+        array length.
+    copy : bool
+        If ``False``, the array shares memory with the decoded data and it is
+        read-only.
+
+    Returns
+    -------
+    data : array
+    kind : can be one of {"mz", "spint", "time"}
+
+    """
+    kind, dtype, units, has_zlib_compression, numpress = (
+        _get_binary_data_params(cv_params)
+    )
+    # base64.b64decode copies the input data
+    data = binascii.a2b_base64(data)
+    if not data:
+        return np.array([]), kind
+    if has_zlib_compression:
+        # allocating the output with the expected size avoids resizing the
+        # buffer during decompression.
+        bufsize = max(size * np.dtype(dtype).itemsize, zlib.DEF_BUF_SIZE)
+        data = zlib.decompress(data, bufsize=bufsize)
+    if numpress is None:
+        data = np.frombuffer(data, dtype=dtype)
+        if copy:
+            data = data.copy()
+    else:
+        # numpress decoders always create a new array
+        data = NUMPRESS_DECODERS[numpress](data)
+    if kind == "time":
+        data = _time_to_seconds(data, units)
+    return data, kind
+
+
+def get_index_cache_path(
+    filename: Union[str, Path],
+    cache_dir: Union[str, Path]
+) -> Path:
+    """
+    Gets the path of the sidecar file with the index of a mzML file.
+
+    Parameters
+    ----------
+    filename : str or Path
+        path to a mzML file.
+    cache_dir : str or Path
+        directory where sidecar files are stored.
+
+    Returns
+    -------
+    Path
+
+    """
+    return Path(cache_dir).joinpath(Path(filename).name + INDEX_CACHE_SUFFIX)
+
+
+def load_index_cache(
+    cache_path: Path,
+    file_key: Dict
+) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Loads the offsets and scan table stored in a sidecar file.
+
+    Parameters
+    ----------
+    cache_path : Path
+        path to the sidecar file.
+    file_key : dict
+        Size, modification time and hash of the mzML file, obtained with
+        _get_file_key.
+
+    Returns
+    -------
+    index : dict or None
+        Returns ``None`` if the sidecar does not exist, is not valid or was
+        created from a different file.
+
+    """
+    try:
+        with np.load(cache_path, allow_pickle=False) as data:
+            index = {x: data[x] for x in data.files}
+    except (OSError, ValueError):
+        return None
+
+    key = dict(file_key, version=_INDEX_CACHE_VERSION)
+    keys = list(key) + _INDEX_CACHE_ARRAYS + SCAN_TABLE_COLUMNS
+    if not all(x in index for x in keys):
+        return None
+    for name, value in key.items():
+        if index.pop(name).item() != value:
+            return None
+    return index
+
+
+def save_index_cache(
+    cache_path: Path,
+    file_key: Dict,
+    index: Dict[str, np.ndarray]
+):
+    """
+    Stores the offsets and scan table of a mzML file in a sidecar file.
+    If the sidecar cannot be written, no error is raised.
+
+    Parameters
+    ----------
+    cache_path : Path
+        path to the sidecar file.
+    file_key : dict
+        Size, modification time and hash of the mzML file, obtained with
+        _get_file_key.
+    index : dict
+        offsets and scan table arrays.
+
+    """
+    data = dict(index)
+    data.update(file_key)
+    data["version"] = _INDEX_CACHE_VERSION
+    # the sidecar is written to a temporary file and then renamed, to prevent
+    # reading incomplete sidecars if several processes use the same file.
+    tmp_path = cache_path.with_name("{}.{}.tmp".format(cache_path.name, getpid()))
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "wb") as fout:
+            np.savez(fout, **data)
+        replace(tmp_path, cache_path)
+    except OSError:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _get_file_key(filename: Union[str, Path]) -> Dict:
+    """
+    Computes the values used to check that a sidecar corresponds to a file.
+
+    The hash is computed using the beginning and the end of the file, so it is
+    computed in constant time.
+
+    """
+    file_stat = stat(filename)
+    size = file_stat.st_size
+    file_hash = hashlib.sha1()
+    with open(filename, "rb") as fin:
+        file_hash.update(fin.read(_INDEX_CACHE_HASH_SIZE))
+        fin.seek(max(size - _INDEX_CACHE_HASH_SIZE, 0))
+        file_hash.update(fin.read(_INDEX_CACHE_HASH_SIZE))
+    key = {
+        "file_size": size,
+        "mtime": file_stat.st_mtime_ns,
+        "hash": file_hash.hexdigest(),
+    }
+    return key
+
+
 def is_indexed(filename: Path) -> bool:
     """
     Checks if a mzML file is indexed.
@@ -404,8 +1126,8 @@ def is_indexed(filename: Path) -> bool:
     closing tag, that should be </indexedmzML> if the file is indexed.
 
     """
-    with ReverseReader(filename, 1024, mode="r") as fin:
-        end_tag = "</indexedmzML>"
+    with ReverseReader(filename, 1024, mode="rb") as fin:
+        end_tag = b"</indexedmzML>"
         chunk = fin.read_chunk()
         res = chunk.find(end_tag) != -1
     return res
@@ -424,12 +1146,12 @@ def _get_index_offset(filename: Path) -> int:
     index_offset : int
 
     """
-    tag = "<indexListOffset>"
+    tag = b"<indexListOffset>"
     # reads mzml backwards until the tag is found
     # we exploit the fact that according to the mzML schema the
     # indexListOffset should have neither attributes nor sub elements
-    with ReverseReader(filename, 1024, mode="r") as fin:
-        xml = ""
+    with ReverseReader(filename, 1024, mode="rb") as fin:
+        xml = b""
         ind = -1
         while ind == -1:
             chunk = fin.read_chunk()
@@ -438,13 +1160,14 @@ def _get_index_offset(filename: Path) -> int:
         # starts at the beginning of the text tag
         start = ind + len(tag)
         xml = xml[start:]
-        end = xml.find("<")
+        end = xml.find(b"<")
     index_offset = int(xml[:end])
     return index_offset
 
 
 def _build_offset_list_non_indexed(
-        filename: Path
+    filename: Path,
+    n_jobs: Optional[int] = None
 ) -> Tuple[list[int], list[int]]:
     """
     Builds manually the indices for non-indexed mzML files.
@@ -452,53 +1175,90 @@ def _build_offset_list_non_indexed(
     Parameters
     ----------
     filename : Path
+    n_jobs : int or None, default=None
+        Number of jobs to run in parallel. Large files are split into ranges
+        that are scanned in parallel.
 
     Returns
     -------
+    spectra_offset : List
+        offset where spectra are stored
+    chromatogram_offset : List
+        offset where chromatograms are stored
 
     """
     # indices are build by finding the offset where spectrum or chromatogram
     # elements starts.
-    spectrum_regex = re.compile("<spectrum .[^(><.)]+>")
-    chromatogram_regex = re.compile("<chromatogram .[^(><.)]+>")
-    ind = 0
+    size = getsize(filename)
+    n_ranges = min(effective_n_jobs(n_jobs), size // _MIN_SCAN_RANGE_SIZE)
+    n_ranges = max(n_ranges, 1)
+    bounds = [size * k // n_ranges for k in range(n_ranges + 1)]
+    if n_ranges == 1:
+        results = [_find_tag_offsets(filename, 0, size)]
+    else:
+        func = delayed(_find_tag_offsets)
+        results = Parallel(n_jobs=n_jobs)(
+            func(filename, start, end) for start, end in zip(bounds, bounds[1:])
+        )
     spectrum_offset_list = list()
     chromatogram_offset_list = list()
-    with open(filename) as fin:
-        while True:
-            line = fin.readline()
-            if line == "":
-                break
-            spectrum_offset = _find_spectrum_tag_offset(line, spectrum_regex)
-            if spectrum_offset:
-                spectrum_offset_list.append(ind + spectrum_offset)
-            chromatogram_offset = _find_chromatogram_tag_offset(
-                line, chromatogram_regex
-            )
-            if chromatogram_offset:
-                chromatogram_offset_list.append(ind + chromatogram_offset)
-            ind += len(line)
+    for spectrum_offset, chromatogram_offset in results:
+        spectrum_offset_list.extend(spectrum_offset)
+        chromatogram_offset_list.extend(chromatogram_offset)
     return spectrum_offset_list, chromatogram_offset_list
 
 
-def _find_spectrum_tag_offset(line: str, regex: re.Pattern) -> int:
-    if line.lstrip().startswith("<spectrum"):
-        match = regex.search(line)
-        if match:
-            start, end = match.span()
-        else:
-            start = None
-        return start
+def _find_tag_offsets(
+    filename: Path,
+    start: int,
+    end: int
+) -> Tuple[list[int], list[int]]:
+    """
+    Finds the offsets of spectrum and chromatogram start tags in the range
+    [start, end) of a file.
 
+    Parameters
+    ----------
+    filename : Path
+    start : int
+    end : int
 
-def _find_chromatogram_tag_offset(line: str, regex: re.Pattern) -> int:
-    if line.lstrip().startswith("<chromatogram"):
-        match = regex.search(line)
-        if match:
-            start, end = match.span()
-        else:
-            start = None
-        return start
+    Returns
+    -------
+    spectra_offset : List
+    chromatogram_offset : List
+
+    """
+    spectrum_tag = b"<spectrum "
+    chromatogram_tag = b"<chromatogram "
+    # chunks overlap to find tags split between consecutive chunks
+    overlap = len(chromatogram_tag) - 1
+    spectrum_offset_list = list()
+    chromatogram_offset_list = list()
+    with open(filename, "rb") as fin:
+        offset = start
+        while offset < end:
+            chunk_size = min(_SCAN_CHUNK_SIZE, end - offset)
+            fin.seek(offset)
+            chunk = fin.read(chunk_size + overlap)
+            _find_all(chunk, spectrum_tag, chunk_size, offset, spectrum_offset_list)
+            _find_all(
+                chunk, chromatogram_tag, chunk_size, offset, chromatogram_offset_list
+            )
+            offset += chunk_size
+    return spectrum_offset_list, chromatogram_offset_list
+
+
+def _find_all(chunk: bytes, tag: bytes, end: int, offset: int, res: List[int]):
+    """
+    Appends to res the position, plus offset, of occurrences of tag that
+    start before end.
+
+    """
+    ind = chunk.find(tag, 0, end + len(tag) - 1)
+    while ind != -1:
+        res.append(offset + ind)
+        ind = chunk.find(tag, ind + len(tag), end + len(tag) - 1)
 
 
 def _build_offset_list_indexed(
@@ -522,8 +1282,8 @@ def _build_offset_list_indexed(
         offset where chromatograms are stored
 
     """
-    end_tag = "</indexList>"
-    with open(filename, "r") as fin:
+    end_tag = b"</indexList>"
+    with open(filename, "rb") as fin:
         fin.seek(index_offset)
         index_xml = fin.read()
         end = index_xml.find(end_tag)
@@ -549,7 +1309,7 @@ def _get_xml_data(
     index_offset: int,
     n: int,
     kind: str,
-) -> str:
+) -> bytes:
     """
     Get the xml string associated with a spectrum or chromatogram.
 
@@ -568,15 +1328,53 @@ def _get_xml_data(
 
     Returns
     -------
-    str
+    bytes
+
+    """
+    start, end = _get_data_range(
+        spectra_offset, chromatogram_offset, index_offset, n, kind
+    )
+    end_tag = "</{}>".format(kind).encode()
+    with open(filename, "rb") as fin:
+        fin.seek(start)
+        chunk = fin.read(end - start)
+    end = chunk.find(end_tag)
+    return chunk[: end + len(end_tag)]
+
+
+def _get_data_range(
+    spectra_offset: List[int],
+    chromatogram_offset: List[int],
+    index_offset: int,
+    n: int,
+    kind: str,
+) -> Tuple[int, int]:
+    """
+    Computes the byte range in the file that contains a spectrum or
+    chromatogram.
+
+    Parameters
+    ----------
+    spectra_offset : list
+        offsets obtained from _build_offset_list
+    chromatogram_offset : list
+        offsets obtained from _build_offset_list
+    index_offset : int
+        offset obtained from _get_index_offset
+    n : int
+        number of spectrum/chromatogram to select
+    kind : {"spectrum", "chromatogram"}
+
+    Returns
+    -------
+    start : int
+    end : int
 
     """
     if kind == "spectrum":
         l, other = spectra_offset, chromatogram_offset
-        end_tag = "</spectrum>"
     elif kind == "chromatogram":
         l, other = chromatogram_offset, spectra_offset
-        end_tag = "</chromatogram>"
     else:
         raise ValueError("Kind must be `spectrum` or `chromatogram`")
 
@@ -593,12 +1391,7 @@ def _get_xml_data(
 
     if end < start:
         end = index_offset
-
-    with open(filename, "r") as fin:
-        fin.seek(start)
-        chunk = fin.read(end - start)
-    end = chunk.find(end_tag)
-    return chunk[: end + len(end_tag)]
+    return start, end
 
 
 def _get_time(element):
@@ -0,0 +1,179 @@
+"""
+Vectorized decoders for data compressed with MS-Numpress.
+
+decode_linear : Decodes data compressed with linear prediction.
+decode_pic : Decodes data compressed with positive integer compression.
+decode_slof : Decodes data compressed with short logged float compression.
+
+"""
+
+import numpy as np
+
+# Rationale for the implementation:
+# MS-Numpress linear prediction and positive integer compression store
+# integers using a variable number of half bytes (nibbles). The first nibble
+# of each integer (the head) encodes the number of leading zero (or 0xf)
+# nibbles that are omitted, and it is followed by the remaining nibbles, from
+# the least to the most significant. The location of each integer depends on
+# the size of all previous integers, which makes the decoding sequential.
+# Here, the size of an integer starting at each nibble is computed for all
+# nibbles and the locations of the integers are found by pointer jumping: the
+# number of integers found is doubled on each iteration, so only log2(n)
+# vectorized operations are required.
+# See https://github.com/ms-numpress/ms-numpress for the reference
+# implementation.
+
+_FIXED_POINT_DTYPE = ">f8"
+_MAX_NIBBLES = 8
+
+
+def decode_linear(data: bytes) -> np.ndarray:
+    """
+    Decodes data compressed with MS-Numpress linear prediction.
+
+    Parameters
+    ----------
+    data : bytes
+
+    Returns
+    -------
+    array
+
+    Raises
+    ------
+    ValueError
+        If the data is corrupt.
+
+    """
+    size = len(data)
+    if size == 8:
+        return np.array([])
+    if (size < 12) or (size in [13, 14, 15]):
+        raise ValueError("Corrupt MS-Numpress linear prediction data.")
+    fixed_point = np.frombuffer(data, dtype=_FIXED_POINT_DTYPE, count=1)[0]
+    n_first = 1 if size == 12 else 2
+    first = np.frombuffer(data, dtype="<u4", count=n_first, offset=8)
+    first = first.astype(np.int64)
+    if size == 12:
+        return first / fixed_point
+
+    # the prediction error of the i-th value is equal to its second order
+    # difference: y[i] - 2 * y[i - 1] + y[i - 2]
+    residual = _decode_ints(data, 16).view(np.int32).astype(np.int64)
+    y = np.empty(residual.size + 2, dtype=np.int64)
+    y[:2] = first
+    diff = np.cumsum(residual)
+    diff += first[1] - first[0]
+    np.cumsum(diff, out=y[2:])
+    y[2:] += first[1]
+    return y / fixed_point
+
+
+def decode_pic(data: bytes) -> np.ndarray:
+    """
+    Decodes data compressed with MS-Numpress positive integer compression.
+
+    Parameters
+    ----------
+    data : bytes
+
+    Returns
+    -------
+    array
+
+    Raises
+    ------
+    ValueError
+        If the data is corrupt.
+
+    """
+    return _decode_ints(data, 0).astype(float)
+
+
+def decode_slof(data: bytes) -> np.ndarray:
+    """
+    Decodes data compressed with MS-Numpress short logged float compression.
+
+    Parameters
+    ----------
+    data : bytes
+
+    Returns
+    -------
+    array
+
+    Raises
+    ------
+    ValueError
+        If the data is corrupt.
+
+    """
+    size = len(data)
+    if size < 8:
+        raise ValueError("Corrupt MS-Numpress short logged float data.")
+    fixed_point = np.frombuffer(data, dtype=_FIXED_POINT_DTYPE, count=1)[0]
+    x = np.frombuffer(data, dtype="<u2", count=(size - 8) // 2, offset=8)
+    return np.expm1(x / fixed_point)
+
+
+def _decode_ints(data: bytes, offset: int) -> np.ndarray:
+    """
+    Decodes integers stored using half bytes.
+
+    Parameters
+    ----------
+    data : bytes
+    offset : int
+        Offset where the encoded integers start, in bytes.
+
+    Returns
+    -------
+    array of uint32
+
+    """
+    data = np.frombuffer(data, dtype=np.uint8, offset=offset)
+    n_nibbles = 2 * data.size
+    nibbles = np.empty(n_nibbles + _MAX_NIBBLES, dtype=np.uint8)
+    nibbles[:n_nibbles:2] = data >> 4
+    nibbles[1:n_nibbles:2] = data & 0xf
+    # padding used to read the nibbles of the last integer without checking
+    # bounds
+    nibbles[n_nibbles:] = 0
+    if n_nibbles == 0:
+        return np.array([], dtype=np.uint32)
+
+    head = nibbles[:n_nibbles].astype(np.int64)
+    n_omitted = np.where(head <= 8, head, head - 8)
+    # location of the next integer if an integer starts at each nibble. The
+    # last element is a sentinel used for the end of the data.
+    jump = np.arange(n_nibbles + 1, dtype=np.int64)
+    jump[:-1] += 1 + _MAX_NIBBLES - n_omitted
+    np.minimum(jump, n_nibbles, out=jump)
+    start = np.zeros(1, dtype=np.int64)
+    while start[-1] < n_nibbles:
+        start = np.hstack((start, jump[start]))
+        jump = jump[jump]
+    start = start[start < n_nibbles]
+
+    n_omitted = n_omitted[start]
+    n_stored = _MAX_NIBBLES - n_omitted
+    end = start + 1 + n_stored
+    if end[-1] > n_nibbles:
+        # the data may end with a zero nibble used to complete the last byte
+        is_padding = (start[-1] == n_nibbles - 1) and (head[start[-1]] == 0)
+        if not is_padding:
+            raise ValueError("Corrupt MS-Numpress data.")
+        start = start[:-1]
+        n_omitted = n_omitted[:-1]
+        n_stored = n_stored[:-1]
+
+    res = np.zeros(start.size, dtype=np.uint64)
+    for k in range(_MAX_NIBBLES):
+        nibble = nibbles[start + 1 + k].astype(np.uint64)
+        nibble[n_stored <= k] = 0
+        res |= nibble << np.uint64(4 * k)
+    # omitted leading nibbles are set to 0xf if the head is greater than 8
+    has_leading_ones = head[start] > 8
+    leading_ones = np.uint64(0xffffffff) << (4 * n_stored.astype(np.uint64))
+    res[has_leading_ones] |= leading_ones[has_leading_ones]
+    return (res & np.uint64(0xffffffff)).astype(np.uint32)
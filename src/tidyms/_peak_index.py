@@ -0,0 +1,183 @@
+"""
+Index used to search the signals of a sample in a m/z and time region.
+
+PeakIndex : Signals of a sample sorted by m/z.
+
+"""
+
+import numpy as np
+from typing import Generator, Optional, Tuple
+from .lcms import MSSpectrum
+
+# Rationale for the implementation:
+# Several steps query the raw data of a sample using a m/z window and a time
+# window, e.g. to fill missing values or to plot the neighborhood of a
+# feature. Iterating over the spectra of the sample for each query is slow.
+# The centroids of all spectra are concatenated and sorted by m/z, so the
+# signals inside a m/z window are found using binary search. Sorted signals
+# are grouped in blocks of fixed size, and the minimum and maximum time of the
+# signals in each block are used to skip blocks outside the time window when
+# the m/z window is wide.
+
+# number of consecutive signals in each block of the index
+_BLOCK_SIZE = 256
+
+
+class PeakIndex:
+    """
+    Index of the signals of a sample, sorted by m/z.
+
+    Attributes
+    ----------
+    mz : array
+        m/z of each signal, sorted.
+    spint : array
+        intensity of each signal.
+    time : array
+        acquisition time of the spectrum of each signal.
+    scan : array
+        scan number of the spectrum of each signal.
+
+    """
+
+    def __init__(
+        self,
+        mz: np.ndarray,
+        spint: np.ndarray,
+        time: np.ndarray,
+        scan: np.ndarray,
+        block_size: int = _BLOCK_SIZE,
+    ):
+        sorted_index = np.argsort(mz, kind="stable")
+        self.mz = np.asarray(mz, dtype=float)[sorted_index]
+        self.spint = np.asarray(spint, dtype=float)[sorted_index]
+        self.time = np.asarray(time, dtype=float)[sorted_index]
+        self.scan = np.asarray(scan, dtype=int)[sorted_index]
+        self.block_size = block_size
+        if self.mz.size:
+            block_start = np.arange(0, self.mz.size, block_size)
+            self._block_min_time = np.fmin.reduceat(self.time, block_start)
+            self._block_max_time = np.fmax.reduceat(self.time, block_start)
+        else:
+            self._block_min_time = np.array([])
+            self._block_max_time = np.array([])
+
+    def __len__(self) -> int:
+        return self.mz.size
+
+    @classmethod
+    def from_spectra(
+        cls, sp_iterator: Generator[Tuple[int, MSSpectrum], None, None]
+    ) -> "PeakIndex":
+        """
+        Creates an index using the centroids of spectra.
+
+        Parameters
+        ----------
+        sp_iterator : Generator
+            Yields scan number and spectrum pairs, as
+            :meth:`MSData.get_spectra_iterator`. Spectra in profile mode are
+            centroided using the default parameters of
+            :meth:`MSSpectrum.find_centroids`.
+
+        Returns
+        -------
+        PeakIndex
+
+        """
+        mz_list = list()
+        spint_list = list()
+        time_list = list()
+        scan_list = list()
+        for scan, sp in sp_iterator:
+            mz, spint = sp.find_centroids()
+            mz_list.append(mz)
+            spint_list.append(spint)
+            time = np.nan if sp.time is None else sp.time
+            time_list.append(np.full(mz.size, time))
+            scan_list.append(np.full(mz.size, scan))
+        if not mz_list:
+            return cls(np.array([]), np.array([]), np.array([]), np.array([], dtype=int))
+        return cls(
+            np.hstack(mz_list),
+            np.hstack(spint_list),
+            np.hstack(time_list),
+            np.hstack(scan_list),
+        )
+
+    def query(
+        self,
+        mz_min: float,
+        mz_max: float,
+        time_min: Optional[float] = None,
+        time_max: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        Finds the signals inside a m/z and time region.
+
+        Parameters
+        ----------
+        mz_min : float
+        mz_max : float
+        time_min : float or None, default=None
+            Minimum acquisition time. If ``None``, no lower bound is used.
+        time_max : float or None, default=None
+            Maximum acquisition time. If ``None``, no upper bound is used.
+
+        Returns
+        -------
+        index : array
+            Index of the signals with m/z in ``[mz_min, mz_max]`` and time in
+            ``[time_min, time_max]``, sorted by m/z.
+
+        """
+        start = np.searchsorted(self.mz, mz_min, side="left")
+        end = np.searchsorted(self.mz, mz_max, side="right")
+        if (time_min is None) and (time_max is None):
+            return np.arange(start, end)
+        if start >= end:
+            return np.array([], dtype=int)
+
+        time_min = -np.inf if time_min is None else time_min
+        time_max = np.inf if time_max is None else time_max
+        block = np.arange(start // self.block_size, (end - 1) // self.block_size + 1)
+        in_time_range = (self._block_max_time[block] >= time_min) & (
+            self._block_min_time[block] <= time_max
+        )
+        block = block[in_time_range]
+        index = (block[:, np.newaxis] * self.block_size + np.arange(self.block_size)).ravel()
+        index = index[(index >= start) & (index < end)]
+        time = self.time[index]
+        return index[(time >= time_min) & (time <= time_max)]
+
+    def get_signals(
+        self,
+        mz_min: float,
+        mz_max: float,
+        time_min: Optional[float] = None,
+        time_max: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get the signals inside a m/z and time region.
+
+        Parameters
+        ----------
+        mz_min : float
+        mz_max : float
+        time_min : float or None, default=None
+        time_max : float or None, default=None
+
+        Returns
+        -------
+        mz : array
+        spint : array
+        time : array
+        scan : array
+
+        See Also
+        --------
+        PeakIndex.query
+
+        """
+        index = self.query(mz_min, mz_max, time_min, time_max)
+        return self.mz[index], self.spint[index], self.time[index], self.scan[index]
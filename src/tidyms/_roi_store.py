@@ -0,0 +1,559 @@
+"""
+Functions to store ROI in a binary file that can be memory mapped.
+
+write_roi_store : Stores ROI in a binary file.
+write_roi_sidecar : Stores a subset of ROI attributes in a sidecar file.
+is_roi_store : Checks if a file is a ROI binary file.
+RoiStoreReader : Loads ROI from a binary file and its sidecar files.
+
+"""
+
+import json
+import numpy as np
+import struct
+from os import getpid, replace
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Sequence, Type, Union
+from .lcms import Roi
+from . import _constants as c
+
+# Rationale for the implementation:
+# ROI were stored as one JSON string per ROI, with base64 encoded arrays.
+# Parsing these strings dominates the time needed to load the ROI from a
+# sample. ROI are now stored in a binary file with the concatenated arrays of
+# several ROI and offset arrays with the location of each ROI. Features are
+# stored in a table with one column for each feature attribute.
+#
+# ROI are written in blocks: the arrays of a block are written as soon as the
+# block is full, and the memory needed to store ROI is bounded by the block
+# size. Blocks are grouped in sections. A section contains a subset of the ROI
+# attributes (columns) for all ROI. The footer at the end of the file
+# describes the location of each array.
+#
+# Attributes that are computed after the ROI are created (e.g. features,
+# noise and baseline) are stored in sidecar files, with the same format, that
+# are keyed by the position of each ROI in the ROI file. Values in sidecar
+# files take precedence over the values in the ROI file. Changes to trace
+# values (e.g. filling missing values) are stored as sparse patches, with the
+# position and new value of each modified point, and the trace data is
+# written only once.
+#
+# File layout: magic | arrays | JSON footer | footer size | magic
+
+_MAGIC = b"TIDYMSR\x00"
+_FOOTER_SIZE_FORMAT = "<Q"
+_STORE_VERSION = 1
+_ALIGNMENT = 8
+# number of trace points stored in memory before a block is written
+_BLOCK_SIZE = 2 ** 20
+
+TRACE_COLUMNS = (c.TIME, c.SPINT, c.MZ, c.SCAN, c.NOISE, c.BASELINE)
+ROI_COLUMNS = TRACE_COLUMNS + (c.ROI_FEATURE_LIST,)
+_INDEX = "index"
+_POINT_OFFSET = "point_offset"
+_FEATURE_OFFSET = "feature_offset"
+_FEATURE_PREFIX = "feature."
+_PATCH_OFFSET = "patch_offset."
+_PATCH_INDEX = "patch_index."
+_PATCH_PREFIX = "patch."
+
+
+class RoiStoreReader:
+    """
+    Loads ROI from a binary file created with write_roi_store.
+
+    Files are memory mapped the first time that a ROI is requested. Arrays
+    in the ROI are copies of the values in the mapped files.
+
+    Parameters
+    ----------
+    path : Path
+        Path to a ROI binary file.
+    sidecars : Sequence[Path], default=()
+        Path to sidecar files created with write_roi_sidecar. If a column is
+        stored in several files, the value from the last file is used.
+
+    Raises
+    ------
+    ValueError : If the number of ROI in a sidecar file is different from
+    the number of ROI in the ROI file.
+
+    """
+
+    def __init__(self, path: Union[str, Path], sidecars: Sequence[Union[str, Path]] = ()):
+        self.path = Path(path)
+        self.footer, _ = read_footer(self.path)
+        self.n_roi = self.footer["n_roi"]
+        # sections from the ROI file and the sidecar files, with the path of
+        # the file where each one is stored
+        self._sections = [(self.path, x) for x in self.footer["sections"]]
+        for sidecar in sidecars:
+            footer, _ = read_footer(sidecar)
+            if footer["n_roi"] != self.n_roi:
+                msg = "Expected {} ROI in {}, got {}.".format(self.n_roi, sidecar, footer["n_roi"])
+                raise ValueError(msg)
+            self._sections.extend((Path(sidecar), x) for x in footer["sections"])
+        self._data = dict()
+        self._arrays = dict()
+        # the last section where each column was stored
+        self._column_section = dict()
+        # sections with patches of a trace column
+        self._patch_sections = {x: list() for x in TRACE_COLUMNS}
+        for k, (_, section) in enumerate(self._sections):
+            for column in section["columns"]:
+                self._column_section[column] = k
+            for column in section.get("patch_columns", list()):
+                self._patch_sections[column].append(k)
+        self._block_start = list()
+        for _, section in self._sections:
+            size = [block["size"] for block in section["blocks"]]
+            self._block_start.append(np.cumsum([0] + size))
+
+    def __len__(self) -> int:
+        return self.n_roi
+
+    def load_roi(self, index: int, roi_class: Type[Roi]) -> Roi:
+        """
+        Loads a ROI.
+
+        Parameters
+        ----------
+        index : int
+            Position of the ROI in the file.
+        roi_class : Type[Roi]
+            Class used to create the ROI.
+
+        Returns
+        -------
+        Roi
+
+        Raises
+        ------
+        IndexError : If the index is out of range.
+
+        """
+        if (index < 0) or (index >= self.n_roi):
+            msg = "ROI index out of range. File contains {} ROI.".format(self.n_roi)
+            raise IndexError(msg)
+
+        kwargs: Dict[str, Any] = dict()
+        section, block, local = self._locate(0, index)
+        kwargs[_INDEX] = int(self._get_array(section, block, _INDEX)[local])
+        kwargs[c.MODE] = block["modes"][self._get_array(section, block, "mode_code")[local]]
+        for column in TRACE_COLUMNS:
+            if column in self._column_section:
+                section, block, local = self._locate(self._column_section[column], index)
+                kwargs[column] = self._get_trace(section, block, column, local)
+                for k in self._get_patch_sections(column):
+                    section, block, local = self._locate(k, index)
+                    self._apply_patch(section, block, column, local, kwargs[column])
+            else:
+                kwargs[column] = None
+        roi = roi_class(**kwargs)
+
+        if c.ROI_FEATURE_LIST in self._column_section:
+            section, block, local = self._locate(self._column_section[c.ROI_FEATURE_LIST], index)
+            roi.features = self._get_features(section, block, local, roi)
+        return roi
+
+    def load_roi_list(self, roi_class: Type[Roi]) -> List[Roi]:
+        """
+        Loads all ROI.
+
+        Parameters
+        ----------
+        roi_class : Type[Roi]
+            Class used to create the ROI.
+
+        Returns
+        -------
+        List[Roi]
+
+        """
+        # arrays are read block by block, instead of locating each ROI
+        sections = [x for _, x in self._sections]
+        index = list()
+        mode = list()
+        for b, block in enumerate(sections[0]["blocks"]):
+            index.extend(self._get_array((0, b), block, _INDEX).tolist())
+            modes = block["modes"]
+            mode.extend(modes[x] for x in self._get_array((0, b), block, "mode_code").tolist())
+
+        traces = dict()
+        for column in TRACE_COLUMNS:
+            if column in self._column_section:
+                traces[column] = self._split_trace(self._column_section[column], column)
+                for k in self._get_patch_sections(column):
+                    start = 0
+                    for b, block in enumerate(sections[k]["blocks"]):
+                        for local in range(block["size"]):
+                            self._apply_patch((k, b), block, column, local, traces[column][start + local])
+                        start += block["size"]
+            else:
+                traces[column] = [None] * self.n_roi
+
+        roi_list = list()
+        for k in range(self.n_roi):
+            kwargs: Dict[str, Any] = {column: traces[column][k] for column in TRACE_COLUMNS}
+            kwargs[_INDEX] = index[k]
+            kwargs[c.MODE] = mode[k]
+            roi = roi_class(**kwargs)
+            roi_list.append(roi)
+
+        if c.ROI_FEATURE_LIST in self._column_section:
+            section_index = self._column_section[c.ROI_FEATURE_LIST]
+            start = 0
+            for b, block in enumerate(sections[section_index]["blocks"]):
+                size = block["size"]
+                self._set_block_features((section_index, b), block, roi_list[start:start + size])
+                start += size
+        return roi_list
+
+    def _set_block_features(self, section, block: dict, roi_list: List[Roi]):
+        """
+        Creates the features of all ROI in a block.
+
+        """
+        if not roi_list:
+            return
+        has_features = self._get_array(section, block, "has_" + c.ROI_FEATURE_LIST).tolist()
+        offset = self._get_array(section, block, _FEATURE_OFFSET).tolist()
+        fields = block["feature_fields"]
+        records = zip(*[self._get_array(section, block, _FEATURE_PREFIX + x).tolist() for x in fields])
+        records = [dict(zip(fields, x)) for x in records]
+        ft_class = roi_list[0]._get_feature_type()
+        for roi, has, start, end in zip(roi_list, has_features, offset, offset[1:]):
+            if has:
+                roi.features = [ft_class(roi=roi, **x) for x in records[start:end]]
+            else:
+                roi.features = None
+
+    def _split_trace(self, section_index: int, column: str) -> List[Optional[np.ndarray]]:
+        """
+        Creates a list with the values of a trace column for each ROI.
+
+        """
+        values = list()
+        for b, block in enumerate(self._sections[section_index][1]["blocks"]):
+            if not block["size"]:
+                continue
+            key = (section_index, b)
+            has_values = self._get_array(key, block, "has_" + column)
+            if has_values.any():
+                offset = self._get_array(key, block, _POINT_OFFSET)
+                # a single copy of the array is shared by all ROI in the block
+                data = np.array(self._get_array(key, block, column))
+                split = np.split(data, offset[1:-1])
+                values.extend(x if h else None for x, h in zip(split, has_values.tolist()))
+            else:
+                values.extend([None] * block["size"])
+        return values
+
+    def _locate(self, section_index: int, index: int):
+        """
+        Finds the block where a ROI is stored in a section and the position of
+        the ROI in the block.
+
+        """
+        block_start = self._block_start[section_index]
+        block_index = np.searchsorted(block_start, index, side="right") - 1
+        section = self._sections[section_index][1]
+        block = section["blocks"][block_index]
+        local = index - block_start[block_index]
+        return (section_index, block_index), block, local
+
+    def _get_trace(self, section, block: dict, column: str, local: int) -> Optional[np.ndarray]:
+        if not self._get_array(section, block, "has_" + column)[local]:
+            return None
+        start, end = self._get_array(section, block, _POINT_OFFSET)[local:local + 2]
+        return np.array(self._get_array(section, block, column)[start:end])
+
+    def _get_patch_sections(self, column: str) -> List[int]:
+        # patches stored before the last section with the column are ignored
+        return [x for x in self._patch_sections[column] if x > self._column_section[column]]
+
+    def _apply_patch(self, section, block: dict, column: str, local: int, values: Optional[np.ndarray]):
+        start, end = self._get_array(section, block, _PATCH_OFFSET + column)[local:local + 2]
+        if (values is not None) and (end > start):
+            index = self._get_array(section, block, _PATCH_INDEX + column)[start:end]
+            values[index] = self._get_array(section, block, _PATCH_PREFIX + column)[start:end]
+
+    def _get_features(self, section, block: dict, local: int, roi: Roi):
+        if not self._get_array(section, block, "has_" + c.ROI_FEATURE_LIST)[local]:
+            return None
+        ft_class = roi._get_feature_type()
+        start, end = self._get_array(section, block, _FEATURE_OFFSET)[local:local + 2]
+        fields = block["feature_fields"]
+        columns = [self._get_array(section, block, _FEATURE_PREFIX + x)[start:end].tolist() for x in fields]
+        return [ft_class(roi=roi, **dict(zip(fields, values))) for values in zip(*columns)]
+
+    def _get_array(self, section, block: dict, name: str) -> np.ndarray:
+        key = section + (name,)
+        array = self._arrays.get(key)
+        if array is None:
+            path = self._sections[section[0]][0]
+            data = self._data.get(path)
+            if data is None:
+                data = np.memmap(path, dtype=np.uint8, mode="r")
+                self._data[path] = data
+            params = block["arrays"][name]
+            dtype = np.dtype(params["dtype"])
+            array = np.frombuffer(data, dtype=dtype, count=params["size"], offset=params["offset"])
+            self._arrays[key] = array
+        return array
+
+
+def write_roi_store(path: Union[str, Path], roi_list: Iterable[Roi]):
+    """
+    Stores ROI in a binary file.
+
+    ROI are consumed one at a time, and are written to disk in blocks, so
+    `roi_list` may be a generator.
+
+    Parameters
+    ----------
+    path : Path
+    roi_list : Iterable[Roi]
+
+    """
+    columns = [_INDEX, c.MODE] + list(ROI_COLUMNS)
+    _write_file(path, roi_list, columns, dict())
+
+
+def write_roi_sidecar(
+    path: Union[str, Path],
+    roi_list: Sequence[Roi],
+    columns: Sequence[str],
+    reference: Optional[Dict[str, Sequence[Optional[np.ndarray]]]] = None,
+):
+    """
+    Stores a subset of ROI attributes in a sidecar file.
+
+    Parameters
+    ----------
+    path : Path
+    roi_list : Sequence[Roi]
+        ROI stored in the ROI file, in the same order.
+    columns : Sequence[str]
+        ROI attributes to store. Valid values are ``"time"``, ``"spint"``,
+        ``"mz"``, ``"scan"``, ``"noise"``, ``"baseline"`` and ``"features"``.
+    reference : dict or None, default=None
+        Maps trace columns to the values of each ROI before they were
+        modified. Only the points where the ROI values are different from the
+        reference values are stored.
+
+    Raises
+    ------
+    ValueError : If an invalid column is used or if the size of a ROI trace
+    is different from the size of the reference.
+
+    """
+    if reference is None:
+        reference = dict()
+    for column in list(columns) + list(reference):
+        valid = TRACE_COLUMNS if column in reference else ROI_COLUMNS
+        if column not in valid:
+            msg = "{} is not a valid ROI column. Valid values are: {}".format(column, valid)
+            raise ValueError(msg)
+    _write_file(path, roi_list, list(columns), reference)
+
+
+def is_roi_store(path: Union[str, Path]) -> bool:
+    """
+    Checks if a file is a ROI binary file.
+
+    """
+    with open(path, "rb") as fin:
+        return fin.read(len(_MAGIC)) == _MAGIC
+
+
+def read_footer(path: Union[str, Path]) -> tuple[Dict, int]:
+    """
+    Reads the footer of a ROI binary file.
+
+    Parameters
+    ----------
+    path : Path
+
+    Returns
+    -------
+    footer : dict
+    size : int
+        File size.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a ROI binary file or was created with a different
+        version.
+
+    """
+    size_length = struct.calcsize(_FOOTER_SIZE_FORMAT)
+    trailer_length = size_length + len(_MAGIC)
+    with open(path, "rb") as fin:
+        magic = fin.read(len(_MAGIC))
+        fin.seek(0, 2)
+        size = fin.tell()
+        if (magic != _MAGIC) or (size < len(_MAGIC) + trailer_length):
+            msg = "{} is not a valid ROI file.".format(path)
+            raise ValueError(msg)
+        fin.seek(size - trailer_length)
+        footer_size = struct.unpack(_FOOTER_SIZE_FORMAT, fin.read(size_length))[0]
+        if fin.read(len(_MAGIC)) != _MAGIC:
+            msg = "{} is not a valid ROI file.".format(path)
+            raise ValueError(msg)
+        fin.seek(size - trailer_length - footer_size)
+        footer = json.loads(fin.read(footer_size).decode())
+    if footer.get("version") != _STORE_VERSION:
+        msg = "{} was created with a different version.".format(path)
+        raise ValueError(msg)
+    return footer, size
+
+
+def _write_file(
+    path: Union[str, Path],
+    roi_list: Iterable[Roi],
+    columns: List[str],
+    reference: Dict[str, Sequence[Optional[np.ndarray]]],
+):
+    path = Path(path)
+    # the file is written to a temporary file and then renamed, to prevent
+    # reading incomplete files.
+    tmp_path = path.with_name("{}.{}.tmp".format(path.name, getpid()))
+    try:
+        with open(tmp_path, "wb") as fout:
+            fout.write(_MAGIC)
+            section, n_roi = _write_section(fout, roi_list, columns, reference)
+            footer = {"version": _STORE_VERSION, "n_roi": n_roi, "sections": [section]}
+            _write_footer(fout, footer)
+        replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _write_section(
+    fout: BinaryIO,
+    roi_list: Iterable[Roi],
+    columns: List[str],
+    reference: Dict[str, Sequence[Optional[np.ndarray]]],
+) -> tuple[Dict, int]:
+    """
+    Writes the ROI attributes in `columns` and patches of the columns in
+    `reference` in blocks.
+
+    Returns
+    -------
+    section : dict
+        The location of the arrays in each block.
+    n_roi : int
+
+    """
+    section = {"columns": columns, "patch_columns": list(reference), "blocks": list()}
+    n_roi = 0
+    buffer = list()
+    buffer_size = 0
+    for roi in roi_list:
+        buffer.append(roi)
+        buffer_size += getattr(roi, c.TIME).size
+        if buffer_size >= _BLOCK_SIZE:
+            block_reference = {k: v[n_roi:n_roi + len(buffer)] for k, v in reference.items()}
+            section["blocks"].append(_write_block(fout, buffer, columns, block_reference))
+            n_roi += len(buffer)
+            buffer = list()
+            buffer_size = 0
+    if buffer or not section["blocks"]:
+        block_reference = {k: v[n_roi:n_roi + len(buffer)] for k, v in reference.items()}
+        section["blocks"].append(_write_block(fout, buffer, columns, block_reference))
+        n_roi += len(buffer)
+    return section, n_roi
+
+
+def _write_block(
+    fout: BinaryIO,
+    roi_list: List[Roi],
+    columns: List[str],
+    reference: Dict[str, Sequence[Optional[np.ndarray]]],
+) -> Dict:
+    """
+    Writes the arrays of a block of ROI.
+
+    """
+    block: Dict[str, Any] = {"size": len(roi_list), "arrays": dict()}
+    arrays = dict()
+    if _INDEX in columns:
+        arrays[_INDEX] = np.array([roi.index for roi in roi_list], dtype=int)
+
+    if c.MODE in columns:
+        modes = [getattr(roi, c.MODE) for roi in roi_list]
+        block["modes"] = sorted(set(modes), key=str)
+        code = {x: k for k, x in enumerate(block["modes"])}
+        arrays["mode_code"] = np.array([code[x] for x in modes], dtype=np.uint8)
+
+    trace_columns = [x for x in columns if x in TRACE_COLUMNS]
+    if trace_columns:
+        length = [getattr(roi, c.TIME).size for roi in roi_list]
+        arrays[_POINT_OFFSET] = np.cumsum([0] + length)
+        for column in trace_columns:
+            values = [getattr(roi, column) for roi in roi_list]
+            has_values = np.array([x is not None for x in values], dtype=bool)
+            arrays["has_" + column] = has_values
+            if has_values.any():
+                dtype = np.result_type(*[x for x in values if x is not None])
+                values = [np.zeros(n, dtype=dtype) if x is None else x for x, n in zip(values, length)]
+                arrays[column] = np.hstack(values).astype(dtype, copy=False)
+
+    if c.ROI_FEATURE_LIST in columns:
+        features = [roi.features for roi in roi_list]
+        arrays["has_" + c.ROI_FEATURE_LIST] = np.array([x is not None for x in features], dtype=bool)
+        records = [json.loads(ft.to_str()) for x in features if x is not None for ft in x]
+        n_features = [0 if x is None else len(x) for x in features]
+        arrays[_FEATURE_OFFSET] = np.cumsum([0] + n_features)
+        fields = list(records[0]) if records else list()
+        block["feature_fields"] = fields
+        for field in fields:
+            values = np.array([x[field] for x in records])
+            # object or string arrays cannot be stored as raw binary data
+            if values.dtype.kind not in "biuf":
+                msg = "The values of the feature field {} must be numeric, got {}."
+                raise ValueError(msg.format(field, values.dtype))
+            arrays[_FEATURE_PREFIX + field] = values
+
+    for column, reference_values in reference.items():
+        n_patch = list()
+        patch_index = [np.array([], dtype=int)]
+        patch_values = [np.array([])]
+        for roi, ref in zip(roi_list, reference_values):
+            values = getattr(roi, column)
+            if (values is None) or (ref is None):
+                n_patch.append(0)
+                continue
+            if values.shape != ref.shape:
+                msg = "The size of the {} values of ROI {} were modified.".format(column, roi.index)
+                raise ValueError(msg)
+            changed = np.where((values != ref) & ~(np.isnan(values) & np.isnan(ref)))[0]
+            n_patch.append(changed.size)
+            patch_index.append(changed)
+            patch_values.append(values[changed])
+        arrays[_PATCH_OFFSET + column] = np.cumsum([0] + n_patch)
+        arrays[_PATCH_INDEX + column] = np.hstack(patch_index)
+        arrays[_PATCH_PREFIX + column] = np.hstack(patch_values)
+
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        offset = _align(fout.tell())
+        fout.seek(offset)
+        fout.write(array.data)
+        block["arrays"][name] = {"dtype": array.dtype.str, "size": array.size, "offset": offset}
+    return block
+
+
+def _write_footer(fout: BinaryIO, footer: Dict):
+    footer_bytes = json.dumps(footer).encode()
+    fout.write(footer_bytes)
+    fout.write(struct.pack(_FOOTER_SIZE_FORMAT, len(footer_bytes)))
+    fout.write(_MAGIC)
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
@@ -7,14 +7,15 @@ from joblib import Parallel, delayed
 from pathlib import Path
 import os
 from uuid import uuid4
-from typing import Callable, List, Optional, Tuple, Union
+from typing import Callable, Iterable, List, Optional, Tuple, Union
 from . import _constants as c
 from . import validation as val
 from . import raw_data_utils
+from . import _roi_store
 from .container import DataContainer
 from .correspondence import match_features
 from .fileio import MSData, read_pickle
-from .lcms import Feature, Roi, LCTrace
+from .lcms import Feature, Roi, LCTrace, extract_features_batch
 from .utils import get_progress_bar
 from ._plot_bokeh import _LCAssayPlotter
 from .fill_missing import fill_missing_lc
@@ -24,6 +25,9 @@ from .annotation import annotate, create_annotation_table, create_annotation_too
 import copy
 import tempfile
 
+# preprocessing steps that store values computed from the ROI in sidecar files
+_ROI_SIDECAR_STEPS = (c.EXTRACT_FEATURES, c.DESCRIBE_FEATURES)
+
 # TODO: add id_ column to sample metadata
 # TODO: add make_roi params to each column in sample metadata for cases where
 #   more than one sample are obtained from the same file.
@@ -225,7 +229,7 @@ class Assay:
         if callable(strategy):
             func = strategy
         elif strategy == "default":
-            func = raw_data_utils.make_roi
+            func = raw_data_utils.make_roi_iterator
         else:
             msg = "{} is not a valid strategy.".format(strategy)
             raise ValueError(msg)
@@ -289,15 +293,19 @@ class Assay:
             temp = copy.deepcopy(self.manager.params["MSData"])
             if "data_import_mode" in temp:
                 temp.pop("data_import_mode")
+            index_cache_dir = self.manager.assay_path.joinpath(c.INDEX_DIR)
             if self.data_import_mode.lower() == c.MEMORY:
-                ms_data = MSData.create_MSData_instance(data_import_mode=c.MEMORY, path=sample_path, **temp)
+                ms_data = MSData.create_MSData_instance(data_import_mode=c.MEMORY, path=sample_path, index_cache_dir=index_cache_dir, **temp)
             elif self.data_import_mode.lower() == c.INFILE:
                 path = Path(sample_path)
                 suffix = path.suffix
                 if suffix == "":
                     ms_data = MSData.create_MSData_instance(data_import_mode=c.SIMULATED, path=sample_path, **temp)
                 else:
-                    ms_data = MSData.create_MSData_instance(data_import_mode=c.INFILE, path=sample_path, **temp)
+                    ms_data = MSData.create_MSData_instance(data_import_mode=c.INFILE, path=sample_path, index_cache_dir=index_cache_dir, **temp)
+            elif self.data_import_mode.lower() == c.BINARY:
+                binary_dir = self.manager.assay_path.joinpath(c.BINARY_DIR)
+                ms_data = MSData.create_MSData_instance(data_import_mode=c.BINARY, path=sample_path, binary_dir=binary_dir, index_cache_dir=index_cache_dir, **temp)
             elif self.data_import_mode.lower() == c.SIMULATED:
                 ms_data = MSData.create_MSData_instance(data_import_mode=c.SIMULATED, path=sample_path, **temp)
 
@@ -362,16 +370,11 @@ class Assay:
         else:
             roi_class = Roi
 
-        with open(roi_path, "r", newline="\n") as fin:
-            header = fin.readline()
-            index_offset = int(header.split("=")[-1])
-            fin.seek(index_offset)
-            json_str = fin.read()
-            index = json.loads(json_str)
-            offset, length = index[roi_index]
-            fin.seek(offset)
-            s = fin.read(length)
-            roi = roi_class.from_string(s)
+        if _roi_store.is_roi_store(roi_path):
+            sidecars = self.manager.get_roi_sidecar_paths(sample)
+            roi = _roi_store.RoiStoreReader(roi_path, sidecars).load_roi(roi_index, roi_class)
+        else:
+            roi = _load_roi_text(roi_path, roi_index, roi_class)
         return roi
 
     def load_roi_list(self, sample: str) -> List[Roi]:
@@ -410,18 +413,11 @@ class Assay:
         else:
             roi_class = Roi
 
-        with open(roi_path, "r", newline="\n") as fin:
-            header = fin.readline()
-            index_offset = int(header.split("=")[-1])
-            fin.seek(index_offset)
-            index = json.loads(fin.read())
-
-            roi_list = list()
-            for offset, length in index:
-                fin.seek(offset)
-                s = fin.read(length)
-                roi = roi_class.from_string(s)
-                roi_list.append(roi)
+        if _roi_store.is_roi_store(roi_path):
+            sidecars = self.manager.get_roi_sidecar_paths(sample)
+            roi_list = _roi_store.RoiStoreReader(roi_path, sidecars).load_roi_list(roi_class)
+        else:
+            roi_list = _load_roi_list_text(roi_path, roi_class)
         return roi_list
 
     def load_features(self, sample: str) -> pd.DataFrame:
@@ -473,13 +469,14 @@ class Assay:
         ----------
         strategy : str or callable, default="default"
             If ``default`` is used, then
-            :py:meth:`tidyms.raw_data_utils.make_roi` is used to build ROIs in
-            each sample. A function can be passed to customize the detection
+            :py:meth:`tidyms.raw_data_utils.make_roi_iterator` is used to
+            build ROIs in each sample. ROIs are written to disk as soon as they
+            are completed. A function can be passed to customize the detection
             process. The following template must be used:
 
             .. code-block:: python
 
-                def func(ms_data: MSData, **kwargs) -> List[Roi]:
+                def func(ms_data: MSData, **kwargs) -> Iterable[Roi]:
                     ...
 
         n_jobs: int or None, default=None
@@ -516,8 +513,15 @@ class Assay:
 
             def worker(args):
                 roi_path, ms_data = args
-                roi_list = detect_features_func(ms_data, **kwargs)
-                _save_roi_list(roi_path, roi_list)
+                try:
+                    # ROI are written as they are created if the strategy
+                    # returns an iterator
+                    roi_list = detect_features_func(ms_data, **kwargs)
+                    _save_roi_list(roi_path, roi_list)
+                finally:
+                    # release file handles held by the worker
+                    if isinstance(ms_data, MSData):
+                        ms_data.close()
 
             worker = delayed(worker)
             iterator = iter_func(process_samples)
@@ -583,6 +587,8 @@ class Assay:
 
         """
         extract_features_func = self._get_feature_extraction_strategy(strategy)
+        # LC ROI are processed in batch using the default strategy
+        use_batch = (extract_features_func is _extract_features_default) and (self.separation in c.LC_MODES)
         process_samples = self.manager.sample_queue
         n_samples = len(process_samples)
 
@@ -592,16 +598,28 @@ class Assay:
         if n_samples:
 
             def iterator():
-                for sample in self.manager.get_sample_names():
+                for sample in process_samples:
                     roi_path = self.manager.get_roi_path(sample)
+                    sidecar_path = self.manager.get_roi_sidecar_path(sample, c.EXTRACT_FEATURES)
                     roi_list = self.load_roi_list(sample)
-                    yield roi_path, roi_list
+                    _convert_roi_text_file(roi_path, roi_list)
+                    yield sidecar_path, roi_list
 
             def worker(args):
-                roi_path, roi_list = args
-                for roi in roi_list:
-                    extract_features_func(roi, **kwargs)
-                _save_roi_list(roi_path, roi_list)
+                sidecar_path, roi_list = args
+                # changes to the intensity and m/z, e.g. filling missing
+                # values, are stored as patches of the values in the ROI file
+                reference = {
+                    c.SPINT: [roi.spint.copy() for roi in roi_list],
+                    c.MZ: [None if roi.mz is None else roi.mz.copy() for roi in roi_list],
+                }
+                if use_batch:
+                    extract_features_batch(roi_list, **kwargs)
+                else:
+                    for roi in roi_list:
+                        extract_features_func(roi, **kwargs)
+                columns = [c.NOISE, c.BASELINE, c.ROI_FEATURE_LIST]
+                _roi_store.write_roi_sidecar(sidecar_path, roi_list, columns, reference)
 
             worker = delayed(worker)
             iterator = iterator()
@@ -676,16 +694,19 @@ class Assay:
         if n_samples:
 
             def iterator():
-                for sample in self.manager.get_sample_names():
+                for sample in process_samples:
                     roi_path = self.manager.get_roi_path(sample)
+                    sidecar_path = self.manager.get_roi_sidecar_path(sample, c.DESCRIBE_FEATURES)
                     ft_path = self.manager.get_feature_path(sample)
                     roi_list = self.load_roi_list(sample)
-                    yield roi_path, ft_path, roi_list
+                    _convert_roi_text_file(roi_path, roi_list)
+                    yield sidecar_path, ft_path, roi_list
 
             def worker(args):
-                roi_path, ft_path, roi_list = args
+                sidecar_path, ft_path, roi_list = args
                 ft_table = _describe_features_default(roi_list, custom_descriptors, filters)
-                _save_roi_list(roi_path, roi_list)
+                # only the filtered features are stored
+                _roi_store.write_roi_sidecar(sidecar_path, roi_list, [c.ROI_FEATURE_LIST])
                 ft_table.to_pickle(ft_path)
 
             worker = delayed(worker)
@@ -892,7 +913,7 @@ class Assay:
             #         ft_table.to_pickle(ft_path)
             #         print(sample)
             def iterator():
-                for sample in self.manager.get_sample_names():
+                for sample in process_samples:
                     ft_path = self.manager.get_feature_path(sample)
                     roi_list = self.load_roi_list(sample)
                     ft_table = self.load_features(sample)
@@ -1146,6 +1167,14 @@ class _AssayManager:
         ft_dir_path = self.assay_path.joinpath(c.FT_DIR)
         ft_dir_path.mkdir()
 
+        # mzML index sidecar files dir
+        index_dir_path = self.assay_path.joinpath(c.INDEX_DIR)
+        index_dir_path.mkdir()
+
+        # binary raw data files dir
+        binary_dir_path = self.assay_path.joinpath(c.BINARY_DIR)
+        binary_dir_path.mkdir()
+
     def check_step(self, step: str):
         """
         Checks if the previous required preprocessing steps were executed
@@ -1205,11 +1234,18 @@ class _AssayManager:
                 path = self.get_roi_path(sample)
                 if sample not in self._virtual_MSData_objects:
                     path.unlink(missing_ok=True)
+        elif step == c.EXTRACT_FEATURES:
+            for sample in samples:
+                path = self.get_roi_sidecar_path(sample, step)
+                if sample not in self._virtual_MSData_objects:
+                    path.unlink(missing_ok=True)
         elif step == c.DESCRIBE_FEATURES:
             for sample in samples:
                 path = self.get_feature_path(sample)
+                sidecar_path = self.get_roi_sidecar_path(sample, step)
                 if sample not in self._virtual_MSData_objects:
                     path.unlink(missing_ok=True)
+                    sidecar_path.unlink(missing_ok=True)
         elif step == c.BUILD_FEATURE_TABLE:
             if samples:
                 file_name = c.FT_TABLE_FILENAME
@@ -1243,6 +1279,17 @@ class _AssayManager:
         roi_path = self.assay_path.joinpath(c.ROI_DIR, sampleNameFromPath)
         return roi_path
 
+    def get_roi_sidecar_path(self, name: str, step: str) -> Path:
+        # values computed from the ROI in a preprocessing step are stored in
+        # a sidecar file next to the ROI file
+        roi_path = self.get_roi_path(name)
+        return roi_path.with_name("{}.{}".format(roi_path.name, step))
+
+    def get_roi_sidecar_paths(self, name: str) -> List[Path]:
+        # existing sidecar files, sorted by preprocessing step
+        paths = [self.get_roi_sidecar_path(name, x) for x in _ROI_SIDECAR_STEPS]
+        return [x for x in paths if x.is_file()]
+
     def get_feature_path(self, name: str) -> Path:
         self._check_sample_name(name)
         sampleNameFromPath = self.get_sample_path(name)
@@ -1674,27 +1721,49 @@ def _get_path_list(path: Union[str, List[str], Path]) -> List[Path]:
     return path_list
 
 
-def _save_roi_list(roi_path: Path, roi_list: List[Roi]):
-    header_template = "index_offset={:020d}\n"
-    # the dummy header is used as a placeholder to fill with the correct offset
-    # value after all ROI have been serialized
-    with open(roi_path, "w", newline="\n") as fin:
-        dummy_header = header_template.format(1)
-        fin.write(dummy_header)
-        offset = len(dummy_header)
-        index = list()
-        for roi in roi_list:
-            serialized_roi = roi.to_string() + "\n"
-            length = len(serialized_roi)
-            index.append([offset, length])
-            offset += len(serialized_roi)
-            fin.write(serialized_roi)
-        # write index
-        fin.write(json.dumps(index))
-        fin.seek(0)
-        # update header offset
-        header = header_template.format(offset)
-        fin.write(header)
+def _save_roi_list(roi_path: Path, roi_list: Iterable[Roi]):
+    # ROI are consumed one at a time, so roi_list may be a generator
+    _roi_store.write_roi_store(roi_path, roi_list)
+
+
+def _convert_roi_text_file(roi_path: Path, roi_list: List[Roi]):
+    # ROI files created with previous versions are converted to the binary
+    # format, required to store values in sidecar files.
+    if not _roi_store.is_roi_store(roi_path):
+        _save_roi_list(roi_path, roi_list)
+
+
+def _load_roi_text(roi_path: Path, roi_index: int, roi_class) -> Roi:
+    # loads a ROI from files created with previous versions, where each ROI is
+    # stored as a JSON string.
+    with open(roi_path, "r", newline="\n") as fin:
+        header = fin.readline()
+        index_offset = int(header.split("=")[-1])
+        fin.seek(index_offset)
+        json_str = fin.read()
+        index = json.loads(json_str)
+        offset, length = index[roi_index]
+        fin.seek(offset)
+        s = fin.read(length)
+        roi = roi_class.from_string(s)
+    return roi
+
+
+def _load_roi_list_text(roi_path: Path, roi_class) -> List[Roi]:
+    # loads all ROI from files created with previous versions.
+    with open(roi_path, "r", newline="\n") as fin:
+        header = fin.readline()
+        index_offset = int(header.split("=")[-1])
+        fin.seek(index_offset)
+        index = json.loads(fin.read())
+
+        roi_list = list()
+        for offset, length in index:
+            fin.seek(offset)
+            s = fin.read(length)
+            roi = roi_class.from_string(s)
+            roi_list.append(roi)
+    return roi_list
 
 
 def compare_dict(d1: Optional[dict], d2: Optional[dict]) -> bool:
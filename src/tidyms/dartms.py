@@ -78,7 +78,7 @@ __tidyMSdartmsVersion__ = "0.9.0"
 # Imports
 #
 
-from . import fileio, _constants
+from . import fileio, raw_data_utils, _constants
 from . import assay as Assay
 from .chem.formula import Formula
 
@@ -91,6 +91,7 @@ import math
 import scipy
 
 import tqdm
+import joblib
 import natsort
 import os
 from pathlib import Path
@@ -187,6 +188,92 @@ def _add_row_to_pandas_creation_dictionary(dict=None, **kwargs):
     return dict
 
 
+def _get_original_data_feature_windows(msDataObj, featuresMZMin, featuresMZMax, mz_deviation_multiplier_PPM):
+    """
+    Generates the m/z windows of the features in each original spectrum of a sample
+
+    Parameters
+    ----------
+    msDataObj : MSData
+        the sample, with the original spectra in msDataObj.original_MSData_object
+    featuresMZMin : numpy.ndarray
+        the lower m/z bound of each feature
+    featuresMZMax : numpy.ndarray
+        the upper m/z bound of each feature
+    mz_deviation_multiplier_PPM : float
+        the allowed mz deviation added to the windows
+
+    Returns
+    -------
+    list of (original_mz, spint, mzmin, mzmax)
+        the uncorrected m/z values and intensities of each spectrum, and the reverse corrected feature windows
+    """
+    spectra = []
+    for oSpectrumi, oSpectrum in msDataObj.original_MSData_object.get_spectra_iterator():
+        _mzmin = oSpectrum.reverseMZ(featuresMZMin) * (1.0 - mz_deviation_multiplier_PPM / 1e6)
+        _mzmax = oSpectrum.reverseMZ(featuresMZMax) * (1.0 + mz_deviation_multiplier_PPM / 1e6)
+        spectra.append((oSpectrum.original_mz, oSpectrum.spint, _mzmin, _mzmax))
+    return spectra
+
+
+def _integrate_original_data(spectra, n_features, aggregation_fun):
+    """
+    Integrates the raw-data of a sample in the m/z windows of the features
+
+    Parameters
+    ----------
+    spectra : list of (original_mz, spint, mzmin, mzmax)
+        the spectra and feature windows generated by _get_original_data_feature_windows
+    n_features : int
+        the number of features
+    aggregation_fun : str
+        the method to calculate the derived abundance, either of ['average', 'sum', 'max']
+
+    Returns
+    -------
+    numpy.ndarray
+        the abundance of each feature, nan if no signal is found in its windows
+    """
+    featureInds = []
+    values = []
+    for mz, spint, _mzmin, _mzmax in spectra:
+        ## signals in the window [mzmin, mzmax] of each feature are found in the sorted m/z values
+        order = np.argsort(mz, kind="stable")
+        sortedMZ = mz[order]
+        starts = np.searchsorted(sortedMZ, _mzmin, side="left")
+        ends = np.searchsorted(sortedMZ, _mzmax, side="right")
+        counts = np.maximum(ends - starts, 0)
+        counts[np.isnan(_mzmin) | np.isnan(_mzmax)] = 0
+        offsets = np.cumsum(counts) - counts
+        spectrumFeatureInds = np.repeat(np.arange(n_features), counts)
+        signalInds = order[np.repeat(starts - offsets, counts) + np.arange(counts.sum())]
+        ## signals of each feature are used in the order of the spectrum
+        sortInds = np.lexsort((signalInds, spectrumFeatureInds))
+        featureInds.append(spectrumFeatureInds[sortInds])
+        values.append(np.asarray(spint[signalInds[sortInds]], dtype=float))
+
+    row = np.full(n_features, np.nan)
+    if len(featureInds) == 0:
+        return row
+    featureInds = np.concatenate(featureInds)
+    values = np.concatenate(values)
+    ## values of each feature are concatenated in the order of the spectra
+    sortInds = np.argsort(featureInds, kind="stable")
+    values = values[sortInds]
+    counts = np.bincount(featureInds, minlength=n_features)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    for featurei in np.flatnonzero(counts):
+        s = values[starts[featurei] : ends[featurei]]
+        if aggregation_fun.lower() == "average".lower():
+            row[featurei] = np.average(s)
+        elif aggregation_fun.lower() == "sum".lower():
+            row[featurei] = np.sum(s)
+        elif aggregation_fun.lower() == "max".lower():
+            row[featurei] = np.max(s)
+    return row
+
+
 global _average_and_std
 
 
@@ -1790,11 +1877,12 @@ class DartMSAssay:
                 "       .. no spots defined for file. Spots will be detected automatically, but not used for now. Please modify the spots file '%s' to include or modify them"
                 % (spotsFile)
             )
-            ticInts = [sum(msData.get_spectrum(i).spint) for i in range(msData.get_n_spectra())]
+            ticInts = msData.get_scan_table()["tic"].to_numpy()
+            times = msData.get_times()
             startInd = None
             endInd = None
             for i, inte in enumerate(ticInts):
-                time = msData.get_spectrum(i).time
+                time = times[i]
                 if inte >= intensityThreshold and time >= startTime_seconds and time <= endTime_seconds:
                     if startInd is None:
                         startInd = i
@@ -1805,7 +1893,7 @@ class DartMSAssay:
                         # spots are not automatically added
                         logging.info(
                             "       .. found new automatically detected spot from %.2f to %.2f seconds"
-                            % (msData.get_spectrum(startInd).time, msData.get_spectrum(endInd).time)
+                            % (times[startInd], times[endInd])
                         )
                         separationInds.append((startInd, endInd, "Spot_%d" % len(separationInds), "unknown", "unknown", 1))
                         startInd = None
@@ -1816,7 +1904,7 @@ class DartMSAssay:
                 # spots are not automatically added
                 logging.info(
                     "       .. found new automatically detected spot from %.2f to %.2f seconds"
-                    % (msData.get_spectrum(startInd).time, msData.get_spectrum(endInd).time)
+                    % (times[startInd], times[endInd])
                 )
                 separationInds.append((startInd, endInd, "Spot_%d" % len(separationInds), "unknown", "unknown", 1))
 
@@ -1830,8 +1918,8 @@ class DartMSAssay:
                         "group": [spot[3]],
                         "class": [spot[4]],
                         "batch": [spot[5]],
-                        "startRT_seconds": [msData.get_spectrum(spot[0]).time],
-                        "endRT_seconds": [msData.get_spectrum(spot[1]).time],
+                        "startRT_seconds": [times[spot[0]]],
+                        "endRT_seconds": [times[spot[1]]],
                         "comment": [
                             "spot automatically extracted by _get_separate_chronogram_indices(msData, '%s', intensityThreshold = %f, startTime_seconds = %f, endTime_seconds = %f)"
                             % (msData_ID, intensityThreshold, startTime_seconds, endTime_seconds)
@@ -1874,7 +1962,10 @@ class DartMSAssay:
             def fileNameChangeFunction(x):
                 return x
 
+        times = msData.get_times()
         for subseti, _ in enumerate(sepInds):
+            startRT = times[sepInds[subseti][0]]
+            endRT = times[sepInds[subseti][1]]
             subset_name = fileNameChangeFunction("VIRTUAL(%s::%s)" % (os.path.splitext(os.path.basename(filename))[0], sepInds[subseti][2]))
             logging.info(
                 "       .. adding subset %4d with name '%35s' (group '%s', class '%s'), width %6.1f sec, RTs %6.1f - %6.1f"
@@ -1883,9 +1974,9 @@ class DartMSAssay:
                     subset_name,
                     sepInds[subseti][3],
                     sepInds[subseti][4],
-                    msData.get_spectrum(sepInds[subseti][1]).time - msData.get_spectrum(sepInds[subseti][0]).time,
-                    msData.get_spectrum(sepInds[subseti][0]).time,
-                    msData.get_spectrum(sepInds[subseti][1]).time,
+                    endRT - startRT,
+                    startRT,
+                    endRT,
                 )
             )
             subset = fileio.MSData_Proxy(DartMSAssay._subset_MSData_chronogram(msData, sepInds[subseti][0], sepInds[subseti][1]))
@@ -1901,9 +1992,9 @@ class DartMSAssay:
                         "batch": sepInds[subseti][5],
                         "basefile": [os.path.splitext(os.path.basename(filename))[0]],
                         "extracted_spectra_indices": [
-                            "%.2f - %.2f seconds" % (msData.get_spectrum(sepInds[subseti][0]).time, msData.get_spectrum(sepInds[subseti][1]).time)
+                            "%.2f - %.2f seconds" % (startRT, endRT)
                         ],
-                        "spotwidth_seconds": [msData.get_spectrum(sepInds[subseti][1]).time - msData.get_spectrum(sepInds[subseti][0]).time],
+                        "spotwidth_seconds": [endRT - startRT],
                     }
                 ),
             )
@@ -2259,12 +2350,7 @@ class DartMSAssay:
 
             if centroid_profileMode and ms_mode == "profile":
                 logging.info("       .. centroiding")
-                for k, spectrum in msData.get_spectra_iterator():
-                    mzs, intensities = spectrum.find_centroids()
-
-                    spectrum.mz = mzs
-                    spectrum.spint = intensities
-                    spectrum.centroid = True
+                msData = raw_data_utils.centroid_ms_data(msData)
 
             if use_signal_function is not None:
                 for spectrumi, spectrum in msData.get_spectra_iterator():
@@ -2310,11 +2396,7 @@ class DartMSAssay:
             sampleObjNew = fileio.MSData_in_memory.generate_from_MSData_object(msDataObj)
             ordInte = np.argsort(np.array(totalInt))
             ordInte = ordInte[0 : math.floor(sampleObjNew.get_n_spectra() * drop_rate)]
-            ordInte = np.sort(ordInte)[::-1]
-            c = 0
-            while c < ordInte.shape[0] and msDataObj.get_n_spectra() > 0:
-                sampleObjNew.delete_spectrum(ordInte[c])
-                c = c + 1
+            sampleObjNew.delete_spectra(ordInte)
             msDataObj.to_MSData_object = sampleObjNew
 
     def select_top_n_spectra(self, n):
@@ -2338,11 +2420,7 @@ class DartMSAssay:
                 sampleObjNew = fileio.MSData_in_memory.generate_from_MSData_object(msDataObj)
                 ordInte = np.argsort(np.array(tic))
                 ordInte = ordInte[0 : ordInte.shape[0] - n]
-                ordInte = np.sort(ordInte)[::-1]
-                c = 0
-                while c < ordInte.shape[0] and msDataObj.get_n_spectra() > 0:
-                    sampleObjNew.delete_spectrum(ordInte[c])
-                    c = c + 1
+                sampleObjNew.delete_spectra(ordInte)
                 msDataObj.to_MSData_object = sampleObjNew
 
                 # tic = []
@@ -3462,7 +3540,7 @@ class DartMSAssay:
     # This setp also automatically re-integrates the results
     #
 
-    def build_data_matrix(self, on="originalData", originalData_mz_deviation_multiplier_PPM=0, aggregation_fun="average"):
+    def build_data_matrix(self, on="originalData", originalData_mz_deviation_multiplier_PPM=0, aggregation_fun="average", n_jobs=None):
         """
         generates a data matrix from corrected, consensus spectra and bracketed features
 
@@ -3474,6 +3552,8 @@ class DartMSAssay:
             an optional mz deviation allowed for the raw-data integration. Defaults to 0.
         aggregation_fun : str, optional
             the method to calculate the derived abundance on integration of raw data. Defaults to "average".
+        n_jobs : int, optional
+            the number of samples integrated in parallel with 'originalData'. None means 1 unless in a joblib.parallel_backend context. Defaults to None.
 
         Raises
         ======
@@ -3493,41 +3573,34 @@ class DartMSAssay:
         sampleNamesToRowI = dict(((sample, i) for i, sample in enumerate(sampleNames)))
 
         dataMatrix = np.zeros((len(sampleNames), len(self.features)))
-        for samplei, sample in tqdm.tqdm(enumerate(sampleNames), total=len(sampleNames), desc="data matrix: gathering data"):
-            msDataObj = self.get_msDataObj_for_sample(sample)
-            spectrum = msDataObj.get_spectrum(0)
+        if on.lower() == "processedData".lower():
+            for samplei, sample in tqdm.tqdm(enumerate(sampleNames), total=len(sampleNames), desc="data matrix: gathering data"):
+                msDataObj = self.get_msDataObj_for_sample(sample)
+                spectrum = msDataObj.get_spectrum(0)
 
-            for braci, (mzmin, mzmean, mzmax, _) in enumerate(self.features):
-                if on.lower() == "processedData".lower():
+                for braci, (mzmin, mzmean, mzmax, _) in enumerate(self.features):
                     use = np.logical_and(spectrum.mz >= mzmin, spectrum.mz <= mzmax)
                     if np.sum(use) > 0:
                         dataMatrix[sampleNamesToRowI[sample], braci] = np.sum(spectrum.spint[use])
                     else:
                         dataMatrix[sampleNamesToRowI[sample], braci] = np.nan
 
-                elif on.lower() == "originalData".lower():
-                    s = np.array(())
-                    for oSpectrumi, oSpectrum in msDataObj.original_MSData_object.get_spectra_iterator():
-                        _mzmin, _mzmean, _mzmax = oSpectrum.reverseMZ(mzmin), oSpectrum.reverseMZ(mzmean), oSpectrum.reverseMZ(mzmax)
-                        _mzmin, _mzmax = _mzmin * (1.0 - originalData_mz_deviation_multiplier_PPM / 1e6), _mzmax * (
-                            1.0 + originalData_mz_deviation_multiplier_PPM / 1e6
-                        )
-
-                        use = np.logical_and(oSpectrum.original_mz >= _mzmin, oSpectrum.original_mz <= _mzmax)
-                        if np.sum(use) > 0:
-                            s = np.concatenate((s, oSpectrum.spint[use]))
-
-                    if s.shape[0] > 0:
-                        if aggregation_fun.lower() == "average".lower():
-                            s = np.average(s)
-                        elif aggregation_fun.lower() == "sum".lower():
-                            s = np.sum(s)
-                        elif aggregation_fun.lower() == "max".lower():
-                            s = np.max(s)
-                        dataMatrix[sampleNamesToRowI[sample], braci] = s
-
-                    else:
-                        dataMatrix[sampleNamesToRowI[sample], braci] = np.nan
+        elif on.lower() == "originalData".lower():
+            ## the m/z windows of all features are searched at once in each original spectrum, samples are processed in parallel
+            featuresMZMin = np.array([feature[0] for feature in self.features], dtype=float)
+            featuresMZMax = np.array([feature[2] for feature in self.features], dtype=float)
+            sampleSpectra = (
+                _get_original_data_feature_windows(
+                    self.get_msDataObj_for_sample(sample), featuresMZMin, featuresMZMax, originalData_mz_deviation_multiplier_PPM
+                )
+                for sample in sampleNames
+            )
+            rows = joblib.Parallel(n_jobs=n_jobs)(
+                joblib.delayed(_integrate_original_data)(spectra, len(self.features), aggregation_fun)
+                for spectra in tqdm.tqdm(sampleSpectra, total=len(sampleNames), desc="data matrix: gathering data")
+            )
+            for sample, row in zip(sampleNames, rows):
+                dataMatrix[sampleNamesToRowI[sample], :] = row
 
         self.samples = sampleNames
         self.groups = [self.get_metaData_for_sample(sample, "group") for sample in self.samples]
@@ -29,16 +29,25 @@ import pickle
 import requests
 import abc
 import copy
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from typing import BinaryIO, Generator, List, Optional, TextIO, Tuple, Union
+from typing import (
+    BinaryIO, Dict, Generator, Iterable, List, Optional, TextIO, Tuple, Union
+)
 from .container import DataContainer
 from . import _constants as c
 from . import lcms
 from . import validation as v
 from .utils import get_tidyms_path, gaussian_mixture
-from ._mzml import MZMLReader
+from ._mzml import MZMLReader, SCAN_TABLE_COLUMNS, _get_file_key
+from ._peak_index import PeakIndex
+from ._msbinary import (
+    BINARY_SUFFIX, MSBinaryReader, get_binary_path, load_source_key,
+    write_ms_binary
+)
 
 # TODO: test read_pickle valid file
 # TODO: delete read_data_matrix function
@@ -305,8 +314,10 @@ class MSData:
             return MSData_from_file(*args, **kwargs)
         elif data_import_mode.lower() == c.MEMORY:
             return MSData_in_memory.generate_from_file(*args, **kwargs)
+        elif data_import_mode.lower() == c.BINARY:
+            return MSData_from_binary.generate_from_file(*args, **kwargs)
 
-        raise Exception("Unknown data_import_mode parameter '%s'. Must be either 'file', 'memory', 'simulated'"%(data_import_mode))
+        raise Exception("Unknown data_import_mode parameter '%s'. Must be either 'file', 'memory', 'binary', 'simulated'"%(data_import_mode))
 
     @abc.abstractmethod
     def __init__(self, 
@@ -319,6 +330,7 @@ class MSData:
         self.instrument = instrument
         self.separation = separation
         self._is_virtual_sample = is_virtual_sample
+        self._peak_index: Dict[int, PeakIndex] = dict()
 
     @property
     def ms_mode(self) -> str:
@@ -365,6 +377,21 @@ class MSData:
     def is_virtual_sample(self, value: bool):
         raise ValueError("Cannot change sample virtuallity after creation.")
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Releases the resources, such as file handles, used to read the data.
+        Data can still be accessed after calling this method, as resources are
+        acquired again if needed.
+
+        """
+        pass
+
     @abc.abstractmethod
     def get_n_chromatograms(self) -> int:
         """
@@ -423,6 +450,103 @@ class MSData:
         """
         pass
 
+    def get_spectra(
+        self,
+        indices: Iterable[int],
+        prefetch: int = 0
+    ) -> List[lcms.MSSpectrum]:
+        """
+        Get several spectra stored in the file.
+
+        Each spectrum is read once, in increasing scan order, so data stored
+        on disk is read sequentially.
+
+        Parameters
+        ----------
+        indices : Iterable[int]
+            scan numbers. May contain repeated values.
+        prefetch : int, default=0
+            Number of spectra decoded in advance using a pool of threads. See
+            `get_spectra_iterator`.
+
+        Returns
+        -------
+        List[MSSpectrum]
+            Spectra in the same order as `indices`.
+
+        """
+        indices = np.asarray(indices, dtype=int)
+        scans, inverse = np.unique(indices, return_inverse=True)
+        unique_spectra = [
+            sp for _, sp in self._iterate_spectra(scans.tolist(), prefetch)
+        ]
+        return [unique_spectra[k] for k in inverse.ravel()]
+
+    def get_times(self) -> np.ndarray:
+        """
+        Get the acquisition time of each spectrum.
+
+        Returns
+        -------
+        array
+            Time of each spectrum, in seconds. ``NaN`` if it is not available.
+
+        """
+        time, _ = self._get_scan_metadata()
+        return np.array(time, dtype=float)
+
+    def get_peak_index(self, ms_level: int = 1, rebuild: bool = False) -> PeakIndex:
+        """
+        Get an index of the signals in the data, used to search signals in a
+        m/z and time region.
+
+        The index is built the first time it is requested for a given ms
+        level and it is stored in the object.
+
+        Parameters
+        ----------
+        ms_level : int, default=1
+            Use data from this ms level.
+        rebuild : bool, default=False
+            If ``True``, the index is built again. Must be used if the spectra
+            were modified after the index was created.
+
+        Returns
+        -------
+        PeakIndex
+            Centroids of all spectra sorted by m/z. Spectra in profile mode
+            are centroided using :meth:`MSSpectrum.find_centroids`.
+
+        """
+        if rebuild or (ms_level not in self._peak_index):
+            sp_iterator = self.get_spectra_iterator(ms_level=ms_level)
+            index = PeakIndex.from_spectra(sp_iterator)
+            # the cache is accessed after iterating over the spectra, as
+            # subclasses may reset it while synchronizing their data.
+            self._peak_index[ms_level] = index
+        return self._peak_index[ms_level]
+
+    def _iterate_spectra(
+        self,
+        scans: Iterable[int],
+        prefetch: int
+    ) -> Generator[Tuple[int, lcms.MSSpectrum], None, None]:
+        """
+        Yields the selected spectra.
+
+        """
+        for k in scans:
+            yield k, self.get_spectrum(k)
+
+    def _get_scan_metadata(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the time and MS level of each spectrum. Subclasses override this
+        method to avoid reading the spectra.
+
+        """
+        table = self.get_scan_table()
+        return table["time"].to_numpy(), table["ms_level"].to_numpy()
+
     @abc.abstractmethod
     def get_spectra_iterator(
         self,
@@ -431,6 +555,7 @@ class MSData:
         end: Optional[int] = None,
         start_time: float = 0.0,
         end_time: Optional[float] = None,
+        prefetch: int = 0
     ) -> Generator[Tuple[int, lcms.MSSpectrum], None, None]:
         """
         Yields the spectra in the file.
@@ -448,6 +573,11 @@ class MSData:
             Ignore scans with acquisition times lower than this value.
         end_time : float or None, default=None
             Ignore scans with acquisition times higher than this value.
+        prefetch : int, default=0
+            Number of spectra decoded in advance using a pool of threads,
+            while the current spectrum is processed. If ``0``, spectra are
+            decoded when they are requested. Ignored if the data is stored in
+            memory.
 
         Yields
         ------
@@ -457,18 +587,81 @@ class MSData:
         """
         pass
 
+    def get_scan_table(self) -> pd.DataFrame:
+        """
+        Creates a table with the metadata of each spectrum.
+
+        Returns
+        -------
+        pd.DataFrame
+            Table indexed by scan number, with columns ``time``, ``ms_level``,
+            ``polarity``, ``tic``, ``bpi`` and ``size``. ``polarity`` is 0 if
+            it is not available.
+
+        """
+        n_spectra = self.get_n_spectra()
+        table = {
+            "time": np.full(n_spectra, np.nan),
+            "ms_level": np.ones(n_spectra, dtype=int),
+            "polarity": np.zeros(n_spectra, dtype=int),
+            "tic": np.zeros(n_spectra),
+            "bpi": np.zeros(n_spectra),
+            "size": np.zeros(n_spectra, dtype=int),
+        }
+        for k in range(n_spectra):
+            sp = self.get_spectrum(k)
+            if sp.time is not None:
+                table["time"][k] = sp.time
+            table["ms_level"][k] = sp.ms_level
+            table["polarity"][k] = sp.polarity or 0
+            if sp.spint.size:
+                table["tic"][k] = np.sum(sp.spint)
+                table["bpi"][k] = np.max(sp.spint)
+                table["size"][k] = sp.spint.size
+        return pd.DataFrame(table)
+
     def get_closest_spectrum_to_RT(
         self, 
         time: float = 0.0
-    ) -> lcms.MSSpectrum:
-        bestK = None
-        bestK_timeDiff = None
-        for k, sp in self.get_spectra_iterator():
-            if bestK is None or abs(sp.time - time) <= abs(bestK_timeDiff):
-                bestK = k
-                bestK_timeDiff = sp.time - time
+    ) -> Tuple[Optional[int], Optional[float]]:
+        """
+        Finds the MS1 spectrum with the acquisition time closest to `time`.
+
+        Uses a binary search over the acquisition times, which are assumed
+        to be sorted. If two spectra are equally close, the last one is
+        selected.
+
+        Parameters
+        ----------
+        time : float, default=0.0
 
-        return bestK, bestK_timeDiff
+        Returns
+        -------
+        scan_number : int or None
+            ``None`` if there are no MS1 spectra.
+        time_diff : float or None
+            Difference between the time of the spectrum and `time`.
+
+        """
+        scan_time, ms_level = self._get_scan_metadata()
+        scans = np.where(ms_level == 1)[0]
+        if scans.size == 0:
+            return None, None
+        scan_time = scan_time[scans]
+        # last scan with time lower or equal than `time`
+        left = np.searchsorted(scan_time, time, side="right") - 1
+        right = left + 1
+        use_right = (right < scan_time.size) and (
+            (left < 0) or (scan_time[right] - time <= time - scan_time[left])
+        )
+        if use_right:
+            # last scan with the same time
+            closest = np.searchsorted(
+                scan_time, scan_time[right], side="right"
+            ) - 1
+        else:
+            closest = left
+        return int(scans[closest]), float(scan_time[closest] - time)
 
 class MSData_Proxy(MSData):
     
@@ -517,6 +710,9 @@ class MSData_Proxy(MSData):
     def is_virtual_sample(self, value: bool):
         self._to_MSData_object.is_virtual_sample = value
 
+    def close(self):
+        self._to_MSData_object.close()
+
     def get_n_chromatograms(self) -> int:
         return self._to_MSData_object.get_n_chromatograms()
     
@@ -529,6 +725,22 @@ class MSData_Proxy(MSData):
     def get_spectrum(self, n: int) -> lcms.MSSpectrum:
         return self._to_MSData_object.get_spectrum(n)
 
+    def get_spectra(
+        self,
+        indices: Iterable[int],
+        prefetch: int = 0
+    ) -> List[lcms.MSSpectrum]:
+        return self._to_MSData_object.get_spectra(indices, prefetch=prefetch)
+
+    def get_scan_table(self) -> pd.DataFrame:
+        return self._to_MSData_object.get_scan_table()
+
+    def get_peak_index(self, ms_level: int = 1, rebuild: bool = False) -> PeakIndex:
+        return self._to_MSData_object.get_peak_index(ms_level=ms_level, rebuild=rebuild)
+
+    def _get_scan_metadata(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self._to_MSData_object._get_scan_metadata()
+
     @abc.abstractmethod
     def get_spectra_iterator(
             self,
@@ -536,14 +748,16 @@ class MSData_Proxy(MSData):
             start: int = 0,
             end: Optional[int] = None,
             start_time: float = 0.0,
-            end_time: Optional[float] = None
+            end_time: Optional[float] = None,
+            prefetch: int = 0
     ) -> Generator[Tuple[int, lcms.MSSpectrum], None, None]:
         return self._to_MSData_object.get_spectra_iterator(
             ms_level = ms_level,
             start = start,
             end = end,
             start_time = start_time,
-            end_time = end_time
+            end_time = end_time,
+            prefetch = prefetch
         )
 
 
@@ -569,6 +783,7 @@ class MSData_subset_spectra(MSData):
         if start_ind >= 0 and start_ind < from_MSData_object.get_n_spectra() and end_ind >= 0 and end_ind < from_MSData_object.get_n_spectra() and start_ind <= end_ind:
             #super().__init__(is_virtual_sample = True)
             self._is_virtual_sample = True
+            self._peak_index = dict()
             self.start_ind = start_ind
             self.end_ind = end_ind
             self._from_MSData_object = from_MSData_object
@@ -619,6 +834,25 @@ class MSData_subset_spectra(MSData):
             raise ValueError("Spectrum index %d is invalid. There are only %d spectra in the MSData object"%(n, self.end_ind - self.start_ind + 1))
         return self._from_MSData_object.get_spectrum(n + self.start_ind)
 
+    def get_spectra(
+        self,
+        indices: Iterable[int],
+        prefetch: int = 0
+    ) -> List[lcms.MSSpectrum]:
+        indices = np.asarray(indices, dtype=int)
+        n_spectra = self.get_n_spectra()
+        invalid = (indices < 0) | (indices >= n_spectra)
+        if np.any(invalid):
+            raise ValueError("Spectrum index %d is invalid. There are only %d spectra in the MSData object"%(indices[invalid][0], n_spectra))
+        return self._from_MSData_object.get_spectra(
+            indices + self.start_ind, prefetch=prefetch
+        )
+
+    def _get_scan_metadata(self) -> Tuple[np.ndarray, np.ndarray]:
+        time, ms_level = self._from_MSData_object._get_scan_metadata()
+        index = slice(self.start_ind, self.end_ind + 1)
+        return time[index], ms_level[index]
+
     @abc.abstractmethod
     def get_spectra_iterator(
             self,
@@ -626,7 +860,8 @@ class MSData_subset_spectra(MSData):
             start: int = 0,
             end: Optional[int] = None,
             start_time: float = 0.0,
-            end_time: Optional[float] = None
+            end_time: Optional[float] = None,
+            prefetch: int = 0
     ) -> Generator[Tuple[int, lcms.MSSpectrum], None, None]:
         if end is None:
             end = self.get_n_spectra()
@@ -634,20 +869,30 @@ class MSData_subset_spectra(MSData):
             msg = "End must be lower than the number of spectra in the file."
             raise ValueError(msg)
 
-        for k in range(start, end):
-            sp = self.get_spectrum(k)
-            is_valid_level = ms_level == sp.ms_level
-            is_valid_time = (start_time <= sp.time) and (
-                (end_time is None) or (end_time > sp.time)
-            )
-            if is_valid_level and is_valid_time:
-                yield k, sp
+        iterator = self._from_MSData_object.get_spectra_iterator(
+            ms_level=ms_level,
+            start=start + self.start_ind,
+            end=end + self.start_ind,
+            start_time=start_time,
+            end_time=end_time,
+            prefetch=prefetch
+        )
+        for k, sp in iterator:
+            yield k - self.start_ind, sp
 
 
 class MSData_from_file(MSData):
     """
     Class for reading data from files without storing too much data in the memory
 
+    If `use_mmap` is ``True``, the file is memory mapped and spectra arrays are
+    decoded without intermediate copies. In this case, the arrays are read-only.
+
+    If `index_cache_dir` is provided, the file index and the scan table are
+    stored in a sidecar file in this directory and reused the next time the
+    file is opened. When this information is available, spectra
+    that do not pass the filters in `get_spectra_iterator` are not read.
+
     """
 
     def __init__(
@@ -655,13 +900,17 @@ class MSData_from_file(MSData):
         path: Union[str, Path],
         ms_mode: str = "centroid",
         instrument: str = "qtof",
-        separation: str = "uplc"
+        separation: str = "uplc",
+        use_mmap: bool = False,
+        index_cache_dir: Optional[Union[str, Path]] = None
     ):
         super().__init__(ms_mode = ms_mode, instrument = instrument, separation = separation, is_virtual_sample = False)
         path = Path(path)
         suffix = path.suffix
         if suffix == ".mzML":
-            self._reader = MZMLReader(path)
+            self._reader = MZMLReader(
+                path, use_mmap=use_mmap, index_cache_dir=index_cache_dir
+            )
         elif suffix == "":
             # used to intantiate MSData_simulated
             self._reader = None
@@ -669,6 +918,10 @@ class MSData_from_file(MSData):
             msg = "{} is not a valid format for MS data".format(suffix)
             raise ValueError(msg)
 
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+
     def get_n_chromatograms(self) -> int:
         return self._reader.n_chromatograms
 
@@ -687,13 +940,58 @@ class MSData_from_file(MSData):
         sp_data["is_centroid"] = self.ms_mode == "centroid"
         return lcms.MSSpectrum(**sp_data)
 
+    def get_scan_table(self) -> pd.DataFrame:
+        # computed by the reader decoding only the intensity arrays
+        return pd.DataFrame(self._reader.get_scan_table())
+
+    def _get_scan_metadata(self) -> Tuple[np.ndarray, np.ndarray]:
+        # the scan table is stored in the reader after the first call
+        table = self._reader.get_scan_table()
+        return table["time"], table["ms_level"]
+
+    def _iterate_spectra(
+        self,
+        scans: Iterable[int],
+        prefetch: int
+    ) -> Generator[Tuple[int, lcms.MSSpectrum], None, None]:
+        """
+        Yields the selected spectra. If `prefetch` is greater than zero,
+        spectra are decoded in advance using a pool of threads.
+
+        """
+        if prefetch <= 0:
+            for k in scans:
+                yield k, self.get_spectrum(k)
+            return
+
+        is_centroid = self.ms_mode == "centroid"
+        # the data is read in the calling thread, as the reader state is not
+        # thread-safe, and it is decoded in the thread pool.
+        with ThreadPoolExecutor(max_workers=prefetch) as executor:
+            pending = deque()
+            for k in scans:
+                data = self._reader.read_spectrum(k)
+                future = executor.submit(self._reader.parse_spectrum, data)
+                pending.append((k, future))
+                if len(pending) > prefetch:
+                    k, future = pending.popleft()
+                    yield k, lcms.MSSpectrum(
+                        is_centroid=is_centroid, **future.result()
+                    )
+            while pending:
+                k, future = pending.popleft()
+                yield k, lcms.MSSpectrum(
+                    is_centroid=is_centroid, **future.result()
+                )
+
     def get_spectra_iterator(
             self,
             ms_level: int = 1,
             start: int = 0,
             end: Optional[int] = None,
             start_time: float = 0.0,
-            end_time: Optional[float] = None
+            end_time: Optional[float] = None,
+            prefetch: int = 0
     ) -> Generator[Tuple[int, lcms.MSSpectrum], None, None]:
         if end is None:
             end = self.get_n_spectra()
@@ -701,8 +999,22 @@ class MSData_from_file(MSData):
             msg = "End must be lower than the number of spectra in the file."
             raise ValueError(msg)
 
-        for k in range(start, end):
-            sp = self.get_spectrum(k)
+        if self._reader.has_scan_table:
+            # use the scan table to decode only the selected spectra
+            table = self._reader.get_scan_table()
+            scans = _select_scans(
+                table["time"],
+                table["ms_level"],
+                ms_level,
+                start,
+                end,
+                start_time,
+                end_time
+            )
+            yield from self._iterate_spectra(scans, prefetch)
+            return
+
+        for k, sp in self._iterate_spectra(range(start, end), prefetch):
             is_valid_level = ms_level == sp.ms_level
             is_valid_time = ((start_time <= sp.time) and
                              ((end_time is None) or (end_time > sp.time)))
@@ -710,53 +1022,142 @@ class MSData_from_file(MSData):
                 yield k, sp
 
 
+class MSData_from_binary(MSData_from_file):
+    """
+    Class for reading data from binary files created with
+    `save_ms_data_binary`.
+
+    The binary file is memory mapped and spectra are read as slices of the
+    mapped file, without decoding. The arrays returned are read-only. The scan
+    table is stored in the file, so only the spectra that pass the filters in
+    `get_spectra_iterator` are read.
+
+    """
+
+    @staticmethod
+    def generate_from_file(
+        path: Union[str, Path],
+        ms_mode: str = "centroid",
+        instrument: str = "qtof",
+        separation: str = "uplc",
+        binary_dir: Optional[Union[str, Path]] = None,
+        index_cache_dir: Optional[Union[str, Path]] = None
+    ) -> "MSData_from_binary":
+        """
+        Creates a MSData_from_binary object from a raw data file.
+
+        The raw data file is converted to a binary file the first time. The
+        binary file is reused while the size, modification time and hash of
+        the raw data file remain unchanged.
+
+        Parameters
+        ----------
+        path : str or Path
+            Path to a mzML file or to a binary file.
+        ms_mode : {"centroid", "profile"}, default="centroid"
+        instrument : {"qtof", "orbitrap"}, default="qtof"
+        separation : {"uplc", "hplc"}, default="uplc"
+        binary_dir : str, Path or None, default=None
+            Directory where the binary file is stored. If ``None``, the binary
+            file is stored next to the raw data file.
+        index_cache_dir : str, Path or None, default=None
+            Directory with the mzML index sidecar files, used during the
+            conversion.
+
+        Returns
+        -------
+        MSData_from_binary
+
+        """
+        path = Path(path)
+        if path.suffix == BINARY_SUFFIX:
+            return MSData_from_binary(path, ms_mode, instrument, separation)
+
+        binary_path = get_binary_path(path, binary_dir)
+        source_key = _get_file_key(path)
+        if load_source_key(binary_path) != source_key:
+            ms_data = MSData_from_file(
+                path,
+                ms_mode=ms_mode,
+                instrument=instrument,
+                separation=separation,
+                index_cache_dir=index_cache_dir
+            )
+            with ms_data:
+                save_ms_data_binary(ms_data, binary_path, source_key)
+        return MSData_from_binary(binary_path, ms_mode, instrument, separation)
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        ms_mode: str = "centroid",
+        instrument: str = "qtof",
+        separation: str = "uplc"
+    ):
+        MSData.__init__(self, ms_mode = ms_mode, instrument = instrument, separation = separation, is_virtual_sample = False)
+        path = Path(path)
+        if path.suffix == BINARY_SUFFIX:
+            self._reader = MSBinaryReader(path)
+        else:
+            msg = "{} is not a valid format for binary MS data".format(path.suffix)
+            raise ValueError(msg)
+
+    def _iterate_spectra(
+        self,
+        scans: Iterable[int],
+        prefetch: int
+    ) -> Generator[Tuple[int, lcms.MSSpectrum], None, None]:
+        # spectra are slices of the mapped file, there is no data to decode
+        for k in scans:
+            yield k, self.get_spectrum(k)
+
+
 class MSData_in_memory(MSData):
     """
     Class for reading the entire file once to memory.
 
+    Spectra are stored in a compressed sparse row layout: the m/z and
+    intensity values of all spectra are concatenated into two arrays and the
+    data of the k-th spectrum is located between ``offsets[k]`` and
+    ``offsets[k + 1]``. The metadata of the scans is stored in one array per
+    field. MSSpectrum objects are created on demand as views of the
+    concatenated arrays and are reused in subsequent calls, so changes made
+    to a spectrum are preserved.
+
+    Objects created with `generate_from_MSData_object` from a subset or proxy
+    of another MSData_in_memory object share the concatenated arrays with it.
+    The shared arrays are read-only: assigning new m/z or intensity arrays to
+    a spectrum copies the data into new concatenated arrays, and the original
+    object is not modified.
+
     """
 
     @abc.abstractmethod
     def generate_from_MSData_object(msDataObj):
-        mz_perScan = []
-        spint_perScan = []
-        time_perScan = []
-        ms_level_perScan = []
-        polarity_perScan = []
-        instrument_perScan = []
-        is_centroid_perScan = []
-
-        for k, spectrum in msDataObj.get_spectra_iterator():
-            mz_perScan.append(spectrum.mz)
-            spint_perScan.append(spectrum.spint)
-            time_perScan.append(spectrum.time)
-            ms_level_perScan.append(spectrum.ms_level)
-            polarity_perScan.append(spectrum.polarity)
-            instrument_perScan.append(spectrum.instrument)
-            is_centroid_perScan.append(spectrum.is_centroid)
-        
         temp = MSData_in_memory(
             ms_mode = msDataObj.ms_mode,
             instrument = msDataObj.instrument,
             separation = msDataObj.separation
         )
-
-        for i in range(len(mz_perScan)):
-            spectrum = lcms.MSSpectrum(
-                mz_perScan[i],
-                spint_perScan[i],
-                time_perScan[i],
-                ms_level_perScan[i],
-                polarity_perScan[i],
-                instrument_perScan[i],
-                is_centroid_perScan[i]
-            )
-            temp._spectra.append(spectrum)
-        
+        source, start, end = _resolve_in_memory_source(msDataObj)
+        if source is not None:
+            # same spectra as the ones selected by get_spectra_iterator
+            time, ms_level = source._get_scan_metadata()
+            scans = _select_scans(time, ms_level, 1, start, end, 0.0, None)
+            if len(scans) == 0:
+                temp._set_spectra([])
+                return temp
+            start, end = scans[0], scans[-1] + 1
+            temp._set_shared_spectra(source, start, end)
+            if len(scans) < end - start:
+                # copies only the data of the selected spectra
+                temp.select_spectra(np.array(scans) - start)
+            return temp
+        temp._set_spectra([sp for _, sp in msDataObj.get_spectra_iterator()])
         return temp
 
     @abc.abstractmethod
-    def generate_from_file(path, ms_mode: str = "centroid", instrument: str = "qtof", separation: str = "uplc"):
+    def generate_from_file(path, ms_mode: str = "centroid", instrument: str = "qtof", separation: str = "uplc", use_mmap: bool = False, index_cache_dir: Optional[Union[str, Path]] = None):
         temp = MSData_in_memory(
             ms_mode = ms_mode, 
             instrument = instrument, 
@@ -766,11 +1167,18 @@ class MSData_in_memory(MSData):
         path = Path(path)
         suffix = path.suffix
         if suffix == ".mzML":
-            reader = MZMLReader(path)
-            for i in range(reader.n_spectra):
-                sp_data = reader.get_spectrum(i)
-                sp_data["is_centroid"] = ms_mode == "centroid"
-                temp._spectra.append(lcms.MSSpectrum(**sp_data))
+            reader = MZMLReader(
+                path, use_mmap=use_mmap, index_cache_dir=index_cache_dir
+            )
+            spectra = list()
+            with reader:
+                for i in range(reader.n_spectra):
+                    sp_data = reader.get_spectrum(i)
+                    sp_data["is_centroid"] = ms_mode == "centroid"
+                    spectra.append(lcms.MSSpectrum(**sp_data))
+                # the data is copied to the concatenated arrays before closing
+                # the reader, as spectra may be views of a memory mapped file
+                temp._set_spectra(spectra)
         else:
             msg = "{} is not a valid format for MS data".format(suffix)
             raise ValueError(msg)
@@ -789,13 +1197,34 @@ class MSData_in_memory(MSData):
         self._instrument = instrument
         self._separation = separation
 
-        self._spectra = []
+        self._set_spectra([])
+
+    def __getstate__(self):
+        # the data of the spectrum objects is removed to avoid storing it
+        # twice. Views are restored as slices of the concatenated arrays after
+        # unpickling or copying.
+        self._sync_spectra()
+        state = self.__dict__.copy()
+        views = list()
+        for sp in self._views:
+            if sp is not None:
+                sp = copy.copy(sp)
+                sp.mz = None
+                sp.spint = None
+            views.append(sp)
+        state["_views"] = views
+        state["_view_data"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._link_views()
 
     def get_n_chromatograms(self) -> int:
         return self._reader.n_chromatograms
 
     def get_n_spectra(self) -> int:
-        return len(self._spectra)
+        return self._offsets.size - 1
 
     def get_chromatogram(self, n: int) -> Tuple[str, lcms.Chromatogram]:
         chrom_data = self._reader.get_chromatogram(n)
@@ -805,7 +1234,24 @@ class MSData_in_memory(MSData):
         return name, chromatogram
 
     def get_spectrum(self, n: int) -> lcms.MSSpectrum:
-        return self._spectra[n]
+        # raises IndexError and supports negative indices, as lists do
+        n = range(self.get_n_spectra())[n]
+        sp = self._views[n]
+        if sp is None:
+            time = self._time[n]
+            polarity = self._polarity[n]
+            sp = lcms.MSSpectrum(
+                None,
+                None,
+                time=None if np.isnan(time) else float(time),
+                ms_level=int(self._ms_level[n]),
+                polarity=int(polarity) if polarity else None,
+                instrument=self._scan_instrument[n],
+                is_centroid=bool(self._is_centroid[n])
+            )
+            self._views[n] = sp
+            self._link_view(n)
+        return sp
 
     def get_spectra_iterator(
             self,
@@ -813,7 +1259,8 @@ class MSData_in_memory(MSData):
             start: int = 0,
             end: Optional[int] = None,
             start_time: float = 0.0,
-            end_time: Optional[float] = None
+            end_time: Optional[float] = None,
+            prefetch: int = 0
     ) -> Generator[Tuple[int, lcms.MSSpectrum], None, None]:
         if end is None:
             end = self.get_n_spectra()
@@ -821,29 +1268,223 @@ class MSData_in_memory(MSData):
             msg = "End must be lower than the number of spectra in the file."
             raise ValueError(msg)
 
-        for k in range(start, end):
-            sp = self.get_spectrum(k)
-            is_valid_level = ms_level == sp.ms_level
-            is_valid_time = ((start_time <= sp.time) and
-                             ((end_time is None) or (end_time > sp.time)))
-            if is_valid_level and is_valid_time:
-                yield k, sp
+        self._sync_spectra()
+        scans = _select_scans(
+            self._time, self._ms_level, ms_level, start, end, start_time,
+            end_time
+        )
+        for k in scans:
+            yield k, self.get_spectrum(k)
+
+    def _get_scan_metadata(self) -> Tuple[np.ndarray, np.ndarray]:
+        self._sync_spectra()
+        return self._time, self._ms_level
+
+    def get_peak_index(self, ms_level: int = 1, rebuild: bool = False) -> PeakIndex:
+        # changes made to the spectra reset the cached index
+        self._sync_spectra()
+        return super().get_peak_index(ms_level=ms_level, rebuild=rebuild)
+
+    def get_scan_table(self) -> pd.DataFrame:
+        self._sync_spectra()
+        size = np.diff(self._offsets)
+        tic = np.zeros(size.size)
+        bpi = np.zeros(size.size)
+        # reduceat is applied only on non-empty spectra, as it returns the
+        # value at the start index for empty ranges.
+        non_empty = size > 0
+        if np.any(non_empty):
+            start = self._offsets[:-1][non_empty]
+            bpi[non_empty] = np.maximum.reduceat(self._spint, start)
+        # np.add.reduceat sums sequentially. np.sum is used instead to obtain
+        # the same values as the ones computed from the spectrum objects.
+        for k in np.where(non_empty)[0]:
+            tic[k] = np.sum(self._spint[self._offsets[k]:self._offsets[k + 1]])
+        table = {
+            "time": self._time.copy(),
+            "ms_level": self._ms_level.copy(),
+            "polarity": self._polarity.copy(),
+            "tic": tic,
+            "bpi": bpi,
+            "size": size,
+        }
+        return pd.DataFrame(table)
 
     def duplicate_object(self):
         return copy.deepcopy(self)
 
     def delete_spectrum(self, n):
-        if n >= 0 and n < len(self._spectra):
-            del self._spectra[n]
+        if n >= 0 and n < self.get_n_spectra():
+            self.delete_spectra([n])
     
     def delete_spectra(self, ns):
         ns = sorted(ns)[::-1]
         if len(ns) < len(set(ns)):
             raise Exception("Error: array contains non-unique indices")
 
-        for n in ns:
-            self.delete_spectrum(n)
+        n_spectra = self.get_n_spectra()
+        keep = np.ones(n_spectra, dtype=bool)
+        keep[[n for n in ns if (n >= 0) and (n < n_spectra)]] = False
+        self.select_spectra(np.where(keep)[0])
+
+    def select_spectra(self, ns):
+        """
+        Keeps only the selected spectra.
+
+        Parameters
+        ----------
+        ns : array-like
+            Indices of the spectra to keep, in the order in which they are
+            stored.
+
+        """
+        self._sync_spectra()
+        ns = np.asarray(ns, dtype=int)
+        start = self._offsets[:-1][ns]
+        size = self._offsets[1:][ns] - start
+        offsets = np.zeros(ns.size + 1, dtype=int)
+        np.cumsum(size, out=offsets[1:])
+        # index of each point of the selected spectra in the current arrays
+        index = np.arange(offsets[-1]) + np.repeat(start - offsets[:-1], size)
+        self._mz = self._mz[index]
+        self._spint = self._spint[index]
+        self._offsets = offsets
+        self._time = self._time[ns]
+        self._ms_level = self._ms_level[ns]
+        self._polarity = self._polarity[ns]
+        self._scan_instrument = self._scan_instrument[ns]
+        self._is_centroid = self._is_centroid[ns]
+        self._views = [self._views[k] for k in ns]
+        self._link_views()
+        self._peak_index = dict()
+
+    def _set_spectra(self, spectra: List[lcms.MSSpectrum]):
+        """
+        Stores a list of spectra using the concatenated layout.
 
+        """
+        size = np.array([sp.mz.size for sp in spectra], dtype=int)
+        self._offsets = np.zeros(size.size + 1, dtype=int)
+        np.cumsum(size, out=self._offsets[1:])
+        if spectra:
+            self._mz = np.concatenate([sp.mz for sp in spectra])
+            self._spint = np.concatenate([sp.spint for sp in spectra])
+        else:
+            self._mz = np.array([])
+            self._spint = np.array([])
+        self._time = np.array(
+            [np.nan if sp.time is None else sp.time for sp in spectra],
+            dtype=float
+        )
+        self._ms_level = np.array([sp.ms_level for sp in spectra], dtype=int)
+        self._polarity = np.array(
+            [sp.polarity or 0 for sp in spectra], dtype=int
+        )
+        self._scan_instrument = np.array(
+            [sp.instrument for sp in spectra], dtype=object
+        )
+        self._is_centroid = np.array(
+            [sp.is_centroid for sp in spectra], dtype=bool
+        )
+        # spectrum objects created by get_spectrum, and the arrays assigned to
+        # them, used to detect changes in the data of a spectrum.
+        self._views = [None] * size.size
+        self._view_data = [None] * size.size
+        self._peak_index = dict()
+
+    def _set_shared_spectra(
+        self, source: "MSData_in_memory", start: int, end: int
+    ):
+        """
+        Stores the spectra in the range [start, end) of another object, using
+        read-only views of its concatenated arrays.
+
+        """
+        source._sync_spectra()
+        data_start = source._offsets[start]
+        data_end = source._offsets[end]
+        self._offsets = source._offsets[start:end + 1] - data_start
+        self._mz = source._mz[data_start:data_end]
+        self._spint = source._spint[data_start:data_end]
+        self._mz.setflags(write=False)
+        self._spint.setflags(write=False)
+        self._time = source._time[start:end].copy()
+        self._ms_level = source._ms_level[start:end].copy()
+        self._polarity = source._polarity[start:end].copy()
+        self._scan_instrument = source._scan_instrument[start:end].copy()
+        self._is_centroid = source._is_centroid[start:end].copy()
+        n_spectra = end - start
+        self._views = [None] * n_spectra
+        self._view_data = [None] * n_spectra
+        self._peak_index = dict()
+
+    def _link_view(self, n: int):
+        """
+        Sets the data of the n-th spectrum object as slices of the
+        concatenated arrays.
+
+        """
+        sp = self._views[n]
+        start, end = self._offsets[n], self._offsets[n + 1]
+        sp.mz = self._mz[start:end]
+        sp.spint = self._spint[start:end]
+        self._view_data[n] = (sp.mz, sp.spint)
+
+    def _link_views(self):
+        self._view_data = [None] * len(self._views)
+        for k, sp in enumerate(self._views):
+            if sp is not None:
+                self._link_view(k)
+
+    def _sync_spectra(self):
+        """
+        Updates the concatenated arrays with changes made to the spectrum
+        objects created by get_spectrum.
+
+        """
+        modified = False
+        # the peak index also depends on the metadata of the spectra
+        modified_index = False
+        for k, sp in enumerate(self._views):
+            if sp is None:
+                continue
+            mz, spint = self._view_data[k]
+            modified = modified or (sp.mz is not mz) or (sp.spint is not spint)
+            time = np.nan if sp.time is None else sp.time
+            modified_time = (time != self._time[k]) and not (
+                np.isnan(time) and np.isnan(self._time[k])
+            )
+            modified_index = (
+                modified_index
+                or modified_time
+                or (sp.ms_level != self._ms_level[k])
+                or (sp.is_centroid != self._is_centroid[k])
+            )
+            self._time[k] = time
+            self._ms_level[k] = sp.ms_level
+            self._polarity[k] = sp.polarity or 0
+            self._scan_instrument[k] = sp.instrument
+            self._is_centroid[k] = sp.is_centroid
+
+        if modified:
+            mz_list = list()
+            spint_list = list()
+            for k, sp in enumerate(self._views):
+                if sp is None:
+                    start, end = self._offsets[k], self._offsets[k + 1]
+                    mz_list.append(self._mz[start:end])
+                    spint_list.append(self._spint[start:end])
+                else:
+                    mz_list.append(sp.mz)
+                    spint_list.append(sp.spint)
+            np.cumsum([x.size for x in mz_list], out=self._offsets[1:])
+            self._mz = np.concatenate(mz_list)
+            self._spint = np.concatenate(spint_list)
+            self._link_views()
+
+        if modified or modified_index:
+            # the peak index is built again using the new data
+            self._peak_index = dict()
 
 
 class MSData_simulated(MSData):  # pragma: no cover
@@ -892,13 +1533,19 @@ class MSData_simulated(MSData):  # pragma: no cover
         sp_data["is_centroid"] = self.ms_mode == "centroid"
         return lcms.MSSpectrum(**sp_data)
 
+    def _get_scan_metadata(self) -> Tuple[np.ndarray, np.ndarray]:
+        # all simulated spectra are MS1 spectra
+        ms_level = np.ones(self.get_n_spectra(), dtype=int)
+        return np.asarray(self._reader.rt, dtype=float), ms_level
+
     def get_spectra_iterator(
             self,
             ms_level: int = 1,
             start: int = 0,
             end: Optional[int] = None,
             start_time: float = 0.0,
-            end_time: Optional[float] = None
+            end_time: Optional[float] = None,
+            prefetch: int = 0
     ) -> Generator[Tuple[int, lcms.MSSpectrum], None, None]:
         if end is None:
             end = self.get_n_spectra()
@@ -993,6 +1640,149 @@ class _SimulatedReader:
         return sp
 
 
+def save_ms_data_binary(
+    ms_data: MSData,
+    path: Union[str, Path],
+    source_key: Optional[dict] = None
+):
+    """
+    Stores the spectra, chromatograms and scan table of a MSData object in a
+    binary file that can be read with MSData_from_binary.
+
+    Parameters
+    ----------
+    ms_data : MSData
+    path : str or Path
+        Path to the binary file. The suffix of the file must be
+        ``".tidyms-msdata"``.
+    source_key : dict or None, default=None
+        Used to check if the binary file was created from a raw data file.
+
+    """
+    path = Path(path)
+    if path.suffix != BINARY_SUFFIX:
+        msg = "The suffix of the binary file must be {}".format(BINARY_SUFFIX)
+        raise ValueError(msg)
+
+    n_spectra = ms_data.get_n_spectra()
+    mz_list = list()
+    spint_list = list()
+    table = {
+        "time": np.full(n_spectra, np.nan),
+        "ms_level": np.ones(n_spectra, dtype=int),
+        "polarity": np.zeros(n_spectra, dtype=int),
+        "tic": np.zeros(n_spectra),
+        "bpi": np.zeros(n_spectra),
+        "size": np.zeros(n_spectra, dtype=int),
+    }
+    for k in range(n_spectra):
+        sp = ms_data.get_spectrum(k)
+        mz_list.append(sp.mz)
+        spint_list.append(sp.spint)
+        if sp.time is not None:
+            table["time"][k] = sp.time
+        table["ms_level"][k] = sp.ms_level
+        table["polarity"][k] = sp.polarity or 0
+        if sp.spint.size:
+            table["tic"][k] = np.sum(sp.spint)
+            table["bpi"][k] = np.max(sp.spint)
+            table["size"][k] = sp.spint.size
+    spectra_offset = np.zeros(n_spectra + 1, dtype=int)
+    np.cumsum(table["size"], out=spectra_offset[1:])
+
+    names = list()
+    chrom_time_list = list()
+    chrom_spint_list = list()
+    for k in range(ms_data.get_n_chromatograms()):
+        name, chromatogram = ms_data.get_chromatogram(k)
+        names.append(name)
+        chrom_time_list.append(chromatogram.time)
+        chrom_spint_list.append(chromatogram.spint)
+    chromatogram_offset = np.zeros(len(names) + 1, dtype=int)
+    np.cumsum([x.size for x in chrom_time_list], out=chromatogram_offset[1:])
+
+    arrays = {
+        "mz": _concatenate(mz_list),
+        "spint": _concatenate(spint_list),
+        "spectra_offset": spectra_offset,
+        "chromatogram_time": _concatenate(chrom_time_list),
+        "chromatogram_spint": _concatenate(chrom_spint_list),
+        "chromatogram_offset": chromatogram_offset,
+    }
+    arrays.update(table)
+    metadata = {
+        "ms_mode": ms_data.ms_mode,
+        "instrument": ms_data.instrument,
+        "separation": ms_data.separation,
+        "chromatogram_names": names,
+        "scan_table_columns": SCAN_TABLE_COLUMNS,
+        "source": source_key,
+    }
+    write_ms_binary(path, arrays, metadata)
+
+
+def _concatenate(arrays: List[np.ndarray]) -> np.ndarray:
+    return np.concatenate(arrays) if arrays else np.array([])
+
+
+def _resolve_in_memory_source(
+    ms_data: MSData
+) -> Tuple[Optional[MSData_in_memory], int, int]:
+    """
+    Finds the MSData_in_memory object that stores the spectra of a subset or
+    proxy object.
+
+    Returns
+    -------
+    source : MSData_in_memory or None
+        ``None`` if the spectra are not stored in a MSData_in_memory object.
+    start : int
+        Index of the first spectrum of `ms_data` in `source`.
+    end : int
+        Index after the last spectrum of `ms_data` in `source`.
+
+    """
+    start = 0
+    end = ms_data.get_n_spectra()
+    while True:
+        if isinstance(ms_data, MSData_Proxy):
+            ms_data = ms_data.to_MSData_object
+        elif isinstance(ms_data, MSData_subset_spectra):
+            start += ms_data.start_ind
+            end += ms_data.start_ind
+            ms_data = ms_data._from_MSData_object
+        elif isinstance(ms_data, MSData_in_memory):
+            return ms_data, start, end
+        else:
+            return None, start, end
+
+
+def _select_scans(
+    time: np.ndarray,
+    ms_level_array: np.ndarray,
+    ms_level: int,
+    start: int,
+    end: int,
+    start_time: float,
+    end_time: Optional[float]
+) -> List[int]:
+    """
+    Selects the scans that pass the filters of `get_spectra_iterator` using the
+    time and ms level of each scan.
+
+    Returns
+    -------
+    scans : List[int]
+        Indices of the selected scans.
+
+    """
+    time = time[start:end]
+    mask = (ms_level_array[start:end] == ms_level) & (start_time <= time)
+    if end_time is not None:
+        mask &= end_time > time
+    return (np.where(mask)[0] + start).tolist()
+
+
 def list_available_datasets(hide_test_data: bool = True) -> List[str]:
     """
     List available example datasets
@@ -7,7 +7,7 @@ from typing import Generator, Optional, Tuple
 from . import _constants as c
 from .fileio import MSData
 from .lcms import Chromatogram
-from .raw_data_utils import make_chromatograms
+from .raw_data_utils import make_chromatograms_iterator
 from .utils import find_closest, get_progress_bar
 from sklearn.impute import KNNImputer
 
@@ -224,18 +224,18 @@ def _get_sample_fill_values(
     -------
 
     """
-    chromatograms = make_chromatograms(ms_data, mz, window=mz_tolerance)
-    chromatograms_rt = chromatograms[0].time
-    start_index = np.searchsorted(chromatograms_rt, rt_start)
-    end_index = np.searchsorted(chromatograms_rt, rt_end)
-    iterator = zip(chromatograms, rt, rt_std, start_index, end_index, features)
+    # chromatograms are created one at a time to reduce memory usage when
+    # filling a large number of features
+    chromatograms = make_chromatograms_iterator(ms_data, mz, window=mz_tolerance)
+    iterator = zip(chromatograms, rt, rt_std, rt_start, rt_end, features)
 
     found_index = list()
     found_area = list()
     not_found_index = list()
     not_found_area = list()
 
-    for chrom, c_rt, c_rt_std, c_start_index, c_end_index, c_ft in iterator:
+    for chrom, c_rt, c_rt_std, c_rt_start, c_rt_end, c_ft in iterator:
+        c_start_index, c_end_index = np.searchsorted(chrom.time, [c_rt_start, c_rt_end])
         # fill values outside the valid range to 0
         chrom.fill_nan(fill_value=0.0, bounds_error=False)
         area = _get_fill_area(chrom, c_rt, c_rt_std, n_deviations)
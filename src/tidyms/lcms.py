@@ -11,6 +11,7 @@ Functions
 ---------
 make_chromatograms
 make_roi
+extract_features_batch
 accumulate_spectra_profile
 accumulate_spectra_centroid
 get_lc_filter_peak_params
@@ -430,7 +431,7 @@ class LCTrace(MZTrace):
         smoothing_strength : float or None, default=1.0
             Scale of a Gaussian function used to smooth the signal. If None,
             no smoothing is applied.
-        store_smoothed : bool, default=True
+        store_smoothed : bool, default=False
             If True, replaces the original data with the smoothed version.
         **kwargs :
             Parameters to pass to :py:func:`tidyms.peaks.detect_peaks`.
@@ -982,6 +983,56 @@ def get_find_centroid_params(instrument: str) -> dict:
     return params
 
 
+def extract_features_batch(
+    roi_list: Sequence[LCTrace],
+    smoothing_strength: Optional[float] = 1.0,
+    store_smoothed: bool = False,
+    **kwargs,
+) -> list[list[Peak]]:
+    """
+    Detect chromatographic peaks in a list of ROIs.
+
+    Computes the same result as calling :py:meth:`LCTrace.extract_features` on
+    each ROI, but noise estimation, smoothing, baseline estimation and peak
+    detection are vectorized over all ROIs.
+
+    Parameters
+    ----------
+    roi_list : Sequence[LCTrace]
+    smoothing_strength : float or None, default=1.0
+        Scale of a Gaussian function used to smooth the signal. If None,
+        no smoothing is applied.
+    store_smoothed : bool, default=False
+        If True, replaces the original data with the smoothed version.
+    **kwargs :
+        Parameters to pass to :py:func:`tidyms.peaks.detect_peaks_batch`.
+
+    Returns
+    -------
+    List[List[Peak]] : the features detected in each ROI.
+
+    See Also
+    --------
+    tidyms.peaks.detect_peaks_batch : peak detection of multiple 1D signals.
+
+    """
+    for roi in roi_list:
+        roi.fill_nan(fill_value="extrapolate")
+    spint_list = [roi.spint for roi in roi_list]
+    results = peaks.detect_peaks_batch(spint_list, smoothing_strength, **kwargs)
+    features_list = list()
+    for roi, start, apex, end, noise, baseline, x in zip(roi_list, *results):
+        if store_smoothed:
+            roi.spint = x
+        n_peaks = start.size
+        features = [Peak(s, a, e, roi, i) for s, a, e, i in zip(start, apex, end, range(n_peaks))]
+        roi.features = features
+        roi.baseline = baseline
+        roi.noise = noise
+        features_list.append(features)
+    return features_list
+
+
 def _compare_features_lc(ft1: Peak, ft2: Peak) -> float:
     """
     Feature similarity function used in LC-MS data.
@@ -11,17 +11,22 @@ Functions
 - estimate_noise(x) : Estimates noise level in a 1D signal
 - estimate_baseline(x, noise) : Estimates the baseline in a 1D signal
 - detect_peaks(x, y) : Detects peaks in a 1D signal
+- detect_peaks_batch(x_list) : Detects peaks in a list of 1D signals
 - find_centroids(x, y) : Computes the centroid and area of peaks in a 1D signal.
+- find_centroids_batch(x_list, y_list) : Computes the centroid and area of
+  peaks in a list of 1D signals.
 
 """
 
 import numpy as np
 from scipy.interpolate import interp1d
+from scipy.ndimage import gaussian_filter1d
 from scipy.signal import find_peaks
 from scipy.special import erfc
-from scipy.stats import median_abs_deviation as mad
 from typing import List, Optional, Tuple
 
+_MAD_NORMAL_SCALE = 0.6744897501960817  # scale used by scipy median_abs_deviation
+
 
 def detect_peaks(
         x: np.ndarray,
@@ -103,6 +108,70 @@ def detect_peaks(
     return start, peaks, end
 
 
+def detect_peaks_batch(
+        x_list: List[np.ndarray],
+        smoothing_strength: Optional[float] = 1.0,
+        find_peaks_params: Optional[dict] = None
+) -> Tuple[List[np.ndarray], List[np.ndarray], List[np.ndarray],
+           List[np.ndarray], List[np.ndarray], List[np.ndarray]]:
+    """
+    Finds peaks in a list of 1D signals.
+
+    Computes the same result as applying ``estimate_noise``, a gaussian
+    smoothing, ``estimate_baseline`` and ``detect_peaks`` to each signal, but
+    each step is vectorized over all signals. Signals with similar size are
+    packed into a 2D array padded with NaN, which is more efficient than the
+    per signal approach when working with a large number of short signals,
+    such as ROIs.
+
+    Parameters
+    ----------
+    x_list : List[array]
+        Non-empty 1D signals.
+    smoothing_strength : float or None, default=1.0
+        Scale of the gaussian filter used to smooth the signals. If ``None``,
+        no smoothing is applied.
+    find_peaks_params : dict or None, default=None
+        parameters to pass to :py:func:`scipy.signal.find_peaks`.
+
+    Returns
+    -------
+    start : List[array]
+        Indices where peaks start in each signal.
+    apex : List[array]
+        Indices where the peak maximum was found in each signal.
+    end : List[array]
+        Indices where peaks end in each signal.
+    noise : List[array]
+        Noise estimation of each signal.
+    baseline : List[array]
+        Baseline estimation of each smoothed signal.
+    smoothed : List[array]
+        Smoothed signals.
+
+    See Also
+    --------
+    detect_peaks : detect peaks in a 1D signal
+
+    """
+    if find_peaks_params is None:
+        find_peaks_params = {"distance": 3}
+    else:
+        find_peaks_params = find_peaks_params.copy()
+
+    n_signals = len(x_list)
+    results = tuple([None] * n_signals for _ in range(6))
+    size = np.array([x.size for x in x_list], dtype=int)
+    for group in _group_by_size(size):
+        x_group = [x_list[k] for k in group]
+        group_results = _detect_peaks_2d(
+            x_group, size[group], smoothing_strength, find_peaks_params)
+        for res_list, group_res in zip(results, group_results):
+            for k, r in zip(group, group_res):
+                res_list[k] = r
+    return results
+
+
 def estimate_noise(
         x: np.ndarray,
         min_slice_size: int = 200,
@@ -138,15 +207,17 @@ def estimate_noise(
     slice_size = x.size // n_slices
     if slice_size < min_slice_size:
         slice_size = min_slice_size
-    start = 0
-    while start < x.size:
-        end = min(start + slice_size, x.size)
-        if (x.size - end) < min_slice_size:
-            # prevent short slices at the end of x
-            end = x.size
-        slice_noise = _estimate_local_noise(x[start:end], robust=robust)
-        noise[start:end] = slice_noise
-        start = end
+    # all slices have size equal to slice_size, except the last one, which may
+    # be longer to prevent short slices at the end of x. The noise is estimated
+    # in batch for slices with equal size.
+    n_equal = max((x.size - min_slice_size) // slice_size, 0)
+    equal_end = n_equal * slice_size
+    if n_equal:
+        equal_slices = x[:equal_end].reshape((n_equal, slice_size))
+        slice_noise = _estimate_local_noise_batch(equal_slices, robust=robust)
+        noise[:equal_end] = np.repeat(slice_noise, slice_size)
+    if equal_end < x.size:
+        noise[equal_end:] = _estimate_local_noise(x[equal_end:], robust=robust)
     return noise
 
 
@@ -257,6 +328,57 @@ def find_centroids(mz: np.ndarray, spint: np.ndarray, min_snr: float,
     return centroid, total_spint
 
 
+def find_centroids_batch(
+        mz_list: List[np.ndarray],
+        spint_list: List[np.ndarray],
+        min_snr: float,
+        min_distance: float
+) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """
+    Finds the centroids of a list of mass spectra in profile mode.
+
+    Computes the same result as applying ``find_centroids`` to each spectrum,
+    but noise, baseline and peak detection are vectorized over all spectra
+    using the same approach as in ``detect_peaks_batch``.
+
+    Parameters
+    ----------
+    mz_list : List[array]
+        m/z of each spectrum.
+    spint_list : List[array]
+        Non-empty intensity arrays of each spectrum.
+    min_snr : positive number
+        Minimum signal-to-noise ratio
+    min_distance : positive number
+        Minimum m/z distance between consecutive centroids
+
+    Returns
+    -------
+    centroid_mz : List[array]
+        centroid m/z of peaks in each spectrum.
+    centroid_int : List[array]
+        area of peaks in each spectrum.
+
+    See Also
+    --------
+    find_centroids : find centroids in a mass spectrum
+
+    """
+    n_spectra = len(spint_list)
+    centroid_list = [None] * n_spectra
+    area_list = [None] * n_spectra
+    size = np.array([x.size for x in spint_list], dtype=int)
+    for group in _group_by_size(size):
+        mz_group = [mz_list[k] for k in group]
+        spint_group = [spint_list[k] for k in group]
+        group_centroid, group_area = _find_centroids_2d(
+            mz_group, spint_group, size[group], min_snr, min_distance)
+        for k, centroid, area in zip(group, group_centroid, group_area):
+            centroid_list[k] = centroid
+            area_list[k] = area
+    return centroid_list, area_list
+
+
 def _find_peak_extension(peaks: np.array, baseline_index: np.array
                          ) -> Tuple[np.ndarray, np.ndarray]:
     """
@@ -384,9 +506,45 @@ def _estimate_local_noise(x: np.ndarray, robust: bool = True) -> float:
     noise : non-negative number.
 
     """
-    d2x = np.diff(x, n=2)
-    sorted_index = np.argsort(np.abs(d2x))
-    d2x = d2x[sorted_index]
+    return _estimate_local_noise_batch(x[np.newaxis], robust=robust)[0]
+
+
+def _estimate_local_noise_batch(
+        x: np.ndarray,
+        robust: bool = True,
+        size: Optional[np.ndarray] = None
+) -> np.ndarray:
+    r"""
+    Estimates noise in each row of a 2D array. Assumes that the noise is
+    gaussian iid.
+
+    aux function of estimate_noise and _estimate_noise_2d.
+
+    Parameters
+    ----------
+    x : 2D array
+        The number of columns of x must be at least 4. If it is smaller, the
+        noise is set to 0.
+    robust : bool
+        If True, estimates the noise using the median absolute deviation. Else
+        uses the standard deviation.
+    size : array or None, default=None
+        Number of values in each row of x. If provided, rows are padded at the
+        end with NaN.
+
+    Returns
+    -------
+    noise : array with the noise of each row.
+
+    """
+    n_rows, width = x.shape
+    if size is None:
+        size = np.full(n_rows, width)
+    d2x = np.diff(x, n=2, axis=1)
+    d2x_size = np.maximum(size - 2, 0)
+    # NaN values from the padding are placed after valid values when values
+    # are partitioned or sorted.
+    abs_d2x = np.abs(d2x)
     # if d2x follows a normal distribution ~ N(0, 2*sigma), its sample mean
     # has a normal distribution ~ N(0,  2 * sigma / sqrt(n - 2)) where n is the
     # size of d2x.
@@ -394,42 +552,92 @@ def _estimate_local_noise(x: np.ndarray, robust: bool = True) -> float:
     # lower than its standard deviation.
     # start at 90th percentile and decrease it in each iteration.
     # The loop stops at the 20th percentile even if this condition is not meet
-    n_deviations = 3    # dummy values to initialize the loop
+    noise_std = np.zeros(n_rows)
     percentile_counter = 9  # start at 90th percentile
-    noise_std = 0
 
-    if robust:
-        mean_func = np.median
-        std_func = lambda x: mad(x, scale="normal")
-    else:
-        mean_func = np.mean
-        std_func = np.std
-
-    if d2x.size >= 2:   # we need at least 2 points to compute the std
-        while (n_deviations > 1.0) and (percentile_counter > 2):
-            percentile_index = percentile_counter * d2x.size // 10
-            # the minimum number of elements required to compute the MAD
-            if percentile_index <= 2:
-                break
-            noise_std = std_func(d2x[:percentile_index])
-            noise_mean = mean_func(d2x[:percentile_index])
+    if not robust:
+        sorted_index = np.argsort(abs_d2x, axis=1, kind="stable")
+        sorted_d2x = np.take_along_axis(d2x, sorted_index, axis=1)
+
+    # we need at least 2 points to compute the std
+    active = d2x_size >= 2
+    while (percentile_counter > 2) and active.any():
+        percentile_index = percentile_counter * d2x_size // 10
+        # the minimum number of elements required to compute the MAD
+        active &= percentile_index > 2
+        # rows with the same number of values are processed together
+        for k in np.unique(percentile_index[active]):
+            rows = np.flatnonzero(active & (percentile_index == k))
+            if robust:
+                # the median and MAD do not depend on the order of the values,
+                # and d2x values with low absolute values are selected without
+                # sorting.
+                lowest_d2x = _select_lowest(d2x[rows], abs_d2x[rows], k)
+                noise_mean = _median(lowest_d2x)
+                deviation = np.abs(lowest_d2x - noise_mean[:, np.newaxis])
+                row_std = _median(deviation) / _MAD_NORMAL_SCALE
+            else:
+                lowest_d2x = sorted_d2x[rows, :k]
+                noise_mean = np.mean(lowest_d2x, axis=1)
+                row_std = np.std(lowest_d2x, axis=1)
+            noise_std[rows] = row_std
 
             # if all the values in d2x are equal, noise_std is equal to zero
-            if noise_std > 0:
-                n_deviations = abs(noise_mean / noise_std)
-            else:
-                break
-            percentile_counter -= 1
-        noise = noise_std / 2
-        if np.isclose(noise, 0):
-            noise = d2x.std()
-    else:
-        # in the case where d2x < 2 we cannot compute the std, the noise is
-        # defined as 0
-        noise = 0.0
+            n_deviations = np.zeros_like(row_std)
+            positive = row_std > 0
+            n_deviations[positive] = np.abs(noise_mean[positive] / row_std[positive])
+            active[rows] = n_deviations > 1.0
+        percentile_counter -= 1
+
+    noise = noise_std / 2
+    # equivalent to np.isclose(noise, 0)
+    for k in np.flatnonzero((d2x_size >= 2) & (np.abs(noise) <= 1e-8)):
+        row_d2x = d2x[k, :d2x_size[k]]
+        noise[k] = row_d2x[np.argsort(np.abs(row_d2x), kind="stable")].std()
+    # in the case where d2x < 2 we cannot compute the std, the noise is
+    # defined as 0
     return noise
 
 
+def _select_lowest(x: np.ndarray, abs_x: np.ndarray, k: int) -> np.ndarray:
+    """
+    Selects the `k` values with the lowest absolute value in each row of x.
+
+    aux function of _estimate_local_noise_batch. Values with equal absolute
+    values are selected using their order in x, i.e., the values selected are
+    the first `k` values obtained after a stable sort by absolute value.
+
+    Returns
+    -------
+    lowest : 2D array with shape ``(x.shape[0], k)``.
+
+    """
+    threshold = np.partition(abs_x, k - 1, axis=1)[:, k - 1, np.newaxis]
+    is_lowest = abs_x < threshold
+    is_tie = abs_x == threshold
+    n_tie = k - np.count_nonzero(is_lowest, axis=1)
+    is_lowest |= is_tie & (np.cumsum(is_tie, axis=1) <= n_tie[:, np.newaxis])
+    return x[is_lowest].reshape((x.shape[0], k))
+
+
+def _median(x: np.ndarray) -> np.ndarray:
+    """
+    Computes the median of each row of a 2D array.
+
+    aux function of _estimate_local_noise_batch. Computes the same result as
+    ``np.median(x, axis=1)``, with a lower overhead.
+
+    """
+    size = x.shape[1]
+    half = size // 2
+    if size % 2:
+        median = np.partition(x, half, axis=1)[:, half]
+    else:
+        partitioned = np.partition(x, [half - 1, half], axis=1)
+        median = (partitioned[:, half - 1] + partitioned[:, half]) / 2
+    return median
+
+
 def _find_baseline_points(x: np.ndarray, noise: np.ndarray,
                           min_proba: float) -> np.ndarray:
     """
@@ -651,3 +859,423 @@ def _merge_close_peaks(mz: np.ndarray, spint: np.ndarray,
         is_close_mask[-1] = (mz[-1] - mz[-2]) < min_distance
         close_index = np.where(is_close_mask)[0]
     return mz, spint
+
+
+# batch peak detection
+# Signals are packed into a 2D array padded with NaN, where each row contains a
+# signal. Operations that depend only on the values of a single signal, such as
+# sorting or cumulative sums, are applied over rows. Operations that depend on
+# local extrema are applied on the flattened array: the NaN padding between
+# rows prevents finding peaks across different signals.
+
+def _group_by_size(size: np.ndarray) -> List[np.ndarray]:
+    """
+    Groups signals indices such that the size of signals in a group is in the
+    range (2 ** (k - 1), 2 ** k].
+
+    aux function of detect_peaks_batch.
+
+    """
+    group = np.ceil(np.log2(np.maximum(size, 1))).astype(int)
+    sorted_index = np.argsort(group, kind="stable")
+    split_index = np.flatnonzero(np.diff(group[sorted_index])) + 1
+    return np.split(sorted_index, split_index) if size.size else list()
+
+
+def _detect_peaks_2d(
+        x_list: List[np.ndarray],
+        size: np.ndarray,
+        smoothing_strength: Optional[float],
+        find_peaks_params: dict
+) -> Tuple[List[np.ndarray], ...]:
+    """
+    Detects peaks in a group of signals with similar size.
+
+    aux function of detect_peaks_batch.
+
+    """
+    distance = find_peaks_params.get("distance")
+    pad = 1 if distance is None else max(1, int(np.ceil(distance)))
+    width = size.max() + pad
+    n_rows = size.size
+    mask = np.arange(width) < size[:, np.newaxis]
+    x = np.full((n_rows, width), np.nan)
+    x[mask] = np.hstack(x_list)
+
+    noise = np.full_like(x, np.nan)
+    noise[mask] = _estimate_noise_2d(x, size)
+
+    if smoothing_strength is not None:
+        x = _gaussian_filter_2d(x, size, smoothing_strength)
+        x[~mask] = np.nan
+
+    baseline = np.full_like(x, np.nan)
+    baseline[mask] = _estimate_baseline_2d(x, size, noise)
+
+    start, apex, end = _detect_peaks_flat(x, size, noise, baseline, find_peaks_params)
+
+    # convert flat indices to indices in each row
+    row = apex // width
+    offset = row * width
+    start, apex, end = start - offset, apex - offset, end - offset
+    peak_split = np.searchsorted(row, np.arange(1, n_rows))
+    point_split = np.cumsum(size)[:-1]
+    smoothed = np.split(x[mask], point_split)
+    return (
+        np.split(start, peak_split),
+        np.split(apex, peak_split),
+        np.split(end, peak_split),
+        np.split(noise[mask], point_split),
+        np.split(baseline[mask], point_split),
+        smoothed,
+    )
+
+
+def _find_centroids_2d(
+        mz_list: List[np.ndarray],
+        spint_list: List[np.ndarray],
+        size: np.ndarray,
+        min_snr: float,
+        min_distance: float
+) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """
+    Finds the centroids of a group of spectra with similar size.
+
+    aux function of find_centroids_batch.
+
+    """
+    find_peaks_params = {"distance": 3}
+    width = size.max() + find_peaks_params["distance"]
+    n_rows = size.size
+    mask = np.arange(width) < size[:, np.newaxis]
+    spint = np.full((n_rows, width), np.nan)
+    spint[mask] = np.hstack(spint_list)
+    mz = np.full((n_rows, width), np.nan)
+    mz[mask] = np.hstack(mz_list)
+
+    noise = np.full_like(spint, np.nan)
+    noise[mask] = _estimate_noise_2d(spint, size)
+    baseline = np.full_like(spint, np.nan)
+    baseline[mask] = _estimate_baseline_2d(spint, size, noise)
+    start, apex, end = _detect_peaks_flat(
+        spint, size, noise, baseline, find_peaks_params, min_snr=min_snr)
+
+    # centroid and total intensity, see find_centroids
+    row = apex // width
+    cumulative_spint = np.cumsum(spint, axis=1).ravel()
+    weights = np.cumsum(mz * spint, axis=1).ravel()
+    is_row_start = start == row * width
+    start_cumulative_spint = np.where(is_row_start, 0, cumulative_spint[start - 1])
+    start_weight = np.where(is_row_start, 0, weights[start - 1])
+    total_spint = cumulative_spint[end - 1] - start_cumulative_spint
+    centroid = (weights[end - 1] - start_weight) / total_spint
+
+    peak_split = np.searchsorted(row, np.arange(1, n_rows))
+    centroid_list = np.split(centroid, peak_split)
+    total_spint_list = np.split(total_spint, peak_split)
+    for row_centroid, row_total_spint in zip(centroid_list, total_spint_list):
+        if row_centroid.size:
+            _merge_close_peaks(row_centroid, row_total_spint, min_distance)
+    return centroid_list, total_spint_list
+
+
+def _estimate_noise_2d(
+        x: np.ndarray,
+        size: np.ndarray,
+        min_slice_size: int = 200,
+        n_slices: int = 5
+) -> np.ndarray:
+    """
+    Estimates the noise of each row of a 2D array padded with NaN.
+
+    aux function of detect_peaks_batch. Slices are created as in
+    ``estimate_noise``.
+
+    Returns
+    -------
+    noise : 1D array with the noise of non-padded elements of x.
+
+    """
+    n_rows, width = x.shape
+    slice_size = np.maximum(size // n_slices, min_slice_size)
+    n_row_slices = np.maximum((size - min_slice_size) // slice_size + 1, 1)
+    n_row_slices[size == 0] = 0
+
+    # start and size of each slice in the flattened array
+    slice_row = np.repeat(np.arange(n_rows), n_row_slices)
+    first_slice = np.cumsum(n_row_slices) - n_row_slices
+    slice_number = np.arange(slice_row.size) - first_slice[slice_row]
+    slice_start = slice_number * slice_size[slice_row]
+    is_last = slice_number == n_row_slices[slice_row] - 1
+    slice_end = np.where(is_last, size[slice_row], slice_start + slice_size[slice_row])
+    slice_length = slice_end - slice_start
+    slice_start += slice_row * width
+
+    max_length = slice_length.max() if slice_length.size else 0
+    column = np.arange(max_length)
+    slice_mask = column < slice_length[:, np.newaxis]
+    index = np.where(slice_mask, slice_start[:, np.newaxis] + column, 0)
+    slice_x = np.where(slice_mask, x.ravel()[index], np.nan)
+    slice_noise = _estimate_local_noise_batch(slice_x, size=slice_length)
+    return np.repeat(slice_noise, slice_length)
+
+
+def _gaussian_filter_2d(x: np.ndarray, size: np.ndarray, sigma: float) -> np.ndarray:
+    """
+    Applies a gaussian filter to each row of a 2D array padded with NaN.
+
+    aux function of detect_peaks_batch. The result is equal to the result
+    obtained using ``scipy.ndimage.gaussian_filter1d`` in each row.
+
+    """
+    radius = int(4.0 * float(sigma) + 0.5)
+    width = x.shape[1]
+    # extend each row using the reflect mode from scipy.ndimage
+    period = 2 * np.maximum(size, 1)[:, np.newaxis]
+    index = np.arange(-radius, width + radius) % period
+    index = np.where(index >= period // 2, period - 1 - index, index)
+    extended = np.take_along_axis(x, index, axis=1)
+    smoothed = gaussian_filter1d(extended, sigma, axis=1, mode="constant")
+    return smoothed[:, radius:radius + width]
+
+
+def _estimate_baseline_2d(
+        x: np.ndarray,
+        size: np.ndarray,
+        noise: np.ndarray,
+        min_proba: float = 0.05
+) -> np.ndarray:
+    """
+    Estimates the baseline of each row of a 2D array padded with NaN.
+
+    aux function of detect_peaks_batch.
+
+    Returns
+    -------
+    baseline : 1D array with the baseline of non-padded elements of x.
+
+    """
+    n_rows, width = x.shape
+    x_flat = x.ravel()
+    row_start = np.arange(n_rows) * width
+    row_end = row_start + size - 1
+
+    # local extrema. The first and last index of a row are included only if
+    # the row has at least one local maximum
+    local_max = find_peaks(x_flat)[0]
+    local_min = find_peaks(-x_flat)[0]
+    has_max = np.bincount(local_max // width, minlength=n_rows) > 0
+    extrema = np.hstack([
+        row_start[has_max],
+        local_min[has_max[local_min // width]],
+        local_max,
+        row_end[has_max]
+    ])
+    extrema = np.unique(extrema)
+
+    # consecutive extrema pairs in the same row
+    extrema_row = extrema // width
+    same_row = extrema_row[:-1] == extrema_row[1:]
+    lo = extrema[:-1][same_row]
+    hi = extrema[1:][same_row]
+    pair_row = extrema_row[:-1][same_row]
+
+    # noise probability of each slice, see _estimate_noise_probability
+    if lo.size:
+        reduce_index = np.vstack([lo, hi + 1]).T.ravel()
+        noise_slice = np.sqrt(np.add.reduceat(noise.ravel() ** 2, reduce_index)[::2])
+        cum_x = np.cumsum(x, axis=1).ravel()
+        start_cum_x = cum_x[lo - 1]
+        start_cum_x[lo == pair_row * width] = 0
+        x_sum = cum_x[hi] - start_cum_x
+        x_min = np.minimum(x_flat[hi], x_flat[lo])
+        x_sum = x_sum - (hi - lo + 1) * x_min
+        noise_probability = erfc(x_sum / (noise_slice * np.sqrt(2)))
+    else:
+        noise_probability = np.array([])
+
+    # extend signal regions to the left and right, wrapping around each row
+    # as in _build_baseline_index
+    is_signal = noise_probability < min_proba
+    pair_index = np.arange(lo.size)
+    first_pair = np.searchsorted(pair_row, pair_row)
+    last_pair = np.searchsorted(pair_row, pair_row, side="right") - 1
+    prev_pair = np.where(pair_index == first_pair, last_pair, pair_index - 1)
+    next_pair = np.where(pair_index == last_pair, first_pair, pair_index + 1)
+    is_signal = is_signal | is_signal[prev_pair] | is_signal[next_pair]
+
+    # baseline points. Duplicated points do not modify the interpolation
+    lo = lo[~is_signal]
+    length = hi[~is_signal] - lo + 1
+    offset = np.cumsum(length) - length
+    baseline_index = np.repeat(lo - offset, length) + np.arange(length.sum())
+    baseline_index = np.hstack([baseline_index, row_start, row_end])
+    baseline_index = np.sort(baseline_index, kind="stable")
+
+    mask = np.arange(width) < size[:, np.newaxis]
+    x_index = np.flatnonzero(mask)
+    baseline = np.interp(x_index, baseline_index, x_flat[baseline_index])
+    baseline = np.minimum(baseline, x_flat[x_index])
+    return baseline
+
+
+def _detect_peaks_flat(
+        x: np.ndarray,
+        size: np.ndarray,
+        noise: np.ndarray,
+        baseline: np.ndarray,
+        find_peaks_params: dict,
+        min_snr: Optional[float] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Detects peaks in each row of a 2D array padded with NaN.
+
+    aux function of detect_peaks_batch and find_centroids_batch. See
+    detect_peaks for a description of the algorithm. If `min_snr` is not
+    ``None``, peaks with a signal-to-noise ratio lower than `min_snr` are
+    removed, as in find_centroids.
+
+    Returns
+    -------
+    start, apex, end : array
+        Peak indices in the flattened array.
+
+    """
+    n_rows, width = x.shape
+    x_flat = x.ravel()
+    noise = noise.ravel()
+    row_start = np.arange(n_rows) * width
+    row_end = row_start + size - 1
+
+    # baseline points. If no baseline points are found in a row, the first and
+    # last points are used.
+    is_baseline = (x_flat - baseline.ravel()) < noise
+    has_baseline = np.bincount(np.flatnonzero(is_baseline) // width, minlength=n_rows) > 0
+    is_baseline[row_start[~has_baseline]] = True
+    is_baseline[row_end[~has_baseline]] = True
+    baseline_index = np.flatnonzero(is_baseline)
+
+    local_max = find_peaks(x_flat)[0]
+    prominence = 3 * noise
+    find_peaks_params["prominence"] = prominence
+    peaks = find_peaks(x_flat, **find_peaks_params)[0]
+
+    # the peaks selected using the distance parameter depend on the sorting
+    # order of peaks with equal height. In this case, peaks are detected on
+    # each row to obtain the same result as in detect_peaks.
+    distance = find_peaks_params.get("distance")
+    if distance is not None:
+        tie_rows = _find_distance_ties(x_flat, local_max, width, distance)
+        if tie_rows.size:
+            peaks = [peaks[~np.isin(peaks // width, tie_rows)]]
+            for row in tie_rows:
+                row_slice = slice(row_start[row], row_end[row] + 1)
+                find_peaks_params["prominence"] = prominence[row_slice]
+                row_peaks = find_peaks(x_flat[row_slice], **find_peaks_params)[0]
+                peaks.append(row_peaks + row_start[row])
+            peaks = np.sort(np.hstack(peaks))
+
+    # remove peaks close to baseline level
+    peaks = peaks[~is_baseline[peaks]]
+    if min_snr is not None:
+        snr = (x_flat[peaks] - baseline.ravel()[peaks]) / noise[peaks]
+        peaks = peaks[snr > min_snr]
+
+    # peak extension, see _find_peak_extension
+    peak_row = peaks // width
+    row_first = np.searchsorted(baseline_index, peak_row * width)
+    row_count = np.searchsorted(baseline_index, (peak_row + 1) * width) - row_first
+    ext_index = np.searchsorted(baseline_index, peaks) - row_first
+    ext_index = np.minimum(ext_index, row_count - 1)
+    start_index = np.where(ext_index > 0, ext_index - 1, row_count - 1)
+    start = baseline_index[row_first + start_index]
+    end = baseline_index[row_first + ext_index] + 1
+
+    # fix overlapping peaks, see _fix_peak_overlap
+    local_min = find_peaks(-x_flat)[0]
+    overlap = (end[:-1] > start[1:]) & (peak_row[:-1] == peak_row[1:])
+    overlap_index = np.flatnonzero(overlap)
+    if overlap_index.size:
+        min_start = np.searchsorted(local_min, peaks[overlap_index])
+        min_end = np.searchsorted(local_min, peaks[overlap_index + 1])
+        boundary = local_min[_segment_arg_extremum(x_flat[local_min], min_start, min_end, np.minimum)]
+        end[overlap_index] = boundary + 1
+        start[overlap_index + 1] = boundary
+
+    # normalize peaks, see _normalize_peaks
+    max_start = np.searchsorted(local_max, start)
+    max_end = np.searchsorted(local_max, end, side="right")
+    max_index = _segment_arg_extremum(x_flat[local_max], max_start, max_end, np.maximum)
+    has_max = max_index >= 0
+    apex = np.where(has_max, local_max[np.maximum(max_index, 0)], 0)
+    valid = has_max & (start < apex) & (apex < end)
+    return start[valid], apex[valid], end[valid]
+
+
+def _find_distance_ties(
+        x: np.ndarray,
+        local_max: np.ndarray,
+        width: int,
+        distance: float
+) -> np.ndarray:
+    """
+    Finds rows with local maxima with equal height at a distance lower than
+    `distance`.
+
+    aux function of _detect_peaks_flat.
+
+    """
+    tie_rows = list()
+    shift = 1
+    while True:
+        is_close = (local_max[shift:] - local_max[:-shift]) < distance
+        if not is_close.any():
+            break
+        is_tie = is_close & (x[local_max[shift:]] == x[local_max[:-shift]])
+        tie_rows.append(local_max[shift:][is_tie] // width)
+        shift += 1
+    return np.unique(np.hstack(tie_rows)) if tie_rows else np.array([], dtype=int)
+
+
+def _segment_arg_extremum(
+        x: np.ndarray,
+        start: np.ndarray,
+        end: np.ndarray,
+        ufunc: np.ufunc
+) -> np.ndarray:
+    """
+    Finds the index of the first minimum or maximum of x in each segment
+    ``x[start:end]``. Segments may overlap.
+
+    aux function of _detect_peaks_flat.
+
+    Parameters
+    ----------
+    x : array
+    start : array of indices
+    end : array of indices
+    ufunc : {np.minimum, np.maximum}
+
+    Returns
+    -------
+    index : array
+        Index of the extremum in each segment. ``-1`` for empty segments.
+
+    """
+    length = np.maximum(end - start, 0)
+    n_segments = length.size
+    offset = np.cumsum(length) - length
+    segment = np.repeat(np.arange(n_segments), length)
+    position = np.repeat(start - offset, length) + np.arange(length.sum())
+    x_segment = x[position]
+
+    non_empty = length > 0
+    extremum = np.zeros(n_segments)
+    if x_segment.size:
+        extremum[non_empty] = ufunc.reduceat(x_segment, offset[non_empty])
+    is_extremum = np.flatnonzero(x_segment == extremum[segment])
+    # the first extremum in each segment
+    extremum_segment, first = np.unique(segment[is_extremum], return_index=True)
+    index = np.full(n_segments, -1)
+    index[extremum_segment] = position[is_extremum[first]]
+    return index
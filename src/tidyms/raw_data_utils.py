@@ -6,15 +6,20 @@ Functions used to extract information from raw data.
 import numpy as np
 import os
 import pandas as pd
-from .lcms import Chromatogram, LCTrace, MSSpectrum, Roi
-from .fileio import MSData, MSData_subset_spectra
+from .lcms import Chromatogram, LCTrace, MSSpectrum, Roi, get_find_centroid_params
+from .fileio import MSData, MSData_in_memory, MSData_subset_spectra
+from .peaks import find_centroids_batch
 from .utils import find_closest
 from . import _constants as c
 from . import validation as val
 from collections import deque
 from copy import deepcopy
+from joblib import Parallel, delayed, effective_n_jobs
 from scipy.interpolate import interp1d
-from typing import Callable, List, Optional, Tuple, Union
+from typing import Callable, Generator, List, Optional, Tuple, Union
+
+# number of spectra processed in each job by make_chromatograms
+_EIC_BLOCK_SIZE = 256
 
 
 def make_tic(
@@ -47,32 +52,18 @@ def make_tic(
     chromatograms : lcms.Chromatograms
 
     """
-    if kind == "tic":
-        reduce = np.sum
-    elif kind == "bpi":
-        reduce = np.max
-    else:
+    if kind not in ["tic", "bpi"]:
         msg = "valid modes are tic or bpi"
         raise ValueError(msg)
 
-    n_scan = ms_data.get_n_spectra()
-    rt = np.zeros(n_scan)
-    tic = np.zeros(n_scan)
-    valid_index = list()
-    # it is not possible to know a priori how many scans of each level are
-    # available in a given file without iterating over it. valid_index holds
-    # the index related to the selected level and is used to remove scans
-    # from other levels.
-    sp_iterator = ms_data.get_spectra_iterator(ms_level=ms_level, start_time=start_time, end_time=end_time)
-    for scan, sp in sp_iterator:
-        valid_index.append(scan)
-        rt[scan] = sp.time
-        if sp.spint.size:
-            tic[scan] = reduce(sp.spint)
-        else:
-            tic[scan] = 0
-    tic = tic[valid_index]
-    rt = rt[valid_index]
+    # the scan table contains the tic and base peak intensity of each scan,
+    # binary data is decoded only if the table is not stored by the reader.
+    table = ms_data.get_scan_table()
+    mask = (table["ms_level"] == ms_level) & (table["time"] >= start_time)
+    if end_time is not None:
+        mask &= table["time"] < end_time
+    rt = table.loc[mask, "time"].to_numpy()
+    tic = table.loc[mask, kind].to_numpy()
     return Chromatogram(rt, tic, ms_data.separation)
 
 
@@ -87,6 +78,8 @@ def make_chromatograms(
     ms_level: int = 1,
     start_time: float = 0.0,
     end_time: Optional[float] = None,
+    prefetch: int = 0,
+    n_jobs: Optional[int] = None,
 ) -> List[Chromatogram]:
     """
     Computes extracted ion chromatograms using a list of m/z values.
@@ -114,54 +107,346 @@ def make_chromatograms(
         include scans starting at this acquisition time.
     end_time : float or None, default=None
         Stops when the acquisition time is higher than this value.
+    prefetch : int, default=0
+        Number of spectra decoded in advance in background threads. See
+        :meth:`MSData.get_spectra_iterator`.
+    n_jobs: int or None, default=None
+        Number of jobs to run in parallel. ``None`` means 1 unless in a
+        :obj:`joblib.parallel_backend` context. ``-1`` means using all
+        processors. If more than one job is used, blocks of consecutive scans
+        are processed in parallel. The result is the same as the one obtained
+        using a single job.
 
     Returns
     -------
     chromatograms : List of Chromatograms
 
+    See Also
+    --------
+    make_chromatograms_iterator : Yields chromatograms using less memory.
+
+    """
+    eic = _make_eic_csr(
+        ms_data,
+        mz,
+        window,
+        accumulator,
+        ms_level,
+        start_time,
+        end_time,
+        prefetch,
+        n_jobs,
+        float,
+    )
+    return list(_iterate_eic_csr(*eic, fill_missing, ms_data.separation))
+
+
+@val.validate_raw_data_utils(val.make_chromatogram_schema)
+def make_chromatograms_iterator(
+    ms_data: MSData,
+    mz: np.ndarray,
+    *,
+    window: Optional[float] = None,
+    accumulator: str = "sum",
+    fill_missing: bool = True,
+    ms_level: int = 1,
+    start_time: float = 0.0,
+    end_time: Optional[float] = None,
+    prefetch: int = 0,
+    n_jobs: Optional[int] = None,
+) -> Generator[Chromatogram, None, None]:
+    """
+    Yields extracted ion chromatograms using a list of m/z values.
+
+    Creates the same chromatograms as :func:`make_chromatograms`, but only the
+    non-zero values of the EICs are stored, using single precision, and each
+    chromatogram is created when it is yielded. Useful to extract a large
+    number of m/z values, where the list of chromatograms would not fit in
+    memory.
+
+    Parameters
+    ----------
+    ms_data : MSData
+    mz : array
+        m/z values used to build the EICs.
+    **kwargs :
+        See :func:`make_chromatograms` for a description of each parameter.
+
+    Yields
+    ------
+    chromatogram : Chromatogram
+        The chromatogram of each m/z value, in the same order as `mz`.
+
+    See Also
+    --------
+    make_chromatograms : Computes a list of chromatograms.
+
+    """
+    eic = _make_eic_csr(
+        ms_data,
+        mz,
+        window,
+        accumulator,
+        ms_level,
+        start_time,
+        end_time,
+        prefetch,
+        n_jobs,
+        np.float32,
+    )
+    return _iterate_eic_csr(*eic, fill_missing, ms_data.separation)
+
+
+def _make_eic_csr(
+    ms_data: MSData,
+    mz: np.ndarray,
+    window: float,
+    accumulator: str,
+    ms_level: int,
+    start_time: float,
+    end_time: Optional[float],
+    prefetch: int,
+    n_jobs: Optional[int],
+    dtype,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """
-    n_sp = ms_data.get_n_spectra()
-
-    # mz_intervals has this shape to be compatible with reduce at
-    mz_intervals = np.vstack((mz - window, mz + window)).T.reshape(mz.size * 2)
-
-    eic = np.zeros((mz.size, n_sp))
-    if not fill_missing:
-        eic[:] = np.nan
-
-    rt = np.zeros(n_sp)
-    valid_index = list()
-    sp_iterator = ms_data.get_spectra_iterator(ms_level=ms_level, start_time=start_time, end_time=end_time)
-    for scan, sp in sp_iterator:
-        valid_index.append(scan)
-        rt[scan] = sp.time
-        sp_size = sp.mz.size
-
-        # prevents error when working with empty spectra
-        if sp_size == 0:
-            continue
-
-        # values for each eic in the current scan
-        ind_sp = np.searchsorted(sp.mz, mz_intervals)  # slices for each eic
-        has_mz = (ind_sp[1::2] - ind_sp[::2]) > 0  # find non-empty slices
-        # elements added at the end of mz_sp raise IndexError
-        ind_sp[ind_sp >= sp_size] = sp_size - 1
-        # this adds the values between two consecutive indices
-        tmp_eic = np.where(has_mz, np.add.reduceat(sp.spint, ind_sp)[::2], 0)
-        if accumulator == "mean":
-            norm = ind_sp[1::2] - ind_sp[::2]
-            norm[norm == 0] = 1
-            tmp_eic = tmp_eic / norm
-        eic[:, scan] = tmp_eic
-    valid_index = np.array(valid_index)
-    rt = rt[valid_index]
-    eic = eic[:, valid_index]
-
-    chromatograms = list()
-    for row in eic:
-        chromatogram = Chromatogram(rt.copy(), row, mode=ms_data.separation)
-        chromatograms.append(chromatogram)
-    return chromatograms
+    Computes EICs in a single pass over the data and stores them using a
+    compressed sparse row layout.
+
+    auxiliary function for make_chromatograms.
+
+    Returns
+    -------
+    rt : array
+        Acquisition time of each scan used.
+    is_empty : array[bool]
+        Scans with empty spectra.
+    indptr : array
+        The values of the k-th EIC are stored in ``data[indptr[k]:indptr[k + 1]]``.
+    indices : array
+        Scan index of each value in `data`.
+    data : array
+        EIC values. Values not stored are zero.
+
+    """
+    # windows are sorted by m/z to find the windows that contain each point in
+    # a spectrum using binary search.
+    sorted_index = np.argsort(mz, kind="stable")
+    lower = mz[sorted_index] - window
+    upper = mz[sorted_index] + window
+
+    rt = list()
+    is_empty = list()
+    sp_iterator = ms_data.get_spectra_iterator(ms_level=ms_level, start_time=start_time, end_time=end_time, prefetch=prefetch)
+    func = delayed(_make_eic_block)
+    results = Parallel(n_jobs=n_jobs)(
+        func(offset, mz_list, sp_list, lower, upper, accumulator, dtype)
+        for offset, mz_list, sp_list in _iterate_eic_blocks(sp_iterator, rt, is_empty)
+    )
+    rt = np.array(rt, dtype=float)
+    is_empty = np.array(is_empty, dtype=bool)
+
+    if results:
+        window_index, scan_index, data = (np.hstack(x) for x in zip(*results))
+    else:
+        window_index = np.array([], dtype=np.int32)
+        scan_index = np.array([], dtype=np.int32)
+        data = np.array([], dtype=dtype)
+    window_index = sorted_index[window_index]
+    indptr = np.zeros(mz.size + 1, dtype=int)
+    np.cumsum(np.bincount(window_index, minlength=mz.size), out=indptr[1:])
+    # stable sort keeps values of each EIC sorted by scan
+    sorted_values = np.argsort(window_index, kind="stable")
+    indices = scan_index[sorted_values]
+    data = data[sorted_values]
+    return rt, is_empty, indptr, indices, data
+
+
+def _iterate_eic_blocks(
+    sp_iterator, rt: List[float], is_empty: List[bool]
+) -> Generator[Tuple[int, List[np.ndarray], List[np.ndarray]], None, None]:
+    """
+    Yields blocks of consecutive spectra.
+
+    auxiliary function for make_chromatograms. Stores the time of each
+    spectrum in `rt` and flags empty spectra in `is_empty`.
+
+    Yields
+    ------
+    offset : int
+        Index of the first spectrum in the block.
+    mz_list : List[array]
+    sp_list : List[array]
+
+    """
+    offset = 0
+    mz_list = list()
+    sp_list = list()
+    for _, sp in sp_iterator:
+        rt.append(sp.time)
+        is_empty.append(sp.mz.size == 0)
+        mz_list.append(sp.mz)
+        sp_list.append(sp.spint)
+        if len(mz_list) == _EIC_BLOCK_SIZE:
+            yield offset, mz_list, sp_list
+            offset += len(mz_list)
+            mz_list = list()
+            sp_list = list()
+    if mz_list:
+        yield offset, mz_list, sp_list
+
+
+def _make_eic_block(
+    offset: int,
+    mz_list: List[np.ndarray],
+    sp_list: List[np.ndarray],
+    lower: np.ndarray,
+    upper: np.ndarray,
+    accumulator: str,
+    dtype,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the EIC values in a block of spectra.
+
+    auxiliary function for make_chromatograms.
+
+    Returns
+    -------
+    window_index : array
+        Index of the window in the sorted windows.
+    scan_index : array
+    value : array
+
+    """
+    window_list = list()
+    scan_list = list()
+    value_list = list()
+    for k, (sp_mz, sp_spint) in enumerate(zip(mz_list, sp_list)):
+        window, value = _sweep_eic_windows(sp_mz, sp_spint, lower, upper, accumulator)
+        window_list.append(window)
+        scan_list.append(np.full(window.size, offset + k))
+        value_list.append(value)
+    window_index = np.hstack(window_list).astype(np.int32)
+    scan_index = np.hstack(scan_list).astype(np.int32)
+    value = np.hstack(value_list).astype(dtype)
+    return window_index, scan_index, value
+
+
+def _sweep_eic_windows(
+    sp_mz: np.ndarray,
+    sp_spint: np.ndarray,
+    lower: np.ndarray,
+    upper: np.ndarray,
+    accumulator: str,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the value of the m/z windows that contain at least one point of a
+    spectrum.
+
+    auxiliary function for make_chromatograms.
+
+    Parameters
+    ----------
+    sp_mz : array
+        sorted m/z values of the spectrum.
+    sp_spint : array
+    lower : array
+        Sorted lower bound of the windows.
+    upper : array
+        Upper bound of the windows, sorted in the same order as `lower`.
+    accumulator : {"sum", "mean"}
+
+    Returns
+    -------
+    window : array
+        Index of the windows that contain points of the spectrum.
+    value : array
+        Value of each window.
+
+    """
+    # the k-th point of the spectrum is inside the windows first[k], ...,
+    # last[k] - 1. Both arrays are sorted, as the windows bounds are sorted.
+    first = np.searchsorted(upper, sp_mz, side="right")
+    last = np.searchsorted(lower, sp_mz, side="right")
+    inside = first < last
+    first = first[inside]
+    last = last[inside]
+    if not first.size:
+        return np.array([], dtype=int), np.array([])
+
+    # merge overlapping ranges of windows
+    is_start = np.ones(first.size, dtype=bool)
+    is_start[1:] = first[1:] > last[:-1]
+    range_start = first[is_start]
+    range_end = last[np.hstack((np.flatnonzero(is_start)[1:] - 1, first.size - 1))]
+    length = range_end - range_start
+    offset = np.cumsum(length) - length
+    window = np.repeat(range_start - offset, length) + np.arange(length.sum())
+
+    lower_index = np.searchsorted(sp_mz, lower[window])
+    upper_index = np.searchsorted(sp_mz, upper[window])
+    value = _reduce_eic_windows(sp_spint, lower_index, upper_index, accumulator)
+    return window, value
+
+
+def _reduce_eic_windows(
+    sp_spint: np.ndarray,
+    lower_index: np.ndarray,
+    upper_index: np.ndarray,
+    accumulator: str,
+) -> np.ndarray:
+    """
+    Accumulates the intensity of a spectrum in m/z windows.
+
+    auxiliary function for make_chromatograms.
+
+    Parameters
+    ----------
+    sp_spint : array
+        Non-empty intensity array.
+    lower_index : array
+        Index of the first point of the spectrum in each window.
+    upper_index : array
+        Index of the first point of the spectrum after each window.
+    accumulator : {"sum", "mean"}
+
+    """
+    sp_size = sp_spint.size
+    # ind_sp has this shape to be compatible with reduceat
+    ind_sp = np.vstack((lower_index, upper_index)).T.reshape(lower_index.size * 2)
+    has_mz = (ind_sp[1::2] - ind_sp[::2]) > 0  # find non-empty slices
+    # elements added at the end of mz_sp raise IndexError
+    ind_sp[ind_sp >= sp_size] = sp_size - 1
+    # this adds the values between two consecutive indices
+    tmp_eic = np.where(has_mz, np.add.reduceat(sp_spint, ind_sp)[::2], 0)
+    if accumulator == "mean":
+        norm = ind_sp[1::2] - ind_sp[::2]
+        norm[norm == 0] = 1
+        tmp_eic = tmp_eic / norm
+    return tmp_eic
+
+
+def _iterate_eic_csr(
+    rt: np.ndarray,
+    is_empty: np.ndarray,
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    data: np.ndarray,
+    fill_missing: bool,
+    separation: str,
+) -> Generator[Chromatogram, None, None]:
+    """
+    Yields chromatograms from EICs stored in a compressed sparse row layout.
+
+    auxiliary function for make_chromatograms.
+
+    """
+    for start, end in zip(indptr[:-1], indptr[1:]):
+        spint = np.zeros(rt.size)
+        if not fill_missing:
+            spint[is_empty] = np.nan
+        spint[indices[start:end]] = data[start:end]
+        yield Chromatogram(rt.copy(), spint, mode=separation)
 
 
 @val.validate_raw_data_utils(val.make_roi_schema)
@@ -182,6 +467,8 @@ def make_roi(
     end_time: Optional[float] = None,
     min_snr: float = 10,
     min_distance: Optional[float] = None,
+    prefetch: int = 0,
+    n_jobs: Optional[int] = None,
 ) -> List[Roi]:
     """
     Builds regions of interest (ROI) from raw data.
@@ -253,6 +540,17 @@ def make_roi(
         is set to 0.01 if ``ms_data.instrument`` is ``"qtof"`` or to 0.005 if
         ``ms_data.instrument`` is ``"orbitrap"``. Used only to convert profile
         data to centroid mode.
+    prefetch : int, default=0
+        Number of spectra decoded in advance in background threads, while the
+        current spectrum is used to build ROI. See
+        :meth:`MSData.get_spectra_iterator`.
+    n_jobs: int or None, default=None
+        Number of jobs to run in parallel. ``None`` means 1 unless in a
+        :obj:`joblib.parallel_backend` context. ``-1`` means using all
+        processors. If more than one job is used, the m/z axis is split into
+        bands separated by gaps wider than `tolerance` and ROI in each band
+        are built in parallel. The result is the same as the one obtained
+        using a single job, but the centroided spectra are kept in memory.
 
     Returns
     -------
@@ -265,12 +563,125 @@ def make_roi(
     lcms.LCRoi : ROI used in LC data.
 
     """
+    roi_iterator = _iterate_roi(
+        ms_data,
+        tolerance=tolerance,
+        max_missing=max_missing,
+        min_length=min_length,
+        min_intensity=min_intensity,
+        multiple_match=multiple_match,
+        mz_reduce=mz_reduce,
+        sp_reduce=sp_reduce,
+        targeted_mz=targeted_mz,
+        pad=pad,
+        ms_level=ms_level,
+        start_time=start_time,
+        end_time=end_time,
+        min_snr=min_snr,
+        min_distance=min_distance,
+        prefetch=prefetch,
+        n_jobs=n_jobs,
+    )
+    return list(roi_iterator)
+
 
+@val.validate_raw_data_utils(val.make_roi_schema)
+def make_roi_iterator(
+    ms_data: MSData,
+    *,
+    tolerance: Optional[float] = None,
+    max_missing: Optional[int] = None,
+    min_length: Optional[int] = None,
+    min_intensity: float = 0.0,
+    multiple_match: str = "reduce",
+    mz_reduce: Union[str, Callable] = "mean",
+    sp_reduce: Union[str, Callable] = "sum",
+    targeted_mz: Optional[np.ndarray] = None,
+    pad: Optional[int] = None,
+    ms_level: int = 1,
+    start_time: float = 0.0,
+    end_time: Optional[float] = None,
+    min_snr: float = 10,
+    min_distance: Optional[float] = None,
+    prefetch: int = 0,
+    n_jobs: Optional[int] = None,
+) -> Generator[Roi, None, None]:
+    """
+    Yields regions of interest (ROI) built from raw data.
+
+    Creates the same ROI as :func:`make_roi`, but each ROI is yielded as soon
+    as it is completed, instead of storing all ROI in a list. If a single job
+    is used, only the ROI that are being extended are kept in memory.
+
+    Parameters
+    ----------
+    ms_data : MSData
+    **kwargs :
+        See :func:`make_roi` for a description of each parameter. If more than
+        one job is used, all ROI are built before yielding the first one.
+
+    Yields
+    ------
+    roi : Roi
+
+    See Also
+    --------
+    make_roi : Builds a list of ROI.
+
+    """
+    return _iterate_roi(
+        ms_data,
+        tolerance=tolerance,
+        max_missing=max_missing,
+        min_length=min_length,
+        min_intensity=min_intensity,
+        multiple_match=multiple_match,
+        mz_reduce=mz_reduce,
+        sp_reduce=sp_reduce,
+        targeted_mz=targeted_mz,
+        pad=pad,
+        ms_level=ms_level,
+        start_time=start_time,
+        end_time=end_time,
+        min_snr=min_snr,
+        min_distance=min_distance,
+        prefetch=prefetch,
+        n_jobs=n_jobs,
+    )
+
+
+def _iterate_roi(
+    ms_data: MSData,
+    *,
+    tolerance: Optional[float],
+    max_missing: Optional[int],
+    min_length: Optional[int],
+    min_intensity: float,
+    multiple_match: str,
+    mz_reduce: Union[str, Callable],
+    sp_reduce: Union[str, Callable],
+    targeted_mz: Optional[np.ndarray],
+    pad: Optional[int],
+    ms_level: int,
+    start_time: float,
+    end_time: Optional[float],
+    min_snr: float,
+    min_distance: Optional[float],
+    prefetch: int,
+    n_jobs: Optional[int],
+) -> Generator[Roi, None, None]:
+    """
+    Yields ROI in the order in which they are completed.
+
+    Auxiliary function to make_roi. Parameters are already validated. See
+    make_roi for a description of each parameter.
+
+    """
     if targeted_mz is None:
         if min_intensity is None:
             mz_filter = None
         else:
-            mz_filter = _make_mz_filter(ms_data, min_intensity, ms_level, start_time, end_time)
+            mz_filter = _make_mz_filter(ms_data, min_intensity, ms_level, start_time, end_time, prefetch)
         targeted = False
     else:
         mz_filter = np.sort(targeted_mz)
@@ -281,40 +692,297 @@ def make_roi(
 
     if sp_reduce == "sum":
         sp_reduce = np.sum
+    elif sp_reduce == "mean":
+        sp_reduce = np.mean
+
+    # default values are set during validation, but pad may be set to None
+    if pad is None:
+        pad = 2
+
+    roi_maker_params = {
+        "max_missing": max_missing,
+        "min_length": min_length,
+        "min_intensity": min_intensity,
+        "tolerance": tolerance,
+        "multiple_match": multiple_match,
+        "mz_reduce": mz_reduce,
+        "sp_reduce": sp_reduce,
+        "targeted": targeted,
+    }
+
+    n_spectra = ms_data.get_n_spectra()
+    rt = np.zeros(n_spectra)
+    sp_iterator = ms_data.get_spectra_iterator(ms_level=ms_level, start_time=start_time, end_time=end_time, prefetch=prefetch)
+    if effective_n_jobs(n_jobs) > 1:
+        roi_iterator = iter(
+            _make_roi_parallel(
+                sp_iterator,
+                rt,
+                mz_filter,
+                min_snr,
+                min_distance,
+                pad,
+                ms_data.separation,
+                roi_maker_params,
+                n_jobs,
+            )
+        )
+    else:
+        roi_iterator = _iterate_roi_serial(sp_iterator, n_spectra, rt, mz_filter, min_snr, min_distance, pad, ms_data.separation, roi_maker_params)
 
-    rt = np.zeros(ms_data.get_n_spectra())
-    processor = _RoiMaker(
-        mz_filter,
-        max_missing=max_missing,
-        min_length=min_length,
-        min_intensity=min_intensity,
-        tolerance=tolerance,
-        multiple_match=multiple_match,
-        mz_reduce=mz_reduce,
-        sp_reduce=sp_reduce,
-        targeted=targeted,
-    )
+    # TODO: workaround, move code to _RoiMaker
+    for k, roi in enumerate(roi_iterator):
+        roi.index = k
+        yield roi
+
+
+def _iterate_roi_serial(
+    sp_iterator,
+    n_spectra: int,
+    rt: np.ndarray,
+    mz_filter: Optional[np.ndarray],
+    min_snr: float,
+    min_distance: Optional[float],
+    pad: int,
+    separation: str,
+    roi_maker_params: dict,
+) -> Generator[Roi, None, None]:
+    """
+    Yields ROI as soon as they are completed and padded.
 
-    scans = list()
-    sp_iterator = ms_data.get_spectra_iterator(ms_level=ms_level, start_time=start_time, end_time=end_time)
+    Auxiliary function to make_roi.
+
+    """
+    processor = _RoiMaker(mz_filter, **roi_maker_params)
+    scans = np.zeros(n_spectra, dtype=int)
+    n_scans = 0
     for scan, spectrum in sp_iterator:
         rt[scan] = spectrum.time
-        scans.append(scan)
+        scans[n_scans] = scan
+        n_scans += 1
         mz, sp = spectrum.find_centroids(min_snr, min_distance)
         processor.feed_spectrum(mz, sp, scan)
         processor.clear_completed_roi()
+        yield from processor.iterate_completed_roi(scans[:n_scans], rt, pad, separation)
 
     # add roi not completed during the last scan
     processor.flag_as_completed()
     processor.clear_completed_roi()
-    scans = np.array(scans)
-    roi_list = processor.tmp_roi_to_roi(scans, rt, pad, ms_data.separation)
+    yield from processor.tmp_roi_to_roi(scans[:n_scans], rt, pad, separation)
+
+
+def _make_roi_parallel(
+    sp_iterator,
+    rt: np.ndarray,
+    mz_filter: Optional[np.ndarray],
+    min_snr: float,
+    min_distance: Optional[float],
+    pad: int,
+    separation: str,
+    roi_maker_params: dict,
+    n_jobs: Optional[int],
+) -> List[Roi]:
+    """
+    Builds ROI splitting the m/z axis into independent bands that are
+    processed in parallel.
 
-    # TODO: workaround, move code to _RoiMaker
-    for k, roi in enumerate(roi_list):
-        roi.index = k
+    Auxiliary function to make_roi.
 
-    return roi_list
+    Parameters
+    ----------
+    sp_iterator : Generator
+        Yields scan number and spectrum pairs.
+    rt : array
+        Acquisition time of each scan. Filled with the time of each spectrum
+        yielded by `sp_iterator`.
+    mz_filter : array or None
+        m/z values used as a first filter for the values of spectra.
+    min_snr : float
+    min_distance : float or None
+    pad : int
+    separation : str
+    roi_maker_params : dict
+        Parameters passed to _RoiMaker.
+    n_jobs : int or None
+
+    Returns
+    -------
+    roi_list : List[Roi]
+        ROI sorted in the same order as the ones created by a single
+        _RoiMaker.
+
+    Notes
+    -----
+    Bands are split at gaps between consecutive m/z values (including the
+    values in `mz_filter`) wider than twice the tolerance. The mean of a ROI
+    is always between the minimum and maximum m/z in its band, and therefore
+    values from different bands are never matched. Each band is processed by
+    an independent _RoiMaker, that records the scan where each ROI was
+    completed. ROI are merged by sorting them by completion scan, using a
+    stable sort to keep the m/z order of ROI completed during the same scan.
+
+    """
+    tolerance = roi_maker_params["tolerance"]
+    scans = list()
+    mz_list = list()
+    sp_list = list()
+    for scan, spectrum in sp_iterator:
+        rt[scan] = spectrum.time
+        scans.append(scan)
+        mz, sp = spectrum.find_centroids(min_snr, min_distance)
+        if mz_filter is not None and mz_filter.size:
+            mz, sp = _filter_invalid_mz(mz_filter, mz, sp, tolerance)
+        mz_list.append(mz)
+        sp_list.append(sp)
+    scans = np.array(scans, dtype=int)
+    scan_index = np.repeat(np.arange(scans.size), [x.size for x in mz_list])
+    mz = np.hstack(mz_list) if mz_list else np.array([])
+    sp = np.hstack(sp_list) if sp_list else np.array([])
+
+    cuts = _find_mz_band_cuts(mz, mz_filter, tolerance, effective_n_jobs(n_jobs))
+    band = np.searchsorted(cuts, mz)
+    if mz_filter is None:
+        filter_band = None
+    else:
+        filter_band = np.searchsorted(cuts, mz_filter)
+
+    args = list()
+    for k in range(cuts.size + 1):
+        if filter_band is None:
+            band_filter = None
+        else:
+            band_filter = mz_filter[filter_band == k]
+            if not band_filter.size:
+                # no ROI can be created without m/z values to seed them
+                continue
+        mask = band == k
+        offsets = np.searchsorted(scan_index[mask], np.arange(scans.size + 1))
+        args.append((mz[mask], sp[mask], offsets, band_filter))
+
+    func = delayed(_make_roi_band)
+    results = Parallel(n_jobs=n_jobs)(
+        func(band_mz, band_sp, offsets, scans, rt, band_filter, pad, separation, roi_maker_params)
+        for band_mz, band_sp, offsets, band_filter in args
+    )
+    roi_list = list()
+    completed = list()
+    for band_roi, band_completed in results:
+        roi_list.extend(band_roi)
+        completed.append(band_completed)
+    if not roi_list:
+        return roi_list
+    order = np.argsort(np.hstack(completed), kind="stable")
+    return [roi_list[k] for k in order]
+
+
+def _find_mz_band_cuts(
+    mz: np.ndarray,
+    mz_filter: Optional[np.ndarray],
+    tolerance: float,
+    n_bands: int,
+) -> np.ndarray:
+    """
+    Computes m/z values used to split m/z data into independent bands with
+    approximately the same number of values.
+
+    Auxiliary function to make_roi.
+
+    Parameters
+    ----------
+    mz : array
+        m/z values from all spectra.
+    mz_filter : array or None
+        m/z values used to filter the spectra.
+    tolerance : float
+        m/z tolerance used to build ROI. Bands are split only at gaps wider
+        than twice this value.
+    n_bands : int
+        Maximum number of bands.
+
+    Returns
+    -------
+    cuts : array
+        Sorted m/z values at the middle of the gaps used to split the data.
+        May be empty if the data cannot be split.
+
+    """
+    mz = np.sort(mz)
+    if mz_filter is None:
+        values = mz
+    else:
+        values = np.union1d(mz, mz_filter)
+    gap = np.diff(values)
+    gap_index = np.where(gap > 2 * tolerance)[0]
+    if (n_bands < 2) or (not gap_index.size) or (not mz.size):
+        return np.array([])
+
+    candidates = (values[gap_index] + values[gap_index + 1]) / 2
+    # pick the gaps closest to the quantiles of the m/z values
+    count = np.searchsorted(mz, candidates)
+    quantiles = mz.size * np.arange(1, n_bands) / n_bands
+    index = np.searchsorted(count, quantiles)
+    index = np.minimum(index, count.size - 1)
+    previous = np.maximum(index - 1, 0)
+    use_previous = np.abs(count[previous] - quantiles) <= np.abs(count[index] - quantiles)
+    index = np.where(use_previous, previous, index)
+    return np.unique(candidates[index])
+
+
+def _make_roi_band(
+    mz: np.ndarray,
+    sp: np.ndarray,
+    offsets: np.ndarray,
+    scans: np.ndarray,
+    rt: np.ndarray,
+    mz_filter: Optional[np.ndarray],
+    pad: int,
+    separation: str,
+    roi_maker_params: dict,
+) -> Tuple[List[Roi], np.ndarray]:
+    """
+    Builds ROI using the values in an m/z band.
+
+    Auxiliary function to make_roi.
+
+    Parameters
+    ----------
+    mz : array
+        Concatenated m/z values of the band from all scans.
+    sp : array
+        Intensity values associated with each m/z value.
+    offsets : array
+        Values from the k-th scan are in ``mz[offsets[k]:offsets[k + 1]]``.
+    scans : array
+        scan number of each spectrum.
+    rt : array
+        acquisition time of each scan.
+    mz_filter : array or None
+        m/z values in the band used to filter spectra.
+    pad : int
+    separation : str
+    roi_maker_params : dict
+        Parameters passed to _RoiMaker.
+
+    Returns
+    -------
+    roi_list : List[Roi]
+    completed : array
+        Index of the scan where each ROI was completed.
+
+    """
+    processor = _RoiMaker(mz_filter, **roi_maker_params)
+    n_valid = list()
+    for k, scan in enumerate(scans):
+        start, end = offsets[k], offsets[k + 1]
+        processor.feed_spectrum(mz[start:end], sp[start:end], scan)
+        processor.clear_completed_roi()
+        n_valid.append(len(processor.valid_roi))
+    processor.flag_as_completed()
+    processor.clear_completed_roi()
+    n_valid.append(len(processor.valid_roi))
+    completed = np.repeat(np.arange(len(n_valid)), np.diff(n_valid, prepend=0))
+    roi_list = processor.tmp_roi_to_roi(scans, rt, pad, separation)
+    return roi_list, completed
 
 
 @val.validate_raw_data_utils(val.accumulate_spectra_schema)
@@ -485,6 +1153,116 @@ def _accumulate_spectra_profile(
     return res
 
 
+def centroid_ms_data(
+    ms_data: MSData,
+    *,
+    min_snr: float = 10.0,
+    min_distance: Optional[float] = None,
+    chunk_size: int = 200,
+    n_jobs: Optional[int] = None,
+) -> MSData_in_memory:
+    """
+    Centroids all spectra in a file.
+
+    Spectra are read in chunks of consecutive scans. Chunks are centroided in
+    parallel, processing all profile spectra in a chunk at once. The result is
+    the same as the one obtained using ``MSSpectrum.find_centroids`` in each
+    spectrum.
+
+    Parameters
+    ----------
+    ms_data : MSData
+    min_snr : positive number, default=10.0
+        Minimum signal-to-noise ratio of the peaks.
+    min_distance : positive number or None, default=None
+        Minimum distance between consecutive peaks. If ``None``, the value is
+        set using the instrument of each spectrum, as in
+        ``MSSpectrum.find_centroids``.
+    chunk_size : int, default=200
+        Number of spectra centroided in each job.
+    n_jobs : int or None, default=None
+        Number of jobs to run in parallel. ``None`` means 1 unless in a
+        :obj:`joblib.parallel_backend` context. ``-1`` means using all
+        processors.
+
+    Returns
+    -------
+    MSData_in_memory
+        The centroided data, in centroid mode. Spectra already in centroid
+        mode and empty spectra are not modified.
+
+    """
+    func = delayed(_centroid_spectra)
+    results = Parallel(n_jobs=n_jobs)(
+        func(spectra, min_snr, min_distance)
+        for spectra in _iterate_spectra_chunks(ms_data, chunk_size)
+    )
+    centroided = MSData_in_memory(
+        ms_mode="centroid",
+        instrument=ms_data.instrument,
+        separation=ms_data.separation,
+    )
+    centroided._set_spectra([sp for spectra in results for sp in spectra])
+    return centroided
+
+
+def _iterate_spectra_chunks(ms_data: MSData, chunk_size: int) -> Generator[List[MSSpectrum], None, None]:
+    """
+    Yields lists of consecutive spectra.
+
+    auxiliary function for centroid_ms_data.
+
+    """
+    n_spectra = ms_data.get_n_spectra()
+    for start in range(0, n_spectra, chunk_size):
+        end = min(start + chunk_size, n_spectra)
+        yield [ms_data.get_spectrum(k) for k in range(start, end)]
+
+
+def _centroid_spectra(
+    spectra: List[MSSpectrum], min_snr: float, min_distance: Optional[float]
+) -> List[MSSpectrum]:
+    """
+    Centroids a list of spectra.
+
+    auxiliary function for centroid_ms_data.
+
+    """
+    centroids = [(sp.mz, sp.spint) for sp in spectra]
+    # profile spectra are grouped by the minimum distance between centroids
+    profile = dict()
+    for k, sp in enumerate(spectra):
+        if not sp.is_centroid and sp.spint.size:
+            if min_distance is None:
+                sp_min_distance = get_find_centroid_params(sp.instrument)["min_distance"]
+            else:
+                sp_min_distance = min_distance
+            profile.setdefault(sp_min_distance, list()).append(k)
+
+    for sp_min_distance, index in profile.items():
+        mz_list = [spectra[k].mz for k in index]
+        spint_list = [spectra[k].spint for k in index]
+        mz_list, spint_list = find_centroids_batch(mz_list, spint_list, min_snr, sp_min_distance)
+        for k, mz, spint in zip(index, mz_list, spint_list):
+            # sort centroids, as in MSSpectrum.find_centroids
+            sorted_index = np.argsort(mz)
+            centroids[k] = mz[sorted_index], spint[sorted_index]
+
+    res = list()
+    for sp, (mz, spint) in zip(spectra, centroids):
+        centroid_sp = MSSpectrum(
+            mz,
+            spint,
+            time=sp.time,
+            ms_level=sp.ms_level,
+            polarity=sp.polarity,
+            instrument=sp.instrument,
+            is_centroid=True,
+        )
+        res.append(centroid_sp)
+    return res
+
+
 class _RoiMaker:
     """
     Creates and extends ROIs using spectrum data.
@@ -493,7 +1271,7 @@ class _RoiMaker:
 
     Attributes
     ----------
-    tmp_roi_list : _TempRoiList
+    tmp_roi_list : _TempRoiBuffer
     valid_roi : List
         Valid ROI.
     mz_filter : sorted array
@@ -545,7 +1323,7 @@ class _RoiMaker:
         sp_reduce: Optional[Callable],
         targeted: bool = False,
     ):
-        self.tmp_roi_list = _TempRoiList(update_mean=not targeted)
+        self.tmp_roi_list = _TempRoiBuffer(update_mean=not targeted)
         self.valid_roi = deque()
         self.mz_filter = mz_filter
         self.max_missing = max_missing
@@ -567,16 +1345,21 @@ class _RoiMaker:
         Parameters
         ----------
         mz : array
-            sorted array of m/z
+            array of m/z. Sorted if it is not in ascending order.
         sp : array
             Intensity array associated with each m/z value.
         scan : int
             scan number associated with the spectrum.
 
         """
+        # _match_mz reduces multiple matches assuming that they are contiguous
+        if np.any(np.diff(mz) < 0):
+            sorted_index = np.argsort(mz, kind="stable")
+            mz = mz[sorted_index]
+            sp = sp[sorted_index]
         if self.mz_filter is not None:
             mz, sp = _filter_invalid_mz(self.mz_filter, mz, sp, self.tolerance)
-        if self.tmp_roi_list.roi:
+        if self.tmp_roi_list.mz_mean.size:
             match_ind, match_mz, match_sp, no_match_mz, no_match_sp = _match_mz(
                 self.tmp_roi_list.mz_mean,
                 mz,
@@ -610,11 +1393,7 @@ class _RoiMaker:
             valid_mask &= self.tmp_roi_list.length >= self.min_length
 
         valid_index = np.where(valid_mask)[0]
-
-        for i in valid_index:
-            r = deepcopy(self.tmp_roi_list.roi[i])
-            self.valid_roi.append(r)
-
+        self.valid_roi.extend(self.tmp_roi_list.get_roi(valid_index))
         self.tmp_roi_list.clear(finished_roi_index)
 
     def flag_as_completed(self):
@@ -652,6 +1431,42 @@ class _RoiMaker:
             valid_roi.append(roi)
         return valid_roi
 
+    def iterate_completed_roi(self, valid_scan: np.ndarray, time: np.ndarray, pad: int, separation: str) -> Generator[Roi, None, None]:
+        """
+        Converts completed valid _TempRoi objects into Roi, while there are
+        enough scans to pad them.
+
+        Valid ROI are converted in the order in which they were completed. A
+        ROI is converted only if there are `pad` scans after its last scan in
+        `valid_scan`. The remaining ROI are converted using `tmp_roi_to_roi`
+        after all scans are processed.
+
+        Parameters
+        ----------
+        valid_scan : array
+            scan values processed so far.
+        time : array
+            acquisition time of each scan.
+        pad : int
+            Number of dummy values to pad each ROI.
+        separation : str
+            Separation method of the ms file. Used to create LCRoi objects or
+            Roi objects.
+
+        Yields
+        ------
+        roi: Roi
+
+        """
+        while self.valid_roi:
+            tmp = self.valid_roi[0]
+            end = np.searchsorted(valid_scan, tmp.scan[-1], side="right")
+            if end + pad > valid_scan.size:
+                break
+            self.valid_roi.popleft()
+            tmp.pad(pad, valid_scan)
+            yield tmp.convert_to_roi(time, valid_scan, separation)
+
 
 class _TempRoiList:
     """
@@ -763,10 +1578,187 @@ class _TempRoiList:
         self.missing_count[index] = 0
         self.length[index] = 0
 
+    def get_roi(self, index: np.ndarray) -> List["_TempRoi"]:
+        """
+        Creates a copy of the ROI in `index`.
+
+        """
+        return [deepcopy(self.roi[i]) for i in index]
+
+    def initialize(self, mz: np.ndarray):
+        self.insert(mz, mz, 0)
+        self.clear(np.arange(mz.size))
+
+
+class _TempRoiBuffer:
+    """
+    Container object of Temporary ROI, backed by arrays.
+
+    Auxiliary class used in make_roi. Has the same interface as _TempRoiList,
+    but the data of all ROI are stored in growable arrays, so insert, extend
+    and clear operations do not iterate over ROI.
+
+    Each ROI is identified by a slot number. The m/z, intensity and scan values
+    appended to ROI are stored in the order in which they were added, along
+    with the slot of the ROI. The values of a ROI are gathered when it is
+    cleared.
+
+    Attributes
+    ----------
+    mz_mean : array[float]
+        tracks the mean m/z value of each ROI. Sorted.
+    mz_sum : array[float]
+        Sum of m/z values in each ROI, used to update the mean.
+    max_int : array[float[
+        Maximum intensity stored in each ROI.
+    missing_count : array[int]
+        Number of times that a ROI has not been extended after calling `extend`.
+        Each time that a ROI is extended the count is reset to 0.
+    length : array[int]
+        Number of elements in each ROI.
+    slot : array[int]
+        Slot number of each ROI.
+    update_mean : bool
+        If ``True``, the mean of each ROI is updated after a new element is
+        appended. Else, the mean when the ROI was created is used.
+
+    """
+
+    def __init__(self, update_mean: bool = True, capacity: int = 1024):
+        self.mz_mean = np.array([])
+        self.mz_sum = np.array([])
+        self.max_int = np.array([])
+        self.missing_count = np.array([], dtype=int)
+        self.length = np.array([], dtype=int)
+        self.slot = np.array([], dtype=int)
+        self.update_mean = update_mean
+        self._n_slots = 0
+        # values stored in ROI
+        self._size = 0
+        self._mz = np.zeros(capacity)
+        self._spint = np.zeros(capacity)
+        self._scan = np.zeros(capacity, dtype=int)
+        self._slot = np.zeros(capacity, dtype=int)
+
+    def insert(self, mz: np.ndarray, sp: np.ndarray, scan: int):
+        """
+        Creates new ROI and insert them while keeping the order.
+
+        Parameters
+        ----------
+        mz : array
+            sorted m/z values used to initialize the new ROIs.
+        sp:  array
+            Intensity values used to initialize the new ROIs.
+        scan: int
+            scan number used to initialize the new ROIs.
+
+        """
+        index = np.searchsorted(self.mz_mean, mz)
+        new_slot = np.arange(self._n_slots, self._n_slots + mz.size)
+        self._n_slots += mz.size
+        # update roi tracking values
+        self.mz_mean = np.insert(self.mz_mean, index, mz)
+        self.mz_sum = np.insert(self.mz_sum, index, mz)
+        self.max_int = np.insert(self.max_int, index, sp)
+        self.missing_count = np.insert(self.missing_count, index, np.zeros_like(index))
+        self.length = np.insert(self.length, index, np.ones_like(index))
+        self.slot = np.insert(self.slot, index, new_slot)
+        self._append(mz, sp, scan, new_slot)
+
+    def extend(self, mz: np.ndarray, sp: np.ndarray, scan: int, index: np.ndarray):
+        """
+        Extends existing ROI.
+
+        Parameters
+        ----------
+        mz : array
+            m/z values used to extend the ROI
+        sp : array
+            Intensity values used to extend the ROI
+        scan : int
+            Scan number used to extend the ROI
+        index : array
+            Indices of the ROI to extend.
+
+        """
+        self._append(mz, sp, scan, self.slot[index])
+        self.length[index] += 1
+        if self.update_mean:
+            self.mz_sum[index] += mz
+            self.mz_mean[index] = self.mz_sum[index] / self.length[index]
+        self.max_int[index] = np.maximum(self.max_int[index], sp)
+        self.missing_count += 1
+        self.missing_count[index] = 0
+
+    def clear(self, index: np.ndarray):
+        """
+        Empties the m/z, intensity and scan values stored in each ROI. The
+        mean value of each ROI is kept.
+
+        Parameters
+        ----------
+        index : array
+            Indices of ROI to clear.
+
+        """
+        if len(index):
+            keep = ~np.isin(self._slot[:self._size], self.slot[index])
+            n_keep = np.count_nonzero(keep)
+            for arr in [self._mz, self._spint, self._scan, self._slot]:
+                arr[:n_keep] = arr[:self._size][keep]
+            self._size = n_keep
+
+        self.mz_sum[index] = 0
+        self.max_int[index] = 0
+        self.missing_count[index] = 0
+        self.length[index] = 0
+
+    def get_roi(self, index: np.ndarray) -> List["_TempRoi"]:
+        """
+        Creates a _TempRoi with the values of each ROI in `index`.
+
+        """
+        if not len(index):
+            return list()
+        slot = self.slot[index]
+        selected = np.where(np.isin(self._slot[:self._size], slot))[0]
+        # a stable sort keeps the values of each ROI in the order in which
+        # they were appended
+        selected = selected[np.argsort(self._slot[selected], kind="stable")]
+        selected_slot = self._slot[selected]
+        start = np.searchsorted(selected_slot, slot, side="left")
+        end = np.searchsorted(selected_slot, slot, side="right")
+        roi_list = list()
+        for s, e in zip(start, end):
+            k = selected[s:e]
+            roi = _TempRoi.from_arrays(self._mz[k], self._spint[k], self._scan[k])
+            roi_list.append(roi)
+        return roi_list
+
     def initialize(self, mz: np.ndarray):
         self.insert(mz, mz, 0)
         self.clear(np.arange(mz.size))
 
+    def _append(self, mz: np.ndarray, sp: np.ndarray, scan: int, slot: np.ndarray):
+        """
+        Stores values appended to ROI.
+
+        """
+        size = self._size + slot.size
+        if size > self._mz.size:
+            capacity = max(size, 2 * self._mz.size)
+            for name in ["_mz", "_spint", "_scan", "_slot"]:
+                arr = getattr(self, name)
+                new_arr = np.zeros(capacity, dtype=arr.dtype)
+                new_arr[:self._size] = arr[:self._size]
+                setattr(self, name, new_arr)
+        self._mz[self._size:size] = mz
+        self._spint[self._size:size] = sp
+        self._scan[self._size:size] = scan
+        self._slot[self._size:size] = slot
+        self._size = size
+
 
 class _TempRoi:
     """
@@ -791,6 +1783,18 @@ class _TempRoi:
         self.spint = deque()
         self.scan = deque()
 
+    @staticmethod
+    def from_arrays(mz: np.ndarray, spint: np.ndarray, scan: np.ndarray) -> "_TempRoi":
+        """
+        Creates a Temporary ROI using arrays of m/z, intensity and scan values.
+
+        """
+        roi = _TempRoi()
+        roi.mz = deque(mz)
+        roi.spint = deque(spint)
+        roi.scan = deque(scan)
+        return roi
+
     def append(self, mz: float, spint: float, scan: int):
         """
         Append new m/z, intensity and scan values.
@@ -910,6 +1914,7 @@ def _make_mz_filter(
     ms_level: int,
     start_time: float,
     end_time: float,
+    prefetch: int = 0,
 ):
     """
     Creates a list of m/z values to initialize ROI for untargeted feature
@@ -928,12 +1933,14 @@ def _make_mz_filter(
         Ignore scans with acquisition times lower than this value.
     end_time : float or None, default=None
         Ignore scans with acquisition times higher than this value.
+    prefetch : int, default=0
+        Number of spectra decoded in advance in background threads.
 
     Returns
     -------
 
     """
-    iterator = ms_data.get_spectra_iterator(ms_level=ms_level, start_time=start_time, end_time=end_time)
+    iterator = ms_data.get_spectra_iterator(ms_level=ms_level, start_time=start_time, end_time=end_time, prefetch=prefetch)
     mz_seed = [sp.mz[sp.spint > min_intensity] for _, sp in iterator]
     return np.unique(np.hstack(mz_seed))
 
@@ -1029,6 +2036,36 @@ def _create_roi_list(mz: np.ndarray, sp: np.ndarray, scan: int) -> List[_TempRoi
     return roi_list
 
 
+# reduce functions that are applied to all groups of multiple matches at once
+_GROUP_REDUCE = ("mean", "sum", np.mean, np.sum)
+
+
+def _reduce_groups(x: np.ndarray, first: np.ndarray, count: np.ndarray, func: Union[str, Callable]) -> np.ndarray:
+    """
+    Computes the sum or the mean of groups of consecutive values.
+
+    Auxiliary function to _match_mz.
+
+    Parameters
+    ----------
+    x : array
+    first : array
+        Index of the first element of each group.
+    count : array
+        Number of elements in each group.
+    func : {"mean", "sum", np.mean, np.sum}
+
+    Returns
+    -------
+    array
+
+    """
+    total = np.add.reduceat(x, first)
+    if (func is np.mean) or (isinstance(func, str) and func == "mean"):
+        return total / count
+    return total
+
+
 def _match_mz(
     mz1: np.ndarray,
     mz2: np.ndarray,
@@ -1057,6 +2094,12 @@ def _match_mz(
         match and the others are assigned to no match. If mode is `merge`, then
         a unique mz and int value is generated using the average of the mz and
         the sum of the intensities.
+    mz_reduce: Callable or {"mean", "sum"}
+        Function used to reduce multiple m/z matches in `reduce` mode. The
+        mean and the sum are computed for all matches at once. Other functions
+        are called once for each group of multiple matches.
+    sp_reduce: Callable or {"mean", "sum"}
+        Function used to reduce multiple intensity matches in `reduce` mode.
 
     Returns
     ------
@@ -1089,24 +2132,30 @@ def _match_mz(
     if match_first.size > 0:
         multiple_match_count = match_count[multiple_match_mask]
         if mode == "reduce":
+            # mz1 and mz2 are both sorted, the multiple matches are
+            # consecutive
+            if mz_reduce in _GROUP_REDUCE:
+                mz_match[match_first] = _reduce_groups(mz_match, match_first, match_count, mz_reduce)
+            if sp_reduce in _GROUP_REDUCE:
+                sp_match[match_first] = _reduce_groups(sp_match, match_first, match_count, sp_reduce)
+            # custom reduce functions are applied to each group
             for first, count in zip(multiple_match_first, multiple_match_count):
-                # mz1 and mz2 are both sorted, the multiple matches are
-                # consecutive
-                mz_multiple_match = mz_match[first : (first + count)]
-                sp_multiple_match = sp_match[first : (first + count)]
-                mz_match[first] = mz_reduce(mz_multiple_match)
-                sp_match[first] = sp_reduce(sp_multiple_match)
+                if mz_reduce not in _GROUP_REDUCE:
+                    mz_match[first] = mz_reduce(mz_match[first : (first + count)])
+                if sp_reduce not in _GROUP_REDUCE:
+                    sp_match[first] = sp_reduce(sp_match[first : (first + count)])
         elif mode == "closest":
-            match_index_mz = np.where(match_mask)[0][match_first]
-            multiple_match_index_mz = match_index_mz[multiple_match_mask]
-            iterator = zip(multiple_match_index_mz, multiple_match_first, multiple_match_count)
-            for mz2_index, first, count in iterator:
-                closest = np.argmin(dmz[mz2_index : mz2_index + count])
-                # flag all multiple matches as no match except the closest one
-                no_match_mask[mz2_index : mz2_index + count] = True
-                no_match_mask[mz2_index + closest] = False
-                mz_match[first] = mz_match[first + closest]
-                sp_match[first] = sp_match[first + closest]
+            match_index_mz = np.where(match_mask)[0]
+            # sort the matches of each group by distance. The sort is stable,
+            # so the first match is selected if there is a tie, as in argmin.
+            group = np.repeat(np.arange(match_first.size), match_count)
+            sorted_index = np.lexsort((dmz[match_index_mz], group))
+            closest = sorted_index[match_first]
+            # flag all multiple matches as no match except the closest one
+            no_match_mask[match_index_mz] = True
+            no_match_mask[match_index_mz[closest]] = False
+            mz_match[match_first] = mz_match[closest]
+            sp_match[match_first] = sp_match[closest]
         else:
             msg = "mode must be `closest` or `merge`"
             raise ValueError(msg)
@@ -361,7 +361,18 @@ def make_chromatogram_schema(ms_data) -> dict:
         "end_time": {
             "type": "number",
             "nullable": True,
-        }
+        },
+        "fill_missing": {
+            "type": "boolean",
+        },
+        "prefetch": {
+            "type": "integer",
+            "min": 0,
+        },
+        "n_jobs": {
+            "type": "integer",
+            "nullable": True,
+        },
     }
 
     defaults = make_chromatogram_defaults(ms_data)
@@ -447,7 +458,15 @@ def make_roi_schema(ms_data):
         "min_distance": {
             "type": "number",
             "is_positive": True,
-        }
+        },
+        "prefetch": {
+            "type": "integer",
+            "min": 0,
+        },
+        "n_jobs": {
+            "type": "integer",
+            "nullable": True,
+        },
     }
     defaults = make_roi_defaults(ms_data)
     set_defaults(schema, defaults)
@@ -0,0 +1,56 @@
+"""
+Compares the time required to parse the spectra of the test mzML files using
+the byte pattern parser and the ElementTree parser.
+
+Usage: python -m tests.benchmarks.bench_mzml_parser
+
+"""
+
+from tidyms import _mzml
+from tidyms.utils import get_tidyms_path
+import os
+import time
+
+mzml_files = [
+    "centroid-data-zlib-indexed-compressed.mzML",
+    "centroid-data-indexed-uncompressed.mzML",
+    "centroid-data-zlib-no-index-compressed.mzML",
+    "profile-data-zlib-indexed-compressed.mzML",
+]
+
+
+def get_spectra_xml(filename):
+    data_path = os.path.join(get_tidyms_path(), "test-raw-data", filename)
+    sp_offset, chrom_offset, index_offset = _mzml.build_offset_list(data_path)
+    xml_list = list()
+    for k in range(len(sp_offset)):
+        xml = _mzml._get_xml_data(data_path, sp_offset, chrom_offset, index_offset, k, "spectrum")
+        xml_list.append(xml)
+    return xml_list
+
+
+def benchmark(func, xml_list, n_repeat=5):
+    # the best time of several repetitions is used to reduce noise
+    best = float("inf")
+    for _ in range(n_repeat):
+        start = time.perf_counter()
+        for xml in xml_list:
+            func(xml)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    for filename in mzml_files:
+        xml_list = get_spectra_xml(filename)
+        elementtree_time = benchmark(_mzml._parse_spectrum, xml_list)
+        fast_time = benchmark(lambda x: _mzml._parse_buffer(x, 0, len(x), "spectrum"), xml_list)
+        print(
+            "{}: ElementTree {:.2f} ms, byte patterns {:.2f} ms".format(
+                filename, elementtree_time * 1000, fast_time * 1000
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
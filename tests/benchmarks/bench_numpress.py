@@ -0,0 +1,45 @@
+"""
+Compares the decoding throughput of the vectorized MS-Numpress linear decoder
+with the scalar reference decoder and with zlib decompression of the same data.
+
+Usage: python -m tests.benchmarks.bench_numpress
+
+"""
+
+from tidyms import _numpress
+from tests.unit.test_numpress import decode_linear_reference, encode_linear
+import numpy as np
+import time
+import zlib
+
+
+def benchmark(func, data, n_repeat=3):
+    # the best time of several repetitions is used to reduce noise
+    best = np.inf
+    for _ in range(n_repeat):
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    size = 100000
+    mz = np.sort(np.random.uniform(50, 1000, size))
+    numpress_data = encode_linear(mz, 1e5)
+    zlib_data = zlib.compress(mz.tobytes())
+    numpress_time = benchmark(_numpress.decode_linear, numpress_data)
+    reference_time = benchmark(decode_linear_reference, numpress_data, 1)
+    zlib_time = benchmark(zlib.decompress, zlib_data)
+    print(
+        "linear numpress: {:.1f} MB/s, reference: {:.1f} MB/s, "
+        "zlib: {:.1f} MB/s".format(
+            mz.nbytes / numpress_time / 1e6,
+            mz.nbytes / reference_time / 1e6,
+            mz.nbytes / zlib_time / 1e6,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,10 @@ import numpy as np
 import pytest
 
 from tidyms.annotation import annotation
+from tidyms.annotation.annotation_data import AnnotationData
 from tidyms.raw_data_utils import make_roi
 from tidyms.fileio import MSData_simulated
-from tidyms.lcms import Peak
+from tidyms.lcms import LCTrace, Peak
 from tidyms.chem import Formula
 
 
@@ -93,7 +94,24 @@ def test_annotate(feature_list, annotation_tools_params):
     for ft in feature_list:
         group_list = annotation_check.setdefault(ft.annotation.isotopologue_label, list())
         group_list.append(ft)
-    annotation_check.pop(-1)
+    # non-annotated features are created only if noise is detected as a feature
+    annotation_check.pop(-1, None)
     assert len(annotation_check) == 6
     for v in annotation_check.values():
         assert len(v) == 4  # features where generated with 4 isotopologues.
+
+
+def test_get_monoisotopologue_all_features_annotated():
+    size = 30
+    time = np.linspace(0, size, size)
+    scan = np.arange(size)
+    feature_list = list()
+    for mz, height in [(100.0, 10.0), (200.0, 20.0)]:
+        roi = LCTrace(time.copy(), np.full(size, height), np.full(size, mz), scan)
+        feature_list.append(Peak(10, 15, 20, roi))
+    data = AnnotationData(feature_list)
+    # the feature with the lowest height is annotated first
+    data.annotate([feature_list[0]], 1)
+    assert data.get_monoisotopologue() is feature_list[1]
+    data.annotate([feature_list[1]], 1)
+    assert data.get_monoisotopologue() is None
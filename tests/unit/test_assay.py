@@ -2,6 +2,7 @@ from tidyms import assay
 from tidyms import _constants as c
 from tidyms.lcms import LCTrace, Peak
 from tidyms import _constants as c
+import json
 import pytest
 from pathlib import Path
 import os
@@ -396,11 +397,15 @@ def detect_features_dummy(ms_data: str, **kwargs):
     results = list()
     for k in range(DummyAssay.n_roi):
         x = np.arange(DummyAssay.roi_length)
-        roi = LCTrace(x, x, x, x, "uplc")
+        roi = LCTrace(x, x, x, x, mode="uplc")
         results.append(roi)
     return results
 
 
+def detect_features_iterator_dummy(ms_data: str, **kwargs):
+    yield from detect_features_dummy(ms_data, **kwargs)
+
+
 def extract_features_dummy(roi, **kwargs):
     roi.noise = np.zeros_like(roi.spint) + 1e-8
     roi.baseline = np.zeros_like(roi.spint) + 1e-8
@@ -479,6 +484,19 @@ def test_assay_detect_features_multiple_times_with_different_params(tmpdir):
     assert True
 
 
+def test_assay_detect_features_iterator_strategy(tmpdir):
+    # ROI yielded by a generator are written as they are created
+    assay_path, data_path = create_assay_dir(tmpdir, 20)
+    create_dummy_assay_manager(assay_path, data_path, None)
+    test_assay = DummyAssay(assay_path, data_path)
+    test_assay.detect_features(strategy=detect_features_iterator_dummy, verbose=False)
+    sample_name = test_assay.manager.get_sample_names()[0]
+    roi_list = test_assay.load_roi_list(sample_name)
+    assert len(roi_list) == DummyAssay.n_roi
+    r = test_assay.load_roi(sample_name, DummyAssay.n_roi - 1)
+    assert r.spint.size == DummyAssay.roi_length
+
+
 def test_assay_load_roi(tmpdir):
     assay_path, data_path = create_assay_dir(tmpdir, 20)
     create_dummy_assay_manager(assay_path, data_path, None)
@@ -511,6 +529,37 @@ def test_assay_load_roi_list(tmpdir):
             assert r.time.size == DummyAssay.roi_length
 
 
+def test_assay_load_roi_list_text_file(tmpdir):
+    # ROI files created with previous versions store ROI as JSON strings.
+    assay_path, data_path = create_assay_dir(tmpdir, 20)
+    test_assay = DummyAssay(assay_path, data_path)
+    test_assay.detect_features(strategy=detect_features_dummy)
+    sample = test_assay.manager.get_sample_names()[0]
+    roi_path = test_assay.manager.get_roi_path(sample)
+    expected = detect_features_dummy(sample)
+    serialized = [roi.to_string() + "\n" for roi in expected]
+    header_template = "index_offset={:020d}\n"
+    offset = len(header_template.format(0))
+    index = list()
+    for s in serialized:
+        index.append([offset, len(s)])
+        offset += len(s)
+    with open(roi_path, "w", newline="\n") as fout:
+        fout.write(header_template.format(offset))
+        fout.write("".join(serialized))
+        fout.write(json.dumps(index))
+
+    roi_list = test_assay.load_roi_list(sample)
+    assert len(roi_list) == DummyAssay.n_roi
+    roi = test_assay.load_roi(sample, 1)
+    assert np.array_equal(roi.spint, expected[1].spint)
+
+    # the file is converted to the binary format
+    test_assay.extract_features(verbose=False)
+    roi_list = test_assay.load_roi_list(sample)
+    assert len(roi_list) == DummyAssay.n_roi
+
+
 def test_assay_extract_features(tmpdir):
     assay_path, data_path = create_assay_dir(tmpdir, 20)
     test_assay = DummyAssay(assay_path, data_path)
@@ -539,6 +588,61 @@ def test_assay_extract_features_saved_features(tmpdir):
             assert len(r.features) == DummyAssay.n_ft
 
 
+def test_assay_extract_features_does_not_modify_roi_file(tmpdir):
+    assay_path, data_path = create_assay_dir(tmpdir, 20)
+    test_assay = DummyAssay(assay_path, data_path)
+    test_assay.detect_features(strategy=detect_features_dummy)
+    sample = test_assay.manager.get_sample_names()[0]
+    roi_path = test_assay.manager.get_roi_path(sample)
+    roi_bytes = roi_path.read_bytes()
+    test_assay.extract_features(strategy=extract_features_dummy, verbose=False)
+    test_assay.describe_features(verbose=False)
+    assert roi_path.read_bytes() == roi_bytes
+    for step in [c.EXTRACT_FEATURES, c.DESCRIBE_FEATURES]:
+        assert test_assay.manager.get_roi_sidecar_path(sample, step).is_file()
+    roi = test_assay.load_roi(sample, 0)
+    assert np.array_equal(roi.noise, np.zeros_like(roi.spint) + 1e-8)
+    assert roi.features is not None
+
+    # sidecar files from later steps are removed if a step is repeated
+    test_assay.extract_features(strategy=extract_features_dummy, verbose=False, dummy_param=2)
+    assert not test_assay.manager.get_roi_sidecar_path(sample, c.DESCRIBE_FEATURES).exists()
+    roi = test_assay.load_roi(sample, 0)
+    assert len(roi.features) == DummyAssay.n_ft
+
+
+def test_assay_processes_only_queued_samples(tmpdir):
+    n1 = 5
+    n2 = 3
+    assay_path, data_path = create_assay_dir(tmpdir, n1)
+    test_assay = DummyAssay(assay_path, data_path)
+    test_assay.detect_features(strategy=detect_features_dummy, verbose=False)
+    test_assay.extract_features(strategy=extract_features_dummy, verbose=False)
+    test_assay.describe_features(verbose=False)
+
+    def get_sample_files(sample):
+        files = [test_assay.manager.get_roi_path(sample), test_assay.manager.get_feature_path(sample)]
+        for step in [c.EXTRACT_FEATURES, c.DESCRIBE_FEATURES]:
+            files.append(test_assay.manager.get_roi_sidecar_path(sample, step))
+        return files
+
+    old_samples = test_assay.manager.get_sample_names()
+    mtimes = {p: p.stat().st_mtime_ns for s in old_samples for p in get_sample_files(s)}
+
+    _, new_data_path = create_assay_dir(tmpdir, n2, start=n1 + 1, data_dir_name="new-data-dir")
+    test_assay.add_samples(new_data_path, None)
+    test_assay.detect_features(strategy=detect_features_dummy, verbose=False)
+    test_assay.extract_features(strategy=extract_features_dummy, verbose=False)
+    test_assay.describe_features(verbose=False)
+
+    for path, mtime in mtimes.items():
+        assert path.stat().st_mtime_ns == mtime
+    new_samples = set(test_assay.manager.get_sample_names()).difference(old_samples)
+    assert len(new_samples) == n2
+    for sample in new_samples:
+        assert all(p.is_file() for p in get_sample_files(sample))
+
+
 def test_assay_extract_features_before_detect_features(tmpdir):
     assay_path, data_path = create_assay_dir(tmpdir, 20)
     test_assay = DummyAssay(assay_path, data_path)
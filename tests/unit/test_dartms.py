@@ -0,0 +1,41 @@
+from tidyms import dartms
+import numpy as np
+import pytest
+
+
+def create_spectra(n_spectra, n_features, seed=1234):
+    rng = np.random.default_rng(seed)
+    spectra = list()
+    for k in range(n_spectra):
+        size = rng.integers(0, 500)
+        mz = np.sort(rng.uniform(100, 200, size))
+        if k % 3 == 1:
+            mz = rng.permutation(mz)
+        spint = rng.uniform(0, 1000, size).astype(np.float32)
+        mzmin = rng.uniform(100, 200, n_features)
+        mzmax = mzmin + rng.uniform(-0.1, 1.0, n_features)
+        spectra.append((mz, spint, mzmin, mzmax))
+    return spectra
+
+
+@pytest.mark.parametrize("aggregation_fun", ["average", "sum", "max"])
+def test_integrate_original_data(aggregation_fun):
+    n_features = 50
+    spectra = create_spectra(20, n_features)
+    row = dartms._integrate_original_data(spectra, n_features, aggregation_fun)
+    aggregate = {"average": np.average, "sum": np.sum, "max": np.max}[aggregation_fun]
+    for featurei in range(n_features):
+        # values concatenated in the order of the spectra
+        s = np.array(())
+        for mz, spint, mzmin, mzmax in spectra:
+            use = np.logical_and(mz >= mzmin[featurei], mz <= mzmax[featurei])
+            s = np.concatenate((s, spint[use]))
+        if s.size:
+            assert row[featurei] == aggregate(s)
+        else:
+            assert np.isnan(row[featurei])
+
+
+def test_integrate_original_data_no_spectra():
+    row = dartms._integrate_original_data([], 5, "sum")
+    assert np.all(np.isnan(row))
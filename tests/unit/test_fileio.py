@@ -1,6 +1,12 @@
 from tidyms import fileio
+from tidyms import _msbinary
+from tidyms import _mzml
 from tidyms.utils import get_tidyms_path
+from xml.etree.ElementTree import ParseError
+import base64
+import numpy as np
 import os
+import pickle
 import pytest
 
 
@@ -137,6 +143,553 @@ def test_get_spectra_iterator_end_time(centroid_mzml):
         assert sp.time < end_time
 
 
+def test_ms_data_close(centroid_mzml):
+    sp = centroid_mzml.get_spectrum(0)
+    centroid_mzml.close()
+    assert centroid_mzml._reader.closed
+    # the file is reopened if data is requested after closing
+    sp_after_close = centroid_mzml.get_spectrum(0)
+    assert np.array_equal(sp.mz, sp_after_close.mz)
+    assert np.array_equal(sp.spint, sp_after_close.spint)
+
+
+def test_ms_data_context_manager(centroid_mzml):
+    with centroid_mzml as ms_data:
+        ms_data.get_spectrum(0)
+        assert not ms_data._reader.closed
+    assert centroid_mzml._reader.closed
+
+
+def test_ms_data_pickle(centroid_mzml):
+    centroid_mzml.get_spectrum(0)
+    ms_data = pickle.loads(pickle.dumps(centroid_mzml))
+    for k in range(centroid_mzml.get_n_spectra()):
+        expected = centroid_mzml.get_spectrum(k)
+        sp = ms_data.get_spectrum(k)
+        assert np.array_equal(sp.mz, expected.mz)
+        assert np.array_equal(sp.spint, expected.spint)
+        assert sp.time == expected.time
+
+
+@pytest.mark.parametrize(
+    "filename",
+    [
+        "centroid-data-zlib-indexed-compressed.mzML",
+        "centroid-data-indexed-uncompressed.mzML",
+        "centroid-data-zlib-no-index-compressed.mzML",
+    ]
+)
+def test_read_mzml_mmap(filename):
+    cache_path = get_tidyms_path()
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    ms_data = fileio.MSData_from_file(data_path)
+    ms_data_mmap = fileio.MSData_from_file(data_path, use_mmap=True)
+    for k in range(ms_data.get_n_spectra()):
+        expected = ms_data.get_spectrum(k)
+        sp = ms_data_mmap.get_spectrum(k)
+        assert np.array_equal(sp.mz, expected.mz)
+        assert np.array_equal(sp.spint, expected.spint)
+        assert sp.time == expected.time
+        assert sp.ms_level == expected.ms_level
+        assert sp.polarity == expected.polarity
+
+    for k in range(ms_data.get_n_chromatograms()):
+        expected_name, expected = ms_data.get_chromatogram(k)
+        name, chromatogram = ms_data_mmap.get_chromatogram(k)
+        assert name == expected_name
+        assert np.array_equal(chromatogram.time, expected.time)
+        assert np.array_equal(chromatogram.spint, expected.spint)
+    ms_data_mmap.close()
+
+
+mzml_files = [
+    "centroid-data-zlib-indexed-compressed.mzML",
+    "centroid-data-indexed-uncompressed.mzML",
+    "centroid-data-zlib-no-index-compressed.mzML",
+    "profile-data-zlib-indexed-compressed.mzML",
+]
+
+
+def _get_spectra_xml(filename):
+    cache_path = get_tidyms_path()
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    sp_offset, chrom_offset, index_offset = _mzml.build_offset_list(data_path)
+    xml_list = list()
+    for k in range(len(sp_offset)):
+        xml = _mzml._get_xml_data(
+            data_path, sp_offset, chrom_offset, index_offset, k, "spectrum"
+        )
+        xml_list.append(xml)
+    return xml_list
+
+
+@pytest.mark.parametrize("filename", mzml_files)
+def test_parse_spectrum_fast_path(filename):
+    for xml in _get_spectra_xml(filename):
+        expected = _mzml._parse_spectrum(xml)
+        res = _mzml._parse_buffer(xml, 0, len(xml), "spectrum")
+        assert res.keys() == expected.keys()
+        for key in ["ms_level", "polarity", "time"]:
+            assert res.get(key) == expected.get(key)
+        assert np.array_equal(res["mz"], expected["mz"])
+        assert np.array_equal(res["spint"], expected["spint"])
+
+
+@pytest.mark.parametrize("filename", mzml_files)
+def test_parse_spectrum_fast_path_unusual_layout(filename):
+    # comments in the spectrum metadata are parsed with ElementTree
+    for xml in _get_spectra_xml(filename):
+        expected = _mzml._parse_spectrum(xml)
+        xml = xml.replace(b"<scanList", b"<!-- comment --><scanList", 1)
+        res = _mzml._parse_buffer(xml, 0, len(xml), "spectrum")
+        assert res.keys() == expected.keys()
+        assert res["time"] == expected["time"]
+        assert np.array_equal(res["mz"], expected["mz"])
+
+
+def _create_binary_data_array_list(mz, empty_binary):
+    # binaryDataArrayList with uncompressed m/z and an empty intensity array
+    mz_binary = base64.b64encode(mz.astype(np.float64).tobytes())
+    if empty_binary:
+        spint_binary = b"<binary/>"
+    else:
+        spint_binary = b"<binary></binary>"
+    return (
+        b'<binaryDataArrayList count="2">'
+        b'<binaryDataArray encodedLength="%d">'
+        b'<cvParam cvRef="MS" accession="%s" name="64-bit float" value=""/>'
+        b'<cvParam cvRef="MS" accession="%s" name="m/z array" value=""/>'
+        b"<binary>%s</binary>"
+        b"</binaryDataArray>"
+        b'<binaryDataArray encodedLength="0">'
+        b'<cvParam cvRef="MS" accession="%s" name="64-bit float" value=""/>'
+        b'<cvParam cvRef="MS" accession="%s" name="intensity array" value=""/>'
+        b"%s"
+        b"</binaryDataArray>"
+        b"</binaryDataArrayList>"
+    ) % (
+        len(mz_binary),
+        _mzml.FLOAT64.encode(),
+        _mzml.MZ_ARRAY.encode(),
+        mz_binary,
+        _mzml.FLOAT64.encode(),
+        _mzml.INT_ARRAY.encode(),
+        spint_binary,
+    )
+
+
+class _SliceRecorder(bytes):
+    # records the slices taken from the buffer
+
+    def __new__(cls, data):
+        obj = super().__new__(cls, data)
+        obj.slices = list()
+        return obj
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            self.slices.append(item)
+        return super().__getitem__(item)
+
+
+@pytest.mark.parametrize("empty_binary", [True, False])
+def test_parse_binary_data_list_buffer_empty_array(empty_binary):
+    mz = np.linspace(100, 200, 10)
+    xml = _create_binary_data_array_list(mz, empty_binary)
+    # data after the list must not be read
+    buffer = _SliceRecorder(xml + b" " * 1000)
+    res = _mzml._parse_binary_data_list_buffer(buffer, 0, len(xml), mz.size, True)
+    assert np.array_equal(res["mz"], mz)
+    assert res["spint"].size == 0
+    assert all((x.stop is not None) and (0 <= x.stop <= len(xml)) for x in buffer.slices)
+
+
+def test_parse_binary_data_list_buffer_truncated_array():
+    mz = np.linspace(100, 200, 10)
+    xml = _create_binary_data_array_list(mz, False)
+    xml = xml[: xml.rfind(b"</binaryDataArray>")]
+    with pytest.raises(ParseError):
+        _mzml._parse_binary_data_list_buffer(xml, 0, len(xml), mz.size, True)
+
+
+def test_build_offset_list_non_indexed():
+    cache_path = get_tidyms_path()
+    filename = "centroid-data-zlib-no-index-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    sp_offset, chrom_offset = _mzml._build_offset_list_non_indexed(data_path)
+    with open(data_path, "rb") as fin:
+        data = fin.read()
+    assert len(sp_offset) == data.count(b"<spectrum ")
+    assert len(chrom_offset) == data.count(b"<chromatogram ")
+    for offset in sp_offset:
+        assert data[offset:].startswith(b"<spectrum ")
+    for offset in chrom_offset:
+        assert data[offset:].startswith(b"<chromatogram ")
+
+
+def test_find_tag_offsets_split_ranges(monkeypatch):
+    # the file is scanned in small ranges and chunks to test tags split between
+    # chunks and ranges.
+    cache_path = get_tidyms_path()
+    filename = "centroid-data-zlib-no-index-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    expected = _mzml._build_offset_list_non_indexed(data_path)
+    monkeypatch.setattr(_mzml, "_SCAN_CHUNK_SIZE", 1000)
+    size = os.path.getsize(data_path)
+    bounds = list(range(0, size, 7919)) + [size]
+    sp_offset = list()
+    chrom_offset = list()
+    for start, end in zip(bounds, bounds[1:]):
+        range_sp_offset, range_chrom_offset = _mzml._find_tag_offsets(
+            data_path, start, end
+        )
+        sp_offset.extend(range_sp_offset)
+        chrom_offset.extend(range_chrom_offset)
+    assert sp_offset == expected[0]
+    assert chrom_offset == expected[1]
+
+
+def test_mzml_index_cache(tmpdir):
+    cache_path = get_tidyms_path()
+    filename = "centroid-data-zlib-indexed-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    reader = _mzml.MZMLReader(data_path)
+    cached_reader = _mzml.MZMLReader(data_path, index_cache_dir=tmpdir)
+    assert _mzml.get_index_cache_path(data_path, tmpdir).is_file()
+
+    # the second reader loads the sidecar
+    loaded_reader = _mzml.MZMLReader(data_path, index_cache_dir=tmpdir)
+    assert loaded_reader.has_scan_table
+    assert loaded_reader.spectra_offset == reader.spectra_offset
+    assert loaded_reader.chromatogram_offset == reader.chromatogram_offset
+    assert loaded_reader.index_offset == reader.index_offset
+    expected = reader.get_scan_table()
+    for table in [cached_reader._scan_table, loaded_reader._scan_table]:
+        for column in _mzml.SCAN_TABLE_COLUMNS:
+            assert np.array_equal(table[column], expected[column])
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_mzml_reader_get_scan_table(use_mmap):
+    cache_path = get_tidyms_path()
+    filename = "centroid-data-zlib-indexed-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    ms_data = fileio.MSData_from_file(data_path, use_mmap=use_mmap)
+    table = ms_data.get_scan_table()
+    # compare with the table built from the decoded spectra
+    expected = fileio.MSData.get_scan_table(ms_data)
+    assert table.columns.tolist() == _mzml.SCAN_TABLE_COLUMNS
+    assert table.shape[0] == ms_data.get_n_spectra()
+    for column in _mzml.SCAN_TABLE_COLUMNS:
+        assert np.array_equal(table[column], expected[column])
+
+
+def test_mzml_index_cache_different_file(tmpdir):
+    cache_path = get_tidyms_path()
+    filename = "centroid-data-zlib-indexed-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    _mzml.MZMLReader(data_path, index_cache_dir=tmpdir)
+    cache_file = _mzml.get_index_cache_path(data_path, tmpdir)
+    file_key = _mzml._get_file_key(data_path)
+    assert _mzml.load_index_cache(cache_file, file_key) is not None
+    file_key["mtime"] += 1
+    assert _mzml.load_index_cache(cache_file, file_key) is None
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"ms_level": 2},
+        {"start": 9, "end": 20},
+        {"start_time": 10, "end_time": 20},
+    ]
+)
+def test_get_spectra_iterator_index_cache(tmpdir, kwargs):
+    cache_path = get_tidyms_path()
+    filename = "centroid-data-zlib-indexed-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    ms_data = fileio.MSData_from_file(data_path)
+    fileio.MSData_from_file(data_path, index_cache_dir=tmpdir)
+    ms_data_cached = fileio.MSData_from_file(data_path, index_cache_dir=tmpdir)
+    expected = list(ms_data.get_spectra_iterator(**kwargs))
+    res = list(ms_data_cached.get_spectra_iterator(**kwargs))
+    assert [k for k, _ in res] == [k for k, _ in expected]
+    for (_, sp), (_, expected_sp) in zip(res, expected):
+        assert sp.time == expected_sp.time
+        assert np.array_equal(sp.mz, expected_sp.mz)
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"ms_level": 2},
+        {"start": 9, "end": 20},
+        {"start_time": 10, "end_time": 20},
+    ]
+)
+def test_get_spectra_iterator_prefetch(use_mmap, kwargs):
+    cache_path = get_tidyms_path()
+    filename = "centroid-data-zlib-indexed-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    ms_data = fileio.MSData_from_file(data_path, use_mmap=use_mmap)
+    expected = list(ms_data.get_spectra_iterator(**kwargs))
+    res = list(ms_data.get_spectra_iterator(prefetch=3, **kwargs))
+    assert [k for k, _ in res] == [k for k, _ in expected]
+    for (_, sp), (_, expected_sp) in zip(res, expected):
+        assert sp.time == expected_sp.time
+        assert np.array_equal(sp.mz, expected_sp.mz)
+        assert np.array_equal(sp.spint, expected_sp.spint)
+
+
+def test_get_spectra_iterator_prefetch_stop_iteration(centroid_mzml):
+    iterator = centroid_mzml.get_spectra_iterator(prefetch=3)
+    scan, _ = next(iterator)
+    iterator.close()
+    assert scan == 0
+
+
+@pytest.mark.parametrize("prefetch", [0, 3])
+def test_get_spectra(centroid_mzml, prefetch):
+    indices = [10, 2, 5, 2, 30]
+    res = centroid_mzml.get_spectra(indices, prefetch=prefetch)
+    assert len(res) == len(indices)
+    for k, sp in zip(indices, res):
+        expected = centroid_mzml.get_spectrum(k)
+        assert sp.time == expected.time
+        assert np.array_equal(sp.mz, expected.mz)
+
+
+def test_get_times(centroid_mzml):
+    times = centroid_mzml.get_times()
+    n_spectra = centroid_mzml.get_n_spectra()
+    expected = [centroid_mzml.get_spectrum(k).time for k in range(n_spectra)]
+    assert np.array_equal(times, expected)
+
+
+def _get_closest_spectrum_to_rt_linear_search(ms_data, time):
+    best_k = None
+    best_diff = None
+    for k, sp in ms_data.get_spectra_iterator():
+        if best_k is None or abs(sp.time - time) <= abs(best_diff):
+            best_k = k
+            best_diff = sp.time - time
+    return best_k, best_diff
+
+
+def test_get_closest_spectrum_to_rt(centroid_mzml):
+    times = centroid_mzml.get_times()
+    test_times = np.hstack((times, times[:-1] + np.diff(times) / 3, [-1, 1e6]))
+    for t in test_times:
+        res = centroid_mzml.get_closest_spectrum_to_RT(t)
+        expected = _get_closest_spectrum_to_rt_linear_search(centroid_mzml, t)
+        assert res[0] == expected[0]
+        assert np.isclose(res[1], expected[1])
+
+
+def test_subset_spectra_get_spectra_and_times(centroid_mzml):
+    subset = fileio.MSData_subset_spectra(5, 20, centroid_mzml)
+    res = subset.get_spectra([0, 15])
+    assert res[0].time == centroid_mzml.get_spectrum(5).time
+    assert res[1].time == centroid_mzml.get_spectrum(20).time
+    assert np.array_equal(subset.get_times(), centroid_mzml.get_times()[5:21])
+    with pytest.raises(ValueError):
+        subset.get_spectra([16])
+
+
+@pytest.fixture
+def in_memory_mzml():
+    cache_path = get_tidyms_path()
+    filename = "centroid-data-zlib-indexed-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    return fileio.MSData_in_memory.generate_from_file(data_path)
+
+
+def test_ms_data_in_memory(centroid_mzml, in_memory_mzml):
+    assert in_memory_mzml.get_n_spectra() == centroid_mzml.get_n_spectra()
+    for k in range(centroid_mzml.get_n_spectra()):
+        sp = in_memory_mzml.get_spectrum(k)
+        expected = centroid_mzml.get_spectrum(k)
+        assert np.array_equal(sp.mz, expected.mz)
+        assert np.array_equal(sp.spint, expected.spint)
+        assert sp.time == expected.time
+        assert sp.ms_level == expected.ms_level
+        assert sp.polarity == expected.polarity
+    kwargs = {"start_time": 10, "end_time": 20}
+    res = [k for k, _ in in_memory_mzml.get_spectra_iterator(**kwargs)]
+    expected = [k for k, _ in centroid_mzml.get_spectra_iterator(**kwargs)]
+    assert res == expected
+
+
+def test_ms_data_in_memory_get_times(centroid_mzml, in_memory_mzml):
+    assert np.array_equal(in_memory_mzml.get_times(), centroid_mzml.get_times())
+    in_memory_mzml.delete_spectra([0, 2])
+    assert np.array_equal(
+        in_memory_mzml.get_times(), np.delete(centroid_mzml.get_times(), [0, 2])
+    )
+
+
+def test_ms_data_in_memory_scan_table(in_memory_mzml):
+    table = in_memory_mzml.get_scan_table()
+    expected = fileio.MSData.get_scan_table(in_memory_mzml)
+    assert table.equals(expected)
+
+
+def test_ms_data_in_memory_delete_spectra(centroid_mzml, in_memory_mzml):
+    n_spectra = in_memory_mzml.get_n_spectra()
+    in_memory_mzml.delete_spectra([0, 2, 5])
+    expected_index = [k for k in range(n_spectra) if k not in [0, 2, 5]]
+    assert in_memory_mzml.get_n_spectra() == n_spectra - 3
+    for k, expected_k in enumerate(expected_index):
+        sp = in_memory_mzml.get_spectrum(k)
+        expected = centroid_mzml.get_spectrum(expected_k)
+        assert np.array_equal(sp.mz, expected.mz)
+        assert sp.time == expected.time
+
+
+def test_ms_data_in_memory_modified_spectrum(in_memory_mzml):
+    # changes to spectrum objects are kept after copying and deleting spectra
+    sp = in_memory_mzml.get_spectrum(5)
+    mz = sp.mz.copy()
+    sp.original_mz = sp.mz
+    sp.mz = sp.mz[:5] * 2
+    sp.spint = sp.spint[:5]
+    sp.startRT = 1.0
+    ms_data_copy = in_memory_mzml.duplicate_object()
+    in_memory_mzml.delete_spectra([0, 1])
+    for ms_data, index in [(in_memory_mzml, 3), (ms_data_copy, 5)]:
+        sp_modified = ms_data.get_spectrum(index)
+        assert np.array_equal(sp_modified.mz, mz[:5] * 2)
+        assert np.array_equal(sp_modified.original_mz, mz)
+        assert sp_modified.startRT == 1.0
+        assert ms_data.get_scan_table()["size"][index] == 5
+    assert in_memory_mzml.get_spectrum(3) is sp
+
+
+def test_ms_data_in_memory_from_subset_shares_data(in_memory_mzml):
+    # spectra that are not selected by get_spectra_iterator are copied
+    ms1_scans = [k for k, _ in in_memory_mzml.get_spectra_iterator()]
+    in_memory_mzml.select_spectra(ms1_scans)
+    subset = fileio.MSData_Proxy(
+        fileio.MSData_subset_spectra(5, 20, in_memory_mzml)
+    )
+    res = fileio.MSData_in_memory.generate_from_MSData_object(subset)
+    expected = [sp for _, sp in subset.get_spectra_iterator()]
+    assert res.get_n_spectra() == len(expected)
+    for k, expected_sp in enumerate(expected):
+        sp = res.get_spectrum(k)
+        assert sp.time == expected_sp.time
+        assert np.array_equal(sp.mz, expected_sp.mz)
+        if sp.spint.size:
+            assert np.shares_memory(sp.spint, expected_sp.spint)
+
+
+def test_ms_data_in_memory_from_subset_ms_level(in_memory_mzml):
+    in_memory_mzml.get_spectrum(8).ms_level = 2
+    subset = fileio.MSData_subset_spectra(5, 20, in_memory_mzml)
+    res = fileio.MSData_in_memory.generate_from_MSData_object(subset)
+    expected = [sp for _, sp in subset.get_spectra_iterator()]
+    assert res.get_n_spectra() == len(expected)
+    for k, expected_sp in enumerate(expected):
+        sp = res.get_spectrum(k)
+        assert sp.time == expected_sp.time
+        assert np.array_equal(sp.spint, expected_sp.spint)
+
+
+def test_ms_data_in_memory_from_subset_copy_on_write(in_memory_mzml):
+    ms1_scans = [k for k, _ in in_memory_mzml.get_spectra_iterator()]
+    in_memory_mzml.select_spectra(ms1_scans)
+    subset = fileio.MSData_subset_spectra(5, 20, in_memory_mzml)
+    res = fileio.MSData_in_memory.generate_from_MSData_object(subset)
+    spint = in_memory_mzml.get_spectrum(6).spint.copy()
+    sp = res.get_spectrum(1)
+    with pytest.raises(ValueError):
+        sp.spint[0] = 0
+    sp.spint = sp.spint * 2
+    res.select_spectra([0, 1, 2])
+    assert np.array_equal(res.get_spectrum(1).spint, spint * 2)
+    assert np.array_equal(in_memory_mzml.get_spectrum(6).spint, spint)
+
+
+def test_ms_data_in_memory_pickle(in_memory_mzml):
+    sp = in_memory_mzml.get_spectrum(5)
+    sp.spint = sp.spint * 2
+    loaded = pickle.loads(pickle.dumps(in_memory_mzml))
+    assert np.array_equal(loaded.get_spectrum(5).spint, sp.spint)
+    assert loaded.get_scan_table().equals(in_memory_mzml.get_scan_table())
+
+
+def test_ms_data_from_binary(tmpdir):
+    cache_path = get_tidyms_path()
+    filename = "centroid-data-zlib-indexed-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    ms_data = fileio.MSData_from_file(data_path)
+    binary_data = fileio.MSData.create_MSData_instance(
+        data_import_mode="binary", path=data_path, binary_dir=tmpdir
+    )
+    assert isinstance(binary_data, fileio.MSData_from_binary)
+    assert binary_data.get_n_spectra() == ms_data.get_n_spectra()
+    for k in range(ms_data.get_n_spectra()):
+        sp = binary_data.get_spectrum(k)
+        expected = ms_data.get_spectrum(k)
+        assert np.array_equal(sp.mz, expected.mz)
+        assert np.array_equal(sp.spint, expected.spint)
+        assert sp.time == expected.time
+        assert sp.ms_level == expected.ms_level
+        assert sp.polarity == expected.polarity
+    assert binary_data.get_n_chromatograms() == ms_data.get_n_chromatograms()
+    for k in range(ms_data.get_n_chromatograms()):
+        name, chromatogram = binary_data.get_chromatogram(k)
+        expected_name, expected = ms_data.get_chromatogram(k)
+        assert name == expected_name
+        assert np.array_equal(chromatogram.spint, expected.spint)
+    expected_table = fileio.MSData.get_scan_table(ms_data)
+    assert binary_data.get_scan_table().equals(expected_table)
+    kwargs = {"ms_level": 1, "start_time": 10, "end_time": 20}
+    res = [k for k, _ in binary_data.get_spectra_iterator(**kwargs)]
+    expected = [k for k, _ in ms_data.get_spectra_iterator(**kwargs)]
+    assert res == expected
+
+
+def test_ms_data_from_binary_reuse_file(tmpdir):
+    cache_path = get_tidyms_path()
+    filename = "centroid-data-zlib-indexed-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    fileio.MSData_from_binary.generate_from_file(data_path, binary_dir=tmpdir)
+    binary_path = _msbinary.get_binary_path(data_path, tmpdir)
+    mtime = os.stat(binary_path).st_mtime_ns
+    binary_data = fileio.MSData_from_binary.generate_from_file(
+        data_path, binary_dir=tmpdir
+    )
+    assert os.stat(binary_path).st_mtime_ns == mtime
+    # the binary file can be opened directly
+    binary_data_from_path = fileio.MSData_from_binary(binary_path)
+    assert binary_data_from_path.get_scan_table().equals(
+        binary_data.get_scan_table()
+    )
+
+
+def test_ms_data_from_binary_pickle(tmpdir):
+    cache_path = get_tidyms_path()
+    filename = "centroid-data-zlib-indexed-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    binary_data = fileio.MSData_from_binary.generate_from_file(
+        data_path, binary_dir=tmpdir
+    )
+    sp = binary_data.get_spectrum(5)
+    loaded = pickle.loads(pickle.dumps(binary_data))
+    assert np.array_equal(loaded.get_spectrum(5).mz, sp.mz)
+
+
+def test_ms_data_from_binary_invalid_file(tmpdir):
+    path = os.path.join(tmpdir, "invalid" + _msbinary.BINARY_SUFFIX)
+    with open(path, "wb") as fout:
+        fout.write(b"invalid-data")
+    with pytest.raises(ValueError):
+        fileio.MSData_from_binary(path)
+
+
 def test_centroids(profile_mzml):
     profile_mzml.get_spectrum(0).find_centroids()
     assert True
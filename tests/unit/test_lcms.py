@@ -49,6 +49,21 @@ def test_chromatogram_find_peaks(chromatogram_data):
     assert len(chromatogram.features) == 1
 
 
+def test_extract_features_batch(chromatogram_data):
+    rt, spint = chromatogram_data
+    spint[[0, 20, 199]] = np.nan
+    roi_list = [lcms.Chromatogram(rt, spint.copy(), k) for k in range(5)]
+    expected_list = [lcms.Chromatogram(rt, spint.copy(), k) for k in range(5)]
+    lcms.extract_features_batch(roi_list)
+    for roi, expected in zip(roi_list, expected_list):
+        expected.extract_features()
+        assert np.array_equal(roi.spint, expected.spint)
+        assert np.array_equal(roi.noise, expected.noise)
+        assert np.array_equal(roi.baseline, expected.baseline)
+        assert [ft.to_str() for ft in roi.features] == [ft.to_str() for ft in expected.features]
+        assert all(ft.roi is roi for ft in roi.features)
+
+
 # Test MSSpectrum
 
 
@@ -0,0 +1,222 @@
+from tidyms import _mzml
+from tidyms import _numpress
+from tidyms.utils import get_tidyms_path
+import base64
+import math
+import numpy as np
+import os
+import pytest
+import re
+import struct
+import zlib
+
+
+# Reference implementation of MS-Numpress, used to create test data.
+# https://github.com/ms-numpress/ms-numpress
+
+def _encode_int(x):
+    mask = 0xf0000000
+    init = x & mask
+    if init == 0:
+        n = 8
+        for i in range(8):
+            if x & (mask >> (4 * i)):
+                n = i
+                break
+        res = [n]
+    elif init == mask:
+        n = 7
+        for i in range(8):
+            m = mask >> (4 * i)
+            if (x & m) != m:
+                n = i
+                break
+        res = [n + 8]
+    else:
+        n = 0
+        res = [0]
+    for i in range(n, 8):
+        res.append((x >> (4 * (i - n))) & 0xf)
+    return res
+
+
+def _pack_nibbles(nibbles):
+    if len(nibbles) % 2:
+        nibbles = nibbles + [0]
+    return bytes(
+        (nibbles[i] << 4) | nibbles[i + 1] for i in range(0, len(nibbles), 2)
+    )
+
+
+def encode_linear(data, fixed_point):
+    res = struct.pack(">d", fixed_point)
+    if len(data) == 0:
+        return res
+    ints = [int(math.floor(x * fixed_point + 0.5)) for x in data]
+    res += struct.pack("<I", ints[0] & 0xffffffff)
+    if len(data) == 1:
+        return res
+    res += struct.pack("<I", ints[1] & 0xffffffff)
+    nibbles = list()
+    for i in range(2, len(ints)):
+        diff = ints[i] - (2 * ints[i - 1] - ints[i - 2])
+        nibbles.extend(_encode_int(diff & 0xffffffff))
+    return res + _pack_nibbles(nibbles)
+
+
+def decode_linear_reference(data):
+    # scalar decoder, used to compare against the vectorized decoder
+    fixed_point = struct.unpack(">d", data[:8])[0]
+    ints = list(struct.unpack("<II", data[8:16]))
+    res = [x / fixed_point for x in ints]
+    nibbles = list()
+    for x in data[16:]:
+        nibbles.extend([x >> 4, x & 0xf])
+    pos = 0
+    while pos < len(nibbles):
+        if (pos == len(nibbles) - 1) and (nibbles[pos] == 0):
+            break
+        head = nibbles[pos]
+        n = head if head <= 8 else head - 8
+        value = 0
+        for i in range(8 - n):
+            value |= nibbles[pos + 1 + i] << (4 * i)
+        if head > 8:
+            value |= (0xffffffff << (4 * (8 - n))) & 0xffffffff
+        pos += 9 - n
+        diff = value - (1 << 32) if value >= (1 << 31) else value
+        y = 2 * ints[-1] - ints[-2] + diff
+        ints.append(y)
+        res.append(y / fixed_point)
+    return np.array(res)
+
+
+def encode_pic(data):
+    nibbles = list()
+    for x in data:
+        nibbles.extend(_encode_int(int(x + 0.5) & 0xffffffff))
+    return _pack_nibbles(nibbles)
+
+
+def encode_slof(data, fixed_point):
+    res = struct.pack(">d", fixed_point)
+    for x in data:
+        res += struct.pack("<H", int(math.log(x + 1) * fixed_point + 0.5))
+    return res
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 4, 5, 100, 1001])
+def test_decode_linear(size):
+    mz = np.sort(np.random.uniform(50, 1000, size))
+    fixed_point = 1e5
+    res = _numpress.decode_linear(encode_linear(mz, fixed_point))
+    expected = np.floor(mz * fixed_point + 0.5) / fixed_point
+    assert res.size == size
+    assert np.allclose(res, expected, rtol=0, atol=1e-9)
+
+
+def test_decode_linear_large_residuals():
+    # residuals with leading ones and with all nibbles
+    x = np.array([1000, 10, 5000, 0, 3e4, 1, 1, 1, 2e4, 1e7, 0, 0])
+    res = _numpress.decode_linear(encode_linear(x, 100.0))
+    assert np.allclose(res, x)
+
+
+def test_decode_linear_corrupt_data():
+    # the last residual is stored using several nibbles
+    data = encode_linear(np.array([1000, 10, 5000, 0, 3e4, 1e7]), 100.0)
+    with pytest.raises(ValueError):
+        _numpress.decode_linear(data[:-2])
+    with pytest.raises(ValueError):
+        _numpress.decode_linear(data[:13])
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 100, 1001])
+def test_decode_pic(size):
+    spint = np.random.randint(0, 2 ** 31, size).astype(float)
+    spint[::3] = 0
+    spint[::7] = np.random.randint(0, 20, spint[::7].size)
+    res = _numpress.decode_pic(encode_pic(spint))
+    assert np.array_equal(res, spint)
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 100, 1001])
+def test_decode_slof(size):
+    spint = np.random.uniform(0, 1e6, size)
+    res = _numpress.decode_slof(encode_slof(spint, 4000.0))
+    assert res.size == size
+    assert np.allclose(res, spint, rtol=1e-3)
+
+
+def _to_numpress(xml, use_zlib):
+    # replaces the zlib compressed data of a spectrum with numpress
+    # compressed data: linear prediction for m/z and slof for intensity.
+    def replace_array(match):
+        array = match.group(0)
+        binary = re.search(rb"<binary>(.*?)</binary>", array, re.S).group(1)
+        data = zlib.decompress(base64.b64decode(binary))
+        if _mzml.FLOAT64.encode() in array:
+            data = np.frombuffer(data, dtype=np.float64)
+        else:
+            data = np.frombuffer(data, dtype=np.float32)
+        if _mzml.MZ_ARRAY.encode() in array:
+            data = encode_linear(data, 1e5)
+            accession = "MS:1002746" if use_zlib else "MS:1002312"
+        else:
+            data = encode_slof(data, 4000.0)
+            accession = "MS:1002748" if use_zlib else "MS:1002314"
+        if use_zlib:
+            data = zlib.compress(data)
+        array = array.replace(binary, base64.b64encode(data))
+        zlib_attribute = 'accession="{}"'.format(_mzml.ZLIB).encode()
+        numpress_attribute = 'accession="{}"'.format(accession).encode()
+        return array.replace(zlib_attribute, numpress_attribute)
+
+    return re.sub(
+        rb"<binaryDataArray\s.*?</binaryDataArray>", replace_array, xml, flags=re.S
+    )
+
+
+def _get_spectra_xml(filename):
+    cache_path = get_tidyms_path()
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    sp_offset, chrom_offset, index_offset = _mzml.build_offset_list(data_path)
+    xml_list = list()
+    for k in range(len(sp_offset)):
+        xml = _mzml._get_xml_data(
+            data_path, sp_offset, chrom_offset, index_offset, k, "spectrum"
+        )
+        xml_list.append(xml)
+    return xml_list
+
+
+@pytest.mark.parametrize("use_zlib", [False, True])
+def test_parse_numpress_spectrum(use_zlib):
+    xml_list = _get_spectra_xml("centroid-data-zlib-indexed-compressed.mzML")
+    for xml in xml_list:
+        expected = _mzml._parse_spectrum(xml)
+        numpress_xml = _to_numpress(xml, use_zlib)
+        # fast path and ElementTree path
+        fast = _mzml._parse_buffer(
+            numpress_xml, 0, len(numpress_xml), "spectrum"
+        )
+        element_tree = _mzml._parse_spectrum(numpress_xml)
+        for res in [fast, element_tree]:
+            assert res["time"] == expected["time"]
+            assert np.allclose(res["mz"], expected["mz"], rtol=0, atol=1e-5)
+            assert np.allclose(res["spint"], expected["spint"], rtol=1e-3)
+
+
+def test_numpress_unsupported_compression():
+    cv_params = [{"accession": "MS:1003088"}]
+    with pytest.raises(NotImplementedError):
+        _mzml._get_binary_data_params(cv_params)
+
+
+def test_decode_linear_same_result_as_reference():
+    mz = np.sort(np.random.uniform(50, 1000, 10000))
+    numpress_data = encode_linear(mz, 1e5)
+    assert np.allclose(
+        _numpress.decode_linear(numpress_data),
+        decode_linear_reference(numpress_data)
+    )
@@ -0,0 +1,112 @@
+from tidyms._peak_index import PeakIndex
+from tidyms.fileio import MSData_in_memory, MSData_Proxy
+from tidyms.lcms import MSSpectrum
+import numpy as np
+import pytest
+
+
+def create_spectra(n_spectra, seed=1234):
+    rng = np.random.default_rng(seed)
+    spectra = list()
+    for k in range(n_spectra):
+        size = 0 if k == 3 else rng.integers(1, 200)
+        mz = np.sort(rng.uniform(100, 200, size))
+        spint = rng.uniform(0, 100, size)
+        ms_level = 2 if k % 4 == 1 else 1
+        spectra.append(MSSpectrum(mz, spint, time=float(k), ms_level=ms_level))
+    return spectra
+
+
+@pytest.fixture
+def ms_data():
+    ms_data = MSData_in_memory()
+    ms_data._set_spectra(create_spectra(50))
+    return ms_data
+
+
+def query_spectra(ms_data, mz_min, mz_max, time_min, time_max, ms_level=1):
+    # reference result obtained by iterating over the spectra
+    expected = set()
+    for scan, sp in ms_data.get_spectra_iterator(ms_level=ms_level):
+        if (sp.time < time_min) or (sp.time > time_max):
+            continue
+        for mz, spint in zip(sp.mz, sp.spint):
+            if mz_min <= mz <= mz_max:
+                expected.add((mz, spint, sp.time, scan))
+    return expected
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 256])
+def test_peak_index_query(ms_data, block_size):
+    index = ms_data.get_peak_index()
+    index = PeakIndex(index.mz, index.spint, index.time, index.scan, block_size)
+    regions = [
+        (120.0, 121.0, 10.0, 20.0),
+        (100.0, 200.0, 5.0, 5.0),
+        (150.0, 180.0, -1.0, 100.0),
+        (99.0, 99.5, 0.0, 100.0),
+        (130.0, 130.0, 0.0, 100.0),
+    ]
+    for mz_min, mz_max, time_min, time_max in regions:
+        signals = index.get_signals(mz_min, mz_max, time_min, time_max)
+        assert np.all(np.diff(signals[0]) >= 0)
+        assert set(zip(*signals)) == query_spectra(
+            ms_data, mz_min, mz_max, time_min, time_max
+        )
+
+
+def test_peak_index_query_without_time_range(ms_data):
+    index = ms_data.get_peak_index()
+    signals = index.get_signals(120.0, 140.0)
+    expected = query_spectra(ms_data, 120.0, 140.0, -np.inf, np.inf)
+    assert set(zip(*signals)) == expected
+
+
+def test_get_peak_index_ms_level(ms_data):
+    index = ms_data.get_peak_index(ms_level=2)
+    signals = index.get_signals(100.0, 200.0, 0.0, 100.0)
+    expected = query_spectra(ms_data, 100.0, 200.0, 0.0, 100.0, ms_level=2)
+    assert set(zip(*signals)) == expected
+
+
+def test_get_peak_index_is_cached(ms_data):
+    index = ms_data.get_peak_index()
+    assert ms_data.get_peak_index() is index
+    assert MSData_Proxy(ms_data).get_peak_index() is index
+    assert ms_data.get_peak_index(rebuild=True) is not index
+
+
+def test_get_peak_index_select_spectra(ms_data):
+    index = ms_data.get_peak_index()
+    ms_data.select_spectra(np.arange(10))
+    new_index = ms_data.get_peak_index()
+    assert new_index is not index
+    assert np.all(new_index.scan < 10)
+
+
+def test_get_peak_index_modified_spectrum(ms_data):
+    ms_data.get_peak_index()
+    sp = ms_data.get_spectrum(0)
+    sp.mz = np.array([150.0])
+    sp.spint = np.array([1.0])
+    # the index is built once using the modified data
+    index = ms_data.get_peak_index()
+    assert ms_data.get_peak_index() is index
+    expected = query_spectra(ms_data, 100.0, 200.0, -1.0, 100.0)
+    assert set(zip(*index.get_signals(100.0, 200.0, -1.0, 100.0))) == expected
+
+
+def test_get_peak_index_modified_spectrum_time(ms_data):
+    index = ms_data.get_peak_index()
+    ms_data.get_spectrum(0).time = 1000.0
+    new_index = ms_data.get_peak_index()
+    assert new_index is not index
+    expected = query_spectra(ms_data, 100.0, 200.0, 500.0, 2000.0)
+    assert expected
+    assert set(zip(*new_index.get_signals(100.0, 200.0, 500.0, 2000.0))) == expected
+
+
+def test_peak_index_empty():
+    index = MSData_in_memory().get_peak_index()
+    assert len(index) == 0
+    assert index.query(100.0, 200.0, 0.0, 10.0).size == 0
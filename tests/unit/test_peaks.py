@@ -3,6 +3,7 @@ import numpy as np
 import pytest
 from scipy.signal.windows import gaussian
 from scipy.special import erfc
+from scipy.stats import median_abs_deviation as mad
 from scipy.ndimage import gaussian_filter1d
 # from itertools import product
 
@@ -94,6 +95,66 @@ def test_estimate_noise_min_slice_size(noise):
         assert np.allclose(noise_estimation[start:end], noise_estimation[start])
 
 
+def test_estimate_noise_slices_equal_estimate_local_noise(noise):
+    noise, sigma = noise
+    noise_estimation = ms.peaks.estimate_noise(noise, n_slices=5, min_slice_size=90)
+    for start in range(0, 500, 100):
+        end = start + 100
+        expected = ms.peaks._estimate_local_noise(noise[start:end])
+        assert np.all(noise_estimation[start:end] == expected)
+
+
+@pytest.mark.parametrize("robust", [True, False])
+def test_estimate_local_noise_same_result_as_sorted_percentiles(robust):
+    # reference implementation using sorted values and scipy MAD
+    rng = np.random.default_rng(SEED)
+    for _ in range(20):
+        x = np.round(rng.normal(size=rng.integers(5, 300), scale=3.0))
+        d2x = np.diff(x, n=2)
+        d2x = d2x[np.argsort(np.abs(d2x), kind="stable")]
+        std_func = (lambda y: mad(y, scale="normal")) if robust else np.std
+        mean_func = np.median if robust else np.mean
+        expected = 0.0
+        for percentile_counter in range(9, 2, -1):
+            percentile_index = percentile_counter * d2x.size // 10
+            if percentile_index <= 2:
+                break
+            expected = std_func(d2x[:percentile_index])
+            if (expected <= 0) or (abs(mean_func(d2x[:percentile_index]) / expected) <= 1.0):
+                break
+        expected = expected / 2
+        if np.isclose(expected, 0):
+            expected = d2x.std()
+        assert ms.peaks._estimate_local_noise(x, robust=robust) == expected
+
+
+@pytest.mark.parametrize("robust", [True, False])
+def test_estimate_local_noise_batch(robust):
+    rng = np.random.default_rng(SEED)
+    x = np.round(rng.normal(size=(10, 100), scale=3.0))
+    noise = ms.peaks._estimate_local_noise_batch(x, robust=robust)
+    expected = [ms.peaks._estimate_local_noise(row, robust=robust) for row in x]
+    assert np.array_equal(noise, expected)
+
+
+@pytest.mark.parametrize("robust", [True, False])
+def test_estimate_local_noise_batch_padded_rows(robust):
+    rng = np.random.default_rng(SEED)
+    x = np.round(rng.normal(size=(10, 100), scale=3.0))
+    size = np.array([100, 0, 1, 3, 4, 5, 20, 37, 99, 60])
+    x[np.arange(x.shape[1]) >= size[:, np.newaxis]] = np.nan
+    noise = ms.peaks._estimate_local_noise_batch(x, robust=robust, size=size)
+    expected = [ms.peaks._estimate_local_noise(row[:n], robust=robust) for row, n in zip(x, size)]
+    assert np.array_equal(noise, expected)
+
+
+def test_select_lowest():
+    x = np.array([[3.0, -1.0, 1.0, 2.0, -2.0, 1.0], [-1.0, 1.0, 1.0, -1.0, 0.0, 5.0]])
+    lowest = ms.peaks._select_lowest(x, np.abs(x), 4)
+    expected = np.take_along_axis(x, np.argsort(np.abs(x), axis=1, kind="stable"), axis=1)[:, :4]
+    assert np.array_equal(np.sort(lowest, axis=1), np.sort(expected, axis=1))
+
+
 # Test baseline estimation
 
 def test_find_local_extrema():
@@ -224,3 +285,54 @@ def test_detect_peaks_two_overlapping_peaks(two_overlapping_peaks, noise):
     assert len(start) == 2
     # check the boundary of the overlapping peaks
     assert end[0] == (start[1] + 1)
+
+
+def create_signal_list(n_signals):
+    rng = np.random.default_rng(SEED)
+    size = np.hstack([rng.integers(3, 60, n_signals), [1, 2, 5, 450, 1200]])
+    signal_list = list()
+    for n in size:
+        x = np.arange(n)
+        y = rng.normal(size=n) + 5
+        for _ in range(rng.integers(0, 4)):
+            height = rng.uniform(10, 200)
+            y += height * np.exp(-0.5 * ((x - rng.uniform(0, n)) / rng.uniform(1, 8)) ** 2)
+        if n % 3 == 0:
+            # equal height peaks
+            y = np.round(y)
+        signal_list.append(y)
+    return signal_list
+
+
+@pytest.mark.parametrize("smoothing_strength", [None, 1.0, 2.5])
+def test_detect_peaks_batch_same_result_as_detect_peaks(smoothing_strength):
+    signal_list = create_signal_list(500)
+    results = ms.peaks.detect_peaks_batch(signal_list, smoothing_strength)
+    for k, x in enumerate(signal_list):
+        noise = ms.peaks.estimate_noise(x)
+        if smoothing_strength is not None:
+            x = gaussian_filter1d(x, smoothing_strength)
+        baseline = ms.peaks.estimate_baseline(x, noise)
+        start, apex, end = ms.peaks.detect_peaks(x, noise, baseline)
+        expected = [start, apex, end, noise, baseline, x]
+        for res, exp in zip(results, expected):
+            assert np.array_equal(res[k], exp)
+
+
+def test_detect_peaks_batch_empty_list():
+    results = ms.peaks.detect_peaks_batch([])
+    assert all(len(x) == 0 for x in results)
+
+
+@pytest.mark.parametrize("min_distance", [0.003, 0.02])
+def test_find_centroids_batch_same_result_as_find_centroids(min_distance):
+    signal_list = [x for x in create_signal_list(200) if x.size >= 20]
+    mz_list = [100 + 0.005 * np.arange(x.size) for x in signal_list]
+    min_snr = 10
+    centroid_list, area_list = ms.peaks.find_centroids_batch(
+        mz_list, signal_list, min_snr, min_distance)
+    for mz, x, centroid, area in zip(mz_list, signal_list, centroid_list, area_list):
+        expected_centroid, expected_area = ms.peaks.find_centroids(
+            mz, x, min_snr, min_distance)
+        assert np.array_equal(centroid, expected_centroid)
+        assert np.array_equal(area, expected_area)
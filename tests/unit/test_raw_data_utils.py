@@ -3,6 +3,7 @@ from tidyms.lcms import Chromatogram
 from tidyms.raw_data_utils import _match_mz
 import pytest
 import numpy as np
+import os
 import tidyms as ms
 
 
@@ -155,6 +156,181 @@ def test_make_chromatograms_accumulator_mean(sim_ms_data):
     assert True
 
 
+def test_make_chromatograms_overlapping_windows():
+    rng = np.random.default_rng(1234)
+    spectra = list()
+    for k in range(20):
+        size = 0 if k == 5 else rng.integers(1, 100)
+        mz = np.sort(rng.uniform(100, 101, size))
+        spint = rng.uniform(0, 100, size)
+        spectra.append(ms.MSSpectrum(mz, spint, time=float(k)))
+    ms_data = ms.fileio.MSData_in_memory()
+    ms_data._set_spectra(spectra)
+    # unsorted m/z with overlapping windows
+    mz = np.array([100.5, 100.2, 100.25, 100.5, 100.8, 99.0])
+    window = 0.1
+    chromatograms = ms.make_chromatograms(ms_data, mz, window=window, fill_missing=False)
+    for mz_k, chromatogram in zip(mz, chromatograms):
+        for sp, spint in zip(spectra, chromatogram.spint):
+            if sp.mz.size:
+                mask = (sp.mz >= mz_k - window) & (sp.mz < mz_k + window)
+                assert np.isclose(spint, sp.spint[mask].sum())
+            else:
+                assert np.isnan(spint)
+
+
+@pytest.mark.parametrize("accumulator", ["sum", "mean"])
+def test_make_chromatograms_parallel_same_result_as_serial(sim_ms_data, monkeypatch, accumulator):
+    monkeypatch.setattr(ms.raw_data_utils, "_EIC_BLOCK_SIZE", 7)
+    expected = ms.make_chromatograms(sim_ms_data, mz_list, accumulator=accumulator)
+    chromatograms = ms.make_chromatograms(sim_ms_data, mz_list, accumulator=accumulator, n_jobs=2)
+    assert len(chromatograms) == len(expected)
+    for chromatogram, expected_chromatogram in zip(chromatograms, expected):
+        assert np.array_equal(chromatogram.time, expected_chromatogram.time)
+        assert np.array_equal(chromatogram.spint, expected_chromatogram.spint)
+
+
+def test_make_chromatograms_iterator_same_result_as_make_chromatograms(sim_ms_data):
+    expected = ms.make_chromatograms(sim_ms_data, mz_list, start_time=10.0)
+    chromatograms = list(ms.make_chromatograms_iterator(sim_ms_data, mz_list, start_time=10.0))
+    assert len(chromatograms) == len(expected)
+    for chromatogram, expected_chromatogram in zip(chromatograms, expected):
+        assert np.array_equal(chromatogram.time, expected_chromatogram.time)
+        # values are stored using single precision
+        assert np.array_equal(chromatogram.spint, expected_chromatogram.spint.astype(np.float32))
+
+
+def test_make_roi_prefetch():
+    cache_path = ms.utils.get_tidyms_path()
+    filename = "centroid-data-zlib-indexed-compressed.mzML"
+    data_path = os.path.join(cache_path, "test-raw-data", filename)
+    ms_data = ms.MSData.create_MSData_instance(data_path)
+    expected = ms.make_roi(ms_data)
+    roi_list = ms.make_roi(ms_data, prefetch=2)
+    assert len(roi_list) == len(expected)
+    for roi, expected_roi in zip(roi_list, expected):
+        assert np.array_equal(roi.scan, expected_roi.scan)
+        assert np.array_equal(roi.spint, expected_roi.spint, equal_nan=True)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"tolerance": 0.005, "max_missing": 0, "min_length": 1},
+        {"tolerance": 0.005, "max_missing": 1, "min_length": 5, "min_intensity": 1},
+        {"tolerance": 0.5, "max_missing": 2, "min_length": 1, "multiple_match": "closest"},
+        {"tolerance": 0.5, "max_missing": 2, "min_length": 1, "multiple_match": "reduce"},
+        {"tolerance": 0.005, "max_missing": 1, "min_length": 1, "targeted_mz": mz_list[:3]},
+    ],
+)
+def test_make_roi_array_buffer_same_result_as_roi_list(sim_ms_data, monkeypatch, kwargs):
+    # the array backed ROI buffer must produce the same ROI as _TempRoiList
+    roi_list = ms.make_roi(sim_ms_data, **kwargs)
+    monkeypatch.setattr(ms.raw_data_utils, "_TempRoiBuffer", ms.raw_data_utils._TempRoiList)
+    expected = ms.make_roi(sim_ms_data, **kwargs)
+    assert len(roi_list) > 0
+    assert len(roi_list) == len(expected)
+    for roi, expected_roi in zip(roi_list, expected):
+        assert np.array_equal(roi.scan, expected_roi.scan)
+        assert np.array_equal(roi.time, expected_roi.time)
+        assert np.array_equal(roi.mz, expected_roi.mz, equal_nan=True)
+        assert np.array_equal(roi.spint, expected_roi.spint, equal_nan=True)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"tolerance": 0.005, "max_missing": 0, "min_length": 1},
+        {"tolerance": 0.005, "max_missing": 1, "min_length": 5, "min_intensity": 1},
+        {"tolerance": 0.5, "max_missing": 2, "min_length": 1, "multiple_match": "closest"},
+        {"tolerance": 0.5, "max_missing": 2, "min_length": 1, "multiple_match": "reduce"},
+        {"tolerance": 0.005, "max_missing": 1, "min_length": 1, "targeted_mz": mz_list[:3]},
+    ],
+)
+def test_make_roi_parallel_same_result_as_serial(sim_ms_data, kwargs):
+    expected = ms.make_roi(sim_ms_data, **kwargs)
+    roi_list = ms.make_roi(sim_ms_data, n_jobs=2, **kwargs)
+    assert len(roi_list) > 0
+    assert len(roi_list) == len(expected)
+    for k, (roi, expected_roi) in enumerate(zip(roi_list, expected)):
+        assert roi.index == k
+        assert np.array_equal(roi.scan, expected_roi.scan)
+        assert np.array_equal(roi.time, expected_roi.time)
+        assert np.array_equal(roi.mz, expected_roi.mz, equal_nan=True)
+        assert np.array_equal(roi.spint, expected_roi.spint, equal_nan=True)
+
+
+def _make_roi_batch(
+    ms_data, tolerance, max_missing, min_length, min_intensity=0.0, targeted_mz=None, pad=2
+):
+    # reference ROI built by feeding all scans and converting all ROI at the end
+    if targeted_mz is None:
+        mz_filter = ms.raw_data_utils._make_mz_filter(ms_data, min_intensity, 1, 0.0, None)
+        targeted = False
+    else:
+        mz_filter = np.sort(targeted_mz)
+        targeted = True
+    processor = ms.raw_data_utils._RoiMaker(
+        mz_filter,
+        max_missing=max_missing,
+        min_length=min_length,
+        min_intensity=min_intensity,
+        tolerance=tolerance,
+        multiple_match="reduce",
+        mz_reduce=np.mean,
+        sp_reduce=np.sum,
+        targeted=targeted,
+    )
+    rt = np.zeros(ms_data.get_n_spectra())
+    scans = list()
+    for scan, spectrum in ms_data.get_spectra_iterator():
+        rt[scan] = spectrum.time
+        scans.append(scan)
+        mz, sp = spectrum.find_centroids(10, None)
+        processor.feed_spectrum(mz, sp, scan)
+        processor.clear_completed_roi()
+    processor.flag_as_completed()
+    processor.clear_completed_roi()
+    return processor.tmp_roi_to_roi(np.array(scans), rt, pad, ms_data.separation)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"tolerance": 0.005, "max_missing": 0, "min_length": 1},
+        {"tolerance": 0.005, "max_missing": 0, "min_length": 1, "pad": 5},
+        {"tolerance": 0.005, "max_missing": 1, "min_length": 5, "min_intensity": 1},
+        {"tolerance": 0.005, "max_missing": 1, "min_length": 1, "targeted_mz": mz_list[:3]},
+    ],
+)
+def test_make_roi_iterator_same_result_as_batch_roi(sim_ms_data, kwargs):
+    expected = _make_roi_batch(sim_ms_data, **kwargs)
+    roi_list = list(ms.make_roi_iterator(sim_ms_data, **kwargs))
+    assert len(roi_list) > 0
+    assert len(roi_list) == len(expected)
+    for k, (roi, expected_roi) in enumerate(zip(roi_list, expected)):
+        assert roi.index == k
+        assert np.array_equal(roi.scan, expected_roi.scan)
+        assert np.array_equal(roi.time, expected_roi.time)
+        assert np.array_equal(roi.mz, expected_roi.mz, equal_nan=True)
+        assert np.array_equal(roi.spint, expected_roi.spint, equal_nan=True)
+
+
+def test_find_mz_band_cuts():
+    mz = np.array([100.0, 100.001, 100.002, 200.0, 300.0, 300.001, 300.002, 300.003])
+    tolerance = 0.005
+    cuts = ms.raw_data_utils._find_mz_band_cuts(mz, None, tolerance, 2)
+    assert np.allclose(cuts, [250.0])
+    cuts = ms.raw_data_utils._find_mz_band_cuts(mz, None, tolerance, 3)
+    assert np.allclose(cuts, [150.001, 250.0])
+
+
+def test_find_mz_band_cuts_no_gaps():
+    mz = np.array([100.0, 100.001, 100.002])
+    cuts = ms.raw_data_utils._find_mz_band_cuts(mz, None, 0.005, 4)
+    assert cuts.size == 0
+
+
 def test_make_tic(sim_ms_data):
     ms.make_tic(sim_ms_data, kind="tic")
     assert True
@@ -165,6 +341,82 @@ def test_make_tic_bpi(sim_ms_data):
     assert True
 
 
+@pytest.mark.parametrize("kind", ["tic", "bpi"])
+def test_make_tic_scan_table(centroid_mzml, kind):
+    # the chromatogram built from the scan table is equal to the chromatogram
+    # built from the decoded spectra.
+    start_time, end_time = 10.0, 40.0
+    chromatogram = ms.make_tic(
+        centroid_mzml, kind=kind, start_time=start_time, end_time=end_time
+    )
+    reduce = np.sum if kind == "tic" else np.max
+    rt = list()
+    expected = list()
+    iterator = centroid_mzml.get_spectra_iterator(
+        start_time=start_time, end_time=end_time
+    )
+    for _, sp in iterator:
+        rt.append(sp.time)
+        expected.append(reduce(sp.spint) if sp.spint.size else 0.0)
+    assert np.array_equal(chromatogram.time, rt)
+    assert np.array_equal(chromatogram.spint, expected)
+
+
+@pytest.fixture
+def profile_ms_data():
+    rng = np.random.default_rng(1234)
+    spectra = list()
+    for k in range(25):
+        size = rng.integers(100, 2000)
+        mz = 100 + 0.005 * np.arange(size)
+        spint = rng.normal(size=size) + 5
+        for _ in range(rng.integers(1, 10)):
+            loc = rng.uniform(100, mz[-1])
+            spint += rng.uniform(50, 500) * np.exp(-0.5 * ((mz - loc) / 0.01) ** 2)
+        instrument = "orbitrap" if k % 4 == 0 else "qtof"
+        sp = ms.MSSpectrum(
+            mz, spint, time=float(k), ms_level=1 + (k % 5 == 0), polarity=1,
+            instrument=instrument, is_centroid=False
+        )
+        spectra.append(sp)
+    # centroid and empty spectra are not modified
+    spectra[3].is_centroid = True
+    spectra[7] = ms.MSSpectrum(np.array([]), np.array([]), time=7.0, is_centroid=False)
+    ms_data = ms.fileio.MSData_in_memory(ms_mode="profile")
+    ms_data._set_spectra(spectra)
+    return ms_data
+
+
+@pytest.mark.parametrize("n_jobs,chunk_size", [(None, 200), (2, 4)])
+def test_centroid_ms_data(profile_ms_data, n_jobs, chunk_size):
+    res = ms.centroid_ms_data(profile_ms_data, chunk_size=chunk_size, n_jobs=n_jobs)
+    assert res.ms_mode == "centroid"
+    assert res.get_n_spectra() == profile_ms_data.get_n_spectra()
+    for k in range(res.get_n_spectra()):
+        sp = res.get_spectrum(k)
+        expected = profile_ms_data.get_spectrum(k)
+        if expected.spint.size:
+            expected_mz, expected_spint = expected.find_centroids()
+        else:
+            expected_mz, expected_spint = expected.mz, expected.spint
+        assert sp.is_centroid
+        assert np.array_equal(sp.mz, expected_mz)
+        assert np.array_equal(sp.spint, expected_spint)
+        assert sp.time == expected.time
+        assert sp.ms_level == expected.ms_level
+        assert sp.instrument == expected.instrument
+
+
+def test_centroid_ms_data_min_distance(profile_ms_data):
+    min_distance = 0.05
+    res = ms.centroid_ms_data(profile_ms_data, min_snr=20, min_distance=min_distance)
+    for k in [0, 1, 10]:
+        sp = res.get_spectrum(k)
+        expected_mz, expected_spint = profile_ms_data.get_spectrum(k).find_centroids(20, min_distance)
+        assert np.array_equal(sp.mz, expected_mz)
+        assert np.array_equal(sp.spint, expected_spint)
+
+
 # Test _RoiMaker
 
 
@@ -529,6 +781,26 @@ def test_filter_invalid_mz_empty_array():
     assert spint_filtered.size == 0
 
 
+def test_TempRoiBuffer_same_values_as_TempRoiList():
+    buffer = ms.raw_data_utils._TempRoiBuffer(capacity=2)
+    roi_list = ms.raw_data_utils._TempRoiList()
+    mz1 = np.array([0, 1, 2, 3, 4], dtype=float)
+    mz2 = np.array([0.5, 2.5])
+    for r in [buffer, roi_list]:
+        r.insert(mz1, mz1, 1)
+        r.extend(mz1[[1, 3]], mz1[[1, 3]], 2, np.array([1, 3]))
+        r.insert(mz2, mz2, 2)
+        r.clear(np.array([0, 4]))
+        r.extend(mz1[[0, 3]], mz1[[0, 3]], 3, np.array([0, 5]))
+    for attr in ["mz_mean", "mz_sum", "max_int", "missing_count", "length"]:
+        assert np.array_equal(getattr(buffer, attr), getattr(roi_list, attr))
+    index = np.arange(buffer.mz_mean.size)
+    for r, expected in zip(buffer.get_roi(index), roi_list.get_roi(index)):
+        assert list(r.mz) == list(expected.mz)
+        assert list(r.spint) == list(expected.spint)
+        assert list(r.scan) == list(expected.scan)
+
+
 def test_RoiProcessor_creation():
     mz_seed = np.arange(10)
     max_missing = 1
@@ -593,6 +865,20 @@ def test_RoiProcessor_feed_spectrum_empty_processor_no_mz_filter(roi_processor):
     assert (roi_processor.tmp_roi_list.missing_count == 0).all()
 
 
+def test_RoiProcessor_feed_spectrum_unsorted_mz(roi_processor):
+    mz1 = np.array([100.0, 200.0])
+    sp1 = np.array([1.0, 1.0])
+    roi_processor.feed_spectrum(mz1, sp1, 1)
+
+    # multiple matches with 100.0 are not contiguous in the unsorted spectrum
+    mz2 = np.array([100.001, 200.0, 100.002])
+    sp2 = np.array([1.0, 10.0, 2.0])
+    roi_processor.feed_spectrum(mz2, sp2, 2)
+
+    assert np.allclose(roi_processor.tmp_roi_list.max_int, [3.0, 10.0])
+    assert np.array_equal(roi_processor.tmp_roi_list.length, [2, 2])
+
+
 def test_RoiProcessor_feed_spectrum_empty_processor_mz_filter(roi_processor):
 
     mz_filter = np.array([0, 1, 2, 3])
@@ -908,6 +1194,44 @@ def test_match_mz_multiple_matches_mode_reduce():
     assert np.array_equal(sp2[mz2_no_match_index], sp2_no_match)
 
 
+@pytest.mark.parametrize("reduce", ["mean", "sum"])
+def test_match_mz_mode_reduce_vectorized_same_as_custom_function(reduce):
+    # built-in reduce functions are applied to all groups at once
+    rng = np.random.default_rng(1234)
+    mz1 = np.sort(rng.uniform(100, 200, 100))
+    mz2 = np.sort(rng.uniform(100, 200, 1000))
+    sp2 = rng.uniform(0, 100, mz2.size)
+    func = np.mean if reduce == "mean" else np.sum
+    res = _match_mz(mz1, mz2, sp2, 0.1, "reduce", func, reduce)
+    expected = _match_mz(mz1, mz2, sp2, 0.1, "reduce", lambda x: func(x), lambda x: func(x))
+    for x, y in zip(res, expected):
+        assert np.allclose(x, y, rtol=1e-12)
+
+
+def test_match_mz_mode_closest_random_data():
+    rng = np.random.default_rng(1234)
+    mz1 = np.sort(rng.uniform(100, 200, 100))
+    # rounded values create ties
+    mz2 = np.sort(np.round(rng.uniform(100, 200, 1000), 1))
+    sp2 = np.arange(mz2.size, dtype=float)
+    tolerance = 0.1
+    match_index, mz_match, sp_match, mz_no_match, sp_no_match = _match_mz(
+        mz1, mz2, sp2, tolerance, "closest", np.mean, np.sum
+    )
+    # the closest value of mz2 to each value of mz1, using argmin
+    closest_mz1 = np.argmin(np.abs(mz2[:, np.newaxis] - mz1), axis=1)
+    dmz = np.abs(mz2 - mz1[closest_mz1])
+    expected_index = np.unique(closest_mz1[dmz <= tolerance])
+    assert np.array_equal(match_index, expected_index)
+    for k, m, s in zip(match_index, mz_match, sp_match):
+        candidates = np.where((closest_mz1 == k) & (dmz <= tolerance))[0]
+        closest = candidates[np.argmin(dmz[candidates])]
+        assert m == mz2[closest]
+        assert s == sp2[closest]
+    assert mz_match.size + mz_no_match.size == mz2.size
+    assert np.isin(sp_match, sp_no_match).sum() == 0
+
+
 def test_match_mz_invalid_mode():
     tolerance = 2
     mz1 = np.array([50, 75, 100, 125, 150])
@@ -0,0 +1,193 @@
+from tidyms import _roi_store
+from tidyms.lcms import LCTrace, Peak
+import numpy as np
+import pytest
+
+
+def create_roi_list(n_roi, seed=1234):
+    rng = np.random.default_rng(seed)
+    roi_list = list()
+    for k in range(n_roi):
+        size = rng.integers(10, 50)
+        time = np.sort(rng.uniform(0, 100, size))
+        spint = rng.uniform(0, 1000, size)
+        mz = rng.uniform(100, 1000, size)
+        scan = np.arange(size) + k
+        roi = LCTrace(time, spint, mz, scan, index=k, mode="uplc")
+        if k % 2:
+            roi.noise = rng.uniform(0, 10, size)
+            roi.features = [Peak(0, 2, 5, roi, 0), Peak(5, 7, 9, roi, 1)]
+        roi_list.append(roi)
+    return roi_list
+
+
+def assert_roi_equal(roi, expected):
+    assert roi.index == expected.index
+    assert roi.mode == expected.mode
+    for attr in ["time", "spint", "mz", "scan", "noise", "baseline"]:
+        x = getattr(roi, attr)
+        y = getattr(expected, attr)
+        if y is None:
+            assert x is None
+        else:
+            assert np.array_equal(x, y)
+            assert x.dtype == y.dtype
+    if expected.features is None:
+        assert roi.features is None
+    else:
+        assert len(roi.features) == len(expected.features)
+        for ft, expected_ft in zip(roi.features, expected.features):
+            assert ft.roi is roi
+            assert ft.to_str() == expected_ft.to_str()
+
+
+@pytest.mark.parametrize("block_size", [100, 2 ** 20])
+def test_write_roi_store_load_roi_list(tmpdir, monkeypatch, block_size):
+    monkeypatch.setattr(_roi_store, "_BLOCK_SIZE", block_size)
+    path = tmpdir.join("roi")
+    roi_list = create_roi_list(20)
+    _roi_store.write_roi_store(path, iter(roi_list))
+    reader = _roi_store.RoiStoreReader(path)
+    assert len(reader) == len(roi_list)
+    for roi, expected in zip(reader.load_roi_list(LCTrace), roi_list):
+        assert_roi_equal(roi, expected)
+
+
+def test_write_roi_store_load_roi(tmpdir, monkeypatch):
+    monkeypatch.setattr(_roi_store, "_BLOCK_SIZE", 100)
+    path = tmpdir.join("roi")
+    roi_list = create_roi_list(20)
+    _roi_store.write_roi_store(path, roi_list)
+    reader = _roi_store.RoiStoreReader(path)
+    for k in [15, 0, 7, 19]:
+        assert_roi_equal(reader.load_roi(k, LCTrace), roi_list[k])
+
+
+def test_write_roi_store_empty(tmpdir):
+    path = tmpdir.join("roi")
+    _roi_store.write_roi_store(path, [])
+    reader = _roi_store.RoiStoreReader(path)
+    assert reader.load_roi_list(LCTrace) == []
+
+
+def test_load_roi_invalid_index(tmpdir):
+    path = tmpdir.join("roi")
+    _roi_store.write_roi_store(path, create_roi_list(5))
+    reader = _roi_store.RoiStoreReader(path)
+    with pytest.raises(IndexError):
+        reader.load_roi(5, LCTrace)
+
+
+def test_loaded_roi_arrays_are_writeable(tmpdir):
+    path = tmpdir.join("roi")
+    _roi_store.write_roi_store(path, create_roi_list(5))
+    roi = _roi_store.RoiStoreReader(path).load_roi(1, LCTrace)
+    roi.spint[0] = 0.0
+    assert roi.spint[0] == 0.0
+
+
+def test_write_roi_sidecar(tmpdir, monkeypatch):
+    monkeypatch.setattr(_roi_store, "_BLOCK_SIZE", 100)
+    path = tmpdir.join("roi")
+    sidecar_path = tmpdir.join("roi.sidecar")
+    roi_list = create_roi_list(20)
+    _roi_store.write_roi_store(path, roi_list)
+    size = path.size()
+
+    for roi in roi_list:
+        roi.baseline = np.zeros_like(roi.spint)
+        roi.noise = None
+        roi.features = [Peak(1, 2, 3, roi, 0)]
+    _roi_store.write_roi_sidecar(sidecar_path, roi_list, ["noise", "baseline", "features"])
+    # the ROI file is not modified
+    assert path.size() == size
+
+    reader = _roi_store.RoiStoreReader(path, [sidecar_path])
+    for roi, expected in zip(reader.load_roi_list(LCTrace), roi_list):
+        assert_roi_equal(roi, expected)
+    for k in [3, 12]:
+        assert_roi_equal(reader.load_roi(k, LCTrace), roi_list[k])
+
+
+def test_write_roi_sidecar_last_sidecar_takes_precedence(tmpdir):
+    path = tmpdir.join("roi")
+    sidecar_path1 = tmpdir.join("roi.sidecar1")
+    sidecar_path2 = tmpdir.join("roi.sidecar2")
+    roi_list = create_roi_list(5)
+    _roi_store.write_roi_store(path, roi_list)
+    for roi in roi_list:
+        roi.features = [Peak(1, 2, 3, roi, 0), Peak(3, 4, 5, roi, 1)]
+    _roi_store.write_roi_sidecar(sidecar_path1, roi_list, ["features"])
+    for roi in roi_list:
+        roi.features = roi.features[1:]
+    _roi_store.write_roi_sidecar(sidecar_path2, roi_list, ["features"])
+
+    reader = _roi_store.RoiStoreReader(path, [sidecar_path1, sidecar_path2])
+    for roi, expected in zip(reader.load_roi_list(LCTrace), roi_list):
+        assert_roi_equal(roi, expected)
+
+
+@pytest.mark.parametrize("block_size", [100, 2 ** 20])
+def test_write_roi_sidecar_patch(tmpdir, monkeypatch, block_size):
+    monkeypatch.setattr(_roi_store, "_BLOCK_SIZE", block_size)
+    path = tmpdir.join("roi")
+    sidecar_path = tmpdir.join("roi.sidecar")
+    roi_list = create_roi_list(20)
+    for roi in roi_list:
+        roi.spint[::3] = np.nan
+    _roi_store.write_roi_store(path, roi_list)
+
+    reference = {"spint": [roi.spint.copy() for roi in roi_list]}
+    for roi in roi_list:
+        roi.spint[np.isnan(roi.spint)] = 1.0
+    _roi_store.write_roi_sidecar(sidecar_path, roi_list, [], reference)
+    # only modified points are stored
+    assert sidecar_path.size() < path.size() / 4
+
+    reader = _roi_store.RoiStoreReader(path, [sidecar_path])
+    for roi, expected in zip(reader.load_roi_list(LCTrace), roi_list):
+        assert_roi_equal(roi, expected)
+    for k in [0, 19, 7]:
+        assert_roi_equal(reader.load_roi(k, LCTrace), roi_list[k])
+
+
+def test_write_roi_sidecar_patch_invalid_size(tmpdir):
+    sidecar_path = tmpdir.join("roi.sidecar")
+    roi_list = create_roi_list(5)
+    reference = {"spint": [roi.spint[1:] for roi in roi_list]}
+    with pytest.raises(ValueError):
+        _roi_store.write_roi_sidecar(sidecar_path, roi_list, [], reference)
+
+
+def test_write_roi_sidecar_invalid_column(tmpdir):
+    sidecar_path = tmpdir.join("roi.sidecar")
+    roi_list = create_roi_list(5)
+    with pytest.raises(ValueError):
+        _roi_store.write_roi_sidecar(sidecar_path, roi_list, ["index"])
+
+
+@pytest.mark.parametrize("index", [None, "a"])
+def test_write_roi_store_non_numeric_feature_field(tmpdir, index):
+    path = tmpdir.join("roi")
+    roi_list = create_roi_list(5)
+    roi_list[1].features[0].index = index
+    with pytest.raises(ValueError):
+        _roi_store.write_roi_store(path, roi_list)
+
+
+def test_roi_store_reader_sidecar_invalid_number_of_roi(tmpdir):
+    path = tmpdir.join("roi")
+    sidecar_path = tmpdir.join("roi.sidecar")
+    roi_list = create_roi_list(5)
+    _roi_store.write_roi_store(path, roi_list)
+    _roi_store.write_roi_sidecar(sidecar_path, roi_list[:3], ["features"])
+    with pytest.raises(ValueError):
+        _roi_store.RoiStoreReader(path, [sidecar_path])
+
+
+def test_read_footer_invalid_file(tmpdir):
+    path = tmpdir.join("roi")
+    path.write("index_offset=00000000000000000001\n")
+    assert not _roi_store.is_roi_store(path)
+    with pytest.raises(ValueError):
+        _roi_store.RoiStoreReader(path)